@@ -0,0 +1,210 @@
+"""Load-tests the users API and compares runs between commits.
+
+    python -m benchmarks api --concurrency 16 --requests 400 --output head.json
+    python -m benchmarks api --url http://localhost:5004 --concurrency 1000
+    python -m benchmarks compare base.json head.json --threshold 0.1
+    python -m benchmarks overhead --iterations 100000
+    python -m benchmarks kdf --bcrypt-rounds 10,12,13 --argon2 3:65536:1
+    python -m benchmarks serialization --rows 10000
+    python -m benchmarks queries --rows 10000
+    python -m benchmarks startup --runs 5 --top 15
+
+Without --url the app runs in-process against --database-url (a throwaway
+SQLite file by default); against a server, query counts come from its
+Server-Timing header.
+"""
+import argparse
+import json
+import sys
+import tempfile
+
+from benchmarks import api, kdf, overhead, queries, serialization, startup
+from benchmarks.clients import AppClient, HTTPClient
+from benchmarks.report import compare, metadata
+
+
+def run_api(args):
+    if args.url:
+        target = args.url
+
+        def client_factory():
+            return HTTPClient(args.url)
+
+    else:
+        database_url = args.database_url or (
+            f"sqlite:///{tempfile.mkdtemp()}/benchmark.db"
+        )
+        target = database_url
+        app = api.create_app(database_url, args.config)
+        if args.bcrypt_rounds:
+            app.config["BCRYPT_LOG_ROUNDS"] = args.bcrypt_rounds
+
+        def client_factory():
+            return AppClient(app)
+
+    endpoints = args.endpoints.split(",") if args.endpoints else api.ENDPOINTS
+    return {
+        "meta": metadata(
+            target=target,
+            concurrency=args.concurrency,
+            requests=args.requests,
+        ),
+        "endpoints": api.run(
+            client_factory, args.concurrency, args.requests, endpoints
+        ),
+    }
+
+
+def run_overhead(args):
+    database_url = f"sqlite:///{tempfile.mkdtemp()}/benchmark.db"
+    app = api.create_app(database_url, args.config)
+    return {
+        "meta": metadata(iterations=args.iterations),
+        "overhead": overhead.run(app, args.iterations),
+    }
+
+
+def run_kdf(args):
+    database_url = f"sqlite:///{tempfile.mkdtemp()}/benchmark.db"
+    app = api.create_app(database_url, args.config)
+    settings = kdf.parse_settings(args.bcrypt_rounds, args.argon2)
+    return {
+        "meta": metadata(requests=args.requests),
+        "endpoints": kdf.run(AppClient(app), app, settings, args.requests),
+    }
+
+
+def run_serialization(args):
+    database_url = f"sqlite:///{tempfile.mkdtemp()}/benchmark.db"
+    app = api.create_app(database_url, args.config)
+    return {
+        "meta": metadata(rows=args.rows, iterations=args.iterations),
+        "serialization": serialization.run(app, args.rows, args.iterations),
+    }
+
+
+def run_queries(args):
+    database_url = f"sqlite:///{tempfile.mkdtemp()}/benchmark.db"
+    app = api.create_app(database_url, args.config)
+    return {
+        "meta": metadata(rows=args.rows, iterations=args.iterations),
+        "queries": queries.run(app, args.rows, args.iterations),
+    }
+
+
+def run_startup(args):
+    database_url = f"sqlite:///{tempfile.mkdtemp()}/benchmark.db"
+    return {
+        "meta": metadata(runs=args.runs),
+        "startup": startup.run(database_url, args.config, args.runs, args.top),
+    }
+
+
+def write(report, output):
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if output:
+        with open(output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    api_parser = commands.add_parser("api", help="load-test the API endpoints")
+    api_parser.add_argument("--url", help="benchmark a running server instead")
+    api_parser.add_argument("--database-url")
+    api_parser.add_argument("--config", default="src.config.DevelopmentConfig")
+    api_parser.add_argument("--bcrypt-rounds", type=int)
+    api_parser.add_argument("--concurrency", type=int, default=8)
+    api_parser.add_argument("--requests", type=int, default=200)
+    api_parser.add_argument("--endpoints", help="comma-separated subset")
+    api_parser.add_argument("--output")
+
+    overhead_parser = commands.add_parser(
+        "overhead", help="per-request cost of the metrics and query hooks"
+    )
+    overhead_parser.add_argument("--config", default="src.config.DevelopmentConfig")
+    overhead_parser.add_argument("--iterations", type=int, default=100000)
+    overhead_parser.add_argument("--output")
+
+    kdf_parser = commands.add_parser(
+        "kdf", help="login latency for each password hashing cost setting"
+    )
+    kdf_parser.add_argument("--config", default="src.config.DevelopmentConfig")
+    kdf_parser.add_argument("--bcrypt-rounds", default="10,11,12,13")
+    kdf_parser.add_argument("--argon2", default="2:19456:1,3:65536:1")
+    kdf_parser.add_argument("--requests", type=int, default=20)
+    kdf_parser.add_argument("--output")
+
+    serialization_parser = commands.add_parser(
+        "serialization", help="marshal() vs precompiled serializers on a list"
+    )
+    serialization_parser.add_argument(
+        "--config", default="src.config.DevelopmentConfig"
+    )
+    serialization_parser.add_argument("--rows", type=int, default=10000)
+    serialization_parser.add_argument("--iterations", type=int, default=5)
+    serialization_parser.add_argument("--output")
+
+    queries_parser = commands.add_parser(
+        "queries", help="ORM entities vs column-projected rows on a list"
+    )
+    queries_parser.add_argument("--config", default="src.config.DevelopmentConfig")
+    queries_parser.add_argument("--rows", type=int, default=10000)
+    queries_parser.add_argument("--iterations", type=int, default=5)
+    queries_parser.add_argument("--output")
+
+    startup_parser = commands.add_parser(
+        "startup", help="import and create_app() time of a fresh worker"
+    )
+    startup_parser.add_argument("--config", default="src.config.ProductionConfig")
+    startup_parser.add_argument("--runs", type=int, default=5)
+    startup_parser.add_argument("--top", type=int, default=15)
+    startup_parser.add_argument("--output")
+
+    compare_parser = commands.add_parser("compare", help="diff two result files")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--threshold", type=float, default=0.1)
+
+    args = parser.parse_args(argv)
+
+    if args.command == "api":
+        write(run_api(args), args.output)
+        return 0
+
+    if args.command == "overhead":
+        write(run_overhead(args), args.output)
+        return 0
+
+    if args.command == "kdf":
+        write(run_kdf(args), args.output)
+        return 0
+
+    if args.command == "serialization":
+        write(run_serialization(args), args.output)
+        return 0
+
+    if args.command == "queries":
+        write(run_queries(args), args.output)
+        return 0
+
+    if args.command == "startup":
+        write(run_startup(args), args.output)
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+    regressions = compare(baseline, current, args.threshold)
+    for name, metric, before, after in regressions:
+        print(f"{name}: {metric} regressed from {before:.2f} to {after:.2f}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
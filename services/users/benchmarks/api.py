@@ -0,0 +1,165 @@
+import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.report import summarize
+
+ENDPOINTS = (
+    "register",
+    "login",
+    "refresh",
+    "status",
+    "users_list",
+    "users_create",
+    "users_get",
+    "users_batch",
+    "users_update",
+    "users_delete",
+)
+
+# endpoints acting on the users created by users_create
+RESOLVED_ENDPOINTS = ("users_get", "users_batch", "users_update", "users_delete")
+
+PASSWORD = "benchpassword"
+
+
+class Worker:
+    """One simulated client; every request it makes is timed separately."""
+
+    def __init__(self, client, run_id, number):
+        self.client = client
+        self.prefix = f"bench-{run_id}-{number}"
+        self.email = f"{self.prefix}@bench.local"
+        self.created = []
+
+    def setup(self):
+        body = {"username": self.prefix, "email": self.email, "password": PASSWORD}
+        _until_accepted(lambda: self.client.request("POST", "/auth/register", body))
+        tokens = _until_accepted(lambda: self.login(0)).data
+        self.access_token = tokens["access_token"]
+        self.refresh_token = tokens["refresh_token"]
+
+    def register(self, i):
+        email = f"{self.prefix}-register-{i}@bench.local"
+        body = {"username": self.prefix, "email": email, "password": PASSWORD}
+        return self.client.request("POST", "/auth/register", body)
+
+    def login(self, i):
+        body = {"email": self.email, "password": PASSWORD}
+        return self.client.request("POST", "/auth/login", body)
+
+    def refresh(self, i):
+        body = {"refresh_token": self.refresh_token}
+        result = self.client.request("POST", "/auth/refresh", body)
+        if result.status == 200:
+            self.refresh_token = result.data["refresh_token"]
+        return result
+
+    def status(self, i):
+        headers = {"Authorization": f"Bearer {self.access_token}"}
+        return self.client.request("GET", "/auth/status", headers=headers)
+
+    def users_list(self, i):
+        return self.client.request("GET", "/users?limit=100")
+
+    def users_get(self, i):
+        return self.client.request("GET", f"/users/{self.created[0][0]}")
+
+    def users_batch(self, i):
+        body = {"ids": [user_id for user_id, _ in self.created]}
+        return self.client.request("POST", "/users/batch", body)
+
+    def users_create(self, i):
+        email = f"{self.prefix}-user-{i}@bench.local"
+        body = {"username": self.prefix, "email": email, "password": PASSWORD}
+        return self.client.request("POST", "/users", body)
+
+    def users_update(self, i):
+        user_id, email = self.created[i % len(self.created)]
+        body = {"username": f"{self.prefix}-{i}", "email": f"updated-{i}-{email}"}
+        return self.client.request("PUT", f"/users/{user_id}", body)
+
+    def users_delete(self, i):
+        user_id, _ = self.created[i]
+        return self.client.request("DELETE", f"/users/{user_id}")
+
+    def resolve_created(self, ids_by_email):
+        self.created = [
+            (ids_by_email[email], email)
+            for email in sorted(ids_by_email)
+            if email.startswith(f"{self.prefix}-user-")
+        ]
+
+
+def _until_accepted(request):
+    """Repeats an untimed setup request the server shed with a 503 (e.g. a
+    full password hashing queue) after its Retry-After."""
+    while True:
+        result = request()
+        if result.status != 503:
+            return result
+        time.sleep(float(result.headers.get("Retry-After", 1)))
+
+
+def _ids_by_email(client):
+    ids, path = {}, "/users?limit=1000"
+    while path:
+        result = _until_accepted(lambda: client.request("GET", path))
+        ids.update((user["email"], user["id"]) for user in result.data)
+        cursor = result.headers.get("X-Next-Cursor")
+        path = cursor and f"/users?limit=1000&cursor={cursor}"
+    return ids
+
+
+def _calls(name, count):
+    return lambda worker: [getattr(worker, name)(i) for i in range(count)]
+
+
+def run(client_factory, concurrency, requests, endpoints=ENDPOINTS):
+    """Runs each endpoint in turn with ``concurrency`` workers in parallel.
+
+    Every endpoint gets ``requests`` timed requests split evenly across the
+    workers; setup requests (registering, logging in and creating the users
+    that get/update/delete act on) are not timed.
+    """
+    run_id = uuid.uuid4().hex[:8]
+    per_worker = max(requests // concurrency, 1)
+    workers = [Worker(client_factory(), run_id, n) for n in range(concurrency)]
+    report = {}
+    resolved = False
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(Worker.setup, workers))
+
+        for name in endpoints:
+            if name in RESOLVED_ENDPOINTS and not resolved:
+                if "users_create" not in endpoints:
+                    list(executor.map(_calls("users_create", per_worker), workers))
+                ids_by_email = _ids_by_email(workers[0].client)
+                for worker in workers:
+                    worker.resolve_created(ids_by_email)
+                resolved = True
+
+            start = time.perf_counter()
+            results = executor.map(_calls(name, per_worker), workers)
+            results = [result for batch in results for result in batch]
+            report[name] = summarize(results, time.perf_counter() - start)
+
+    return report
+
+
+def create_app(database_url, config):
+    """Builds the app in-process against ``database_url`` with fresh tables."""
+    os.environ["DATABASE_URL"] = database_url
+    os.environ["APP_SETTINGS"] = config
+    from src import create_app, db
+
+    app = create_app()
+    # every benchmark worker logs in from one address
+    app.config["LOGIN_RATE_LIMIT_PER_IP"] = None
+    app.config["LOGIN_RATE_LIMIT_PER_EMAIL"] = None
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+    return app
@@ -0,0 +1,104 @@
+import http.client
+import json
+import re
+import threading
+import time
+from urllib.parse import urlsplit
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+_queries = threading.local()
+_server_timing_queries = re.compile(r'db;[^,]*desc="(\d+) queries"')
+
+STALE_CONNECTION = (
+    http.client.RemoteDisconnected,
+    BrokenPipeError,
+    ConnectionResetError,
+)
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    _queries.count = getattr(_queries, "count", 0) + 1
+
+
+class Result:
+    __slots__ = ("status", "data", "headers", "seconds", "queries")
+
+    def __init__(self, status, data, headers, seconds, queries):
+        self.status = status
+        self.data = data
+        self.headers = headers
+        self.seconds = seconds
+        self.queries = queries
+
+
+class AppClient:
+    """Drives the app in-process through the WSGI test client.
+
+    Queries are counted per request from SQLAlchemy engine events, which only
+    works when the app runs in this process.
+    """
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, body=None, headers=None):
+        _queries.count = 0
+        start = time.perf_counter()
+        res = self.client.open(path, method=method, json=body, headers=headers)
+        seconds = time.perf_counter() - start
+        data = res.get_json(silent=True)
+        return Result(res.status_code, data, res.headers, seconds, _queries.count)
+
+
+class HTTPClient:
+    """Drives a running server over one keep-alive HTTP connection.
+
+    Query counts are read from the Server-Timing header when the server sends
+    one.
+    """
+
+    def __init__(self, url):
+        parts = urlsplit(url)
+        connection = (
+            http.client.HTTPSConnection
+            if parts.scheme == "https"
+            else http.client.HTTPConnection
+        )
+        self.connection = connection(parts.netloc, timeout=60)
+        self.prefix = parts.path.rstrip("/")
+
+    def request(self, method, path, body=None, headers=None):
+        headers = dict(headers or {})
+        payload = None
+        if body is not None:
+            payload = json.dumps(body)
+            headers["Content-Type"] = "application/json"
+        start = time.perf_counter()
+        for retry in (True, False):
+            try:
+                self.connection.request(method, self.prefix + path, payload, headers)
+                res = self.connection.getresponse()
+                raw = res.read()
+                status, res_headers = res.status, res.headers
+                break
+            except STALE_CONNECTION:
+                # the server closed the idle keep-alive connection before
+                # reading the request; reconnect and send it once more
+                self.connection.close()
+                if not retry:
+                    raw, status, res_headers = b"", 0, {}
+            except (OSError, http.client.HTTPException):
+                self.connection.close()
+                raw, status, res_headers = b"", 0, {}
+                break
+        seconds = time.perf_counter() - start
+        try:
+            data = json.loads(raw) if raw else None
+        except ValueError:
+            data = None
+        match = _server_timing_queries.search(res_headers.get("Server-Timing", ""))
+        queries = int(match.group(1)) if match else None
+        return Result(status, data, res_headers, seconds, queries)
@@ -0,0 +1,53 @@
+import uuid
+
+from benchmarks.report import summarize
+
+PASSWORD = "benchpassword"
+
+
+def parse_settings(bcrypt_rounds, argon2):
+    """Turns "12,13" and "3:65536:1" (time:memory KiB:parallelism) into
+    (label, config) pairs."""
+    settings = []
+    for rounds in filter(None, bcrypt_rounds.split(",")):
+        settings.append(
+            (
+                f"bcrypt-{rounds}",
+                {"PASSWORD_HASH_SCHEME": "bcrypt", "BCRYPT_LOG_ROUNDS": int(rounds)},
+            )
+        )
+    for spec in filter(None, argon2.split(",")):
+        time_cost, memory_cost, parallelism = (int(part) for part in spec.split(":"))
+        settings.append(
+            (
+                f"argon2-t{time_cost}-m{memory_cost}-p{parallelism}",
+                {
+                    "PASSWORD_HASH_SCHEME": "argon2",
+                    "ARGON2_TIME_COST": time_cost,
+                    "ARGON2_MEMORY_COST": memory_cost,
+                    "ARGON2_PARALLELISM": parallelism,
+                },
+            )
+        )
+    return settings
+
+
+def run(client, app, settings, requests):
+    """Times ``requests`` sequential logins for every KDF setting.
+
+    Each setting gets a user registered under it, so its hash is verified at
+    that cost; the login path is otherwise identical.
+    """
+    report = {}
+    for label, config in settings:
+        app.config.update(config)
+        email = f"kdf-{uuid.uuid4().hex[:8]}@bench.local"
+        client.request(
+            "POST",
+            "/auth/register",
+            {"username": label, "email": email, "password": PASSWORD},
+        )
+        body = {"email": email, "password": PASSWORD}
+        results = [client.request("POST", "/auth/login", body) for _ in range(requests)]
+        report[label] = summarize(results, sum(result.seconds for result in results))
+    return report
@@ -0,0 +1,35 @@
+import time
+
+from flask import current_app
+
+
+def _hooks_per_request_us(before, after, teardown, iterations):
+    response = current_app.response_class("pong")
+    start = time.perf_counter()
+    for _ in range(iterations):
+        before()
+        after(response)
+        teardown(None)
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def run(app, iterations):
+    """Measures the per-request cost of the metrics and query hooks."""
+    from src import instrumentation, metrics
+
+    with app.test_request_context("/ping"):
+        return {
+            "iterations": iterations,
+            "metrics_hooks_us": _hooks_per_request_us(
+                metrics._before_request,
+                metrics._after_request,
+                metrics._teardown_request,
+                iterations,
+            ),
+            "instrumentation_hooks_us": _hooks_per_request_us(
+                instrumentation._before_request,
+                instrumentation._after_request,
+                lambda exc: None,
+                iterations,
+            ),
+        }
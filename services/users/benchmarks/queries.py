@@ -0,0 +1,67 @@
+import time
+import tracemalloc
+
+
+def _measure(fn, iterations):
+    """Best wall time in ms and peak traced allocation in KiB of ``fn``."""
+    best = None
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        elapsed = (time.perf_counter() - start) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    tracemalloc.start()
+    try:
+        fn()
+        peak = tracemalloc.get_traced_memory()[1] / 1024
+    finally:
+        tracemalloc.stop()
+    return best, peak
+
+
+def run(app, rows, iterations):
+    """Loads and serializes a ``rows``-user list as ORM entities and as
+    column-projected rows, reporting the best time and peak memory of each.
+
+    The session is cleared after every load, as it is at the end of a request.
+    """
+    from src import db
+    from src.api.users.crud import add_users, get_all_users
+    from src.api.users.models import User
+    from src.api.users.views import serialize_user
+
+    with app.app_context():
+        add_users(
+            [
+                {
+                    "username": f"user{i}",
+                    "email": f"user{i}@bench.local",
+                    "password": "$2b$12$" + "x" * 53,
+                }
+                for i in range(rows)
+            ]
+        )
+
+        def entities():
+            users = [serialize_user(found) for found in User.query.all()]
+            db.session.remove()
+            return users
+
+        def projected():
+            users = [serialize_user(found) for found in get_all_users()]
+            db.session.remove()
+            return users
+
+        assert entities() == projected()
+        entities_ms, entities_kib = _measure(entities, iterations)
+        rows_ms, rows_kib = _measure(projected, iterations)
+
+    return {
+        "rows": rows,
+        "entities_ms": entities_ms,
+        "rows_ms": rows_ms,
+        "entities_peak_kib": entities_kib,
+        "rows_peak_kib": rows_kib,
+        "speedup": entities_ms / rows_ms,
+        "memory_ratio": entities_kib / rows_kib,
+    }
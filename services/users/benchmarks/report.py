@@ -0,0 +1,74 @@
+import math
+import platform
+import subprocess
+import time
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not values:
+        return None
+    rank = max(math.ceil(pct / 100 * len(values)), 1)
+    return values[rank - 1]
+
+
+def summarize(results, wall_seconds):
+    latencies = sorted(result.seconds * 1000 for result in results)
+    queries = [result.queries for result in results if result.queries is not None]
+    errors = sum(1 for result in results if not 200 <= result.status < 400)
+    return {
+        "requests": len(results),
+        "errors": errors,
+        "throughput_rps": len(results) / wall_seconds if wall_seconds else None,
+        "latency_ms": {
+            "p50": percentile(latencies, 50),
+            "p95": percentile(latencies, 95),
+            "p99": percentile(latencies, 99),
+            "max": latencies[-1] if latencies else None,
+        },
+        "queries_per_request": sum(queries) / len(queries) if queries else None,
+    }
+
+
+def metadata(**options):
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": platform.python_version(),
+        **options,
+    }
+
+
+def compare(baseline, current, threshold):
+    """Returns (endpoint, metric, baseline, current) for every regression.
+
+    A regression is a p95 latency more than ``threshold`` slower, a throughput
+    more than ``threshold`` lower, more queries per request than before, or a
+    startup time more than ``threshold`` slower.
+    """
+    regressions = []
+    if "startup" in baseline and "startup" in current:
+        base_ms = baseline["startup"]["total_ms"]
+        head_ms = current["startup"]["total_ms"]
+        if head_ms > base_ms * (1 + threshold):
+            regressions.append(("startup", "total_ms", base_ms, head_ms))
+    for name, base in baseline.get("endpoints", {}).items():
+        head = current.get("endpoints", {}).get(name)
+        if head is None:
+            continue
+        base_p95, head_p95 = base["latency_ms"]["p95"], head["latency_ms"]["p95"]
+        if base_p95 and head_p95 > base_p95 * (1 + threshold):
+            regressions.append((name, "latency_ms.p95", base_p95, head_p95))
+        base_rps, head_rps = base["throughput_rps"], head["throughput_rps"]
+        if base_rps and head_rps < base_rps * (1 - threshold):
+            regressions.append((name, "throughput_rps", base_rps, head_rps))
+        base_q, head_q = base["queries_per_request"], head["queries_per_request"]
+        if base_q is not None and head_q is not None and head_q > base_q:
+            regressions.append((name, "queries_per_request", base_q, head_q))
+    return regressions
@@ -0,0 +1,58 @@
+import json
+import time
+
+from flask_restx import marshal
+
+
+def _best_ms(fn, iterations):
+    best = None
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        elapsed = (time.perf_counter() - start) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def run(app, rows, iterations):
+    """Serializes a ``rows``-user list both ways and reports the best time.
+
+    ``restx`` is the old path (marshal() plus the stdlib encoder);
+    ``compiled`` is the precompiled serializer plus the fast encoder.
+    """
+    from src.api.users.crud import add_users, get_all_users
+    from src.api.users.views import serialize_user, user
+    from src.serializers import dumps, orjson
+
+    with app.app_context():
+        add_users(
+            [
+                {
+                    "username": f"user{i}",
+                    "email": f"user{i}@bench.local",
+                    "password": "not-a-real-hash",
+                }
+                for i in range(rows)
+            ]
+        )
+        users = get_all_users()
+
+        def restx():
+            return json.dumps(marshal(users, user))
+
+        def compiled():
+            return dumps([serialize_user(found) for found in users])
+
+        assert json.loads(restx()) == json.loads(compiled())
+        report = {
+            "rows": len(users),
+            "encoder": "orjson" if orjson is not None else "json",
+            "restx_ms": _best_ms(restx, iterations),
+            "compiled_ms": _best_ms(compiled, iterations),
+            "marshal_only_ms": _best_ms(lambda: marshal(users, user), iterations),
+            "compiled_only_ms": _best_ms(
+                lambda: [serialize_user(found) for found in users], iterations
+            ),
+        }
+    report["speedup"] = report["restx_ms"] / report["compiled_ms"]
+    return report
@@ -0,0 +1,96 @@
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+# run in a fresh interpreter; reports its own timings on the last line
+CHILD = """
+import json, time
+start = time.perf_counter()
+import manage
+imported = time.perf_counter()
+manage.app
+built = time.perf_counter()
+print(json.dumps({"import_ms": (imported - start) * 1000,
+                  "create_app_ms": (built - imported) * 1000}))
+"""
+
+# import time:       self [us] |  cumulative | imported package
+IMPORT_TIME = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)$")
+
+
+def parse_import_times(stderr):
+    """Self and cumulative import time in ms of each module ``-X importtime``
+    reported, and which were imported at top level (by the child itself)."""
+    modules = {}
+    for line in stderr.splitlines():
+        match = IMPORT_TIME.match(line)
+        if match:
+            own, cumulative, indent, name = match.groups()
+            modules[name] = {
+                "self_ms": int(own) / 1000,
+                "cumulative_ms": int(cumulative) / 1000,
+                "top_level": not indent,
+            }
+    return modules
+
+
+def by_package(modules):
+    """Self time summed per top-level package, e.g. all of sqlalchemy."""
+    packages = {}
+    for name, times in modules.items():
+        package = name.split(".")[0]
+        packages[package] = packages.get(package, 0) + times["self_ms"]
+    return packages
+
+
+def _run_once(env):
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", CHILD],
+        capture_output=True,
+        text=True,
+        env=env,
+        check=True,
+    )
+    timings = json.loads(result.stdout.strip().splitlines()[-1])
+    return timings, parse_import_times(result.stderr)
+
+
+def run(database_url, config, runs, top):
+    """Starts the app ``runs`` times the way a server worker does
+    (``manage:app``) and reports median import and create_app() times, the
+    slowest packages by self time and the slowest modules by cumulative time.
+    """
+    env = dict(
+        os.environ,
+        APP_SETTINGS=config,
+        DATABASE_URL=database_url,
+        DATABASE_REPLICA_URLS="",
+    )
+    env.pop("FLASK_ENV", None)
+    timings, packages, modules = [], {}, {}
+    for _ in range(runs):
+        timing, imported = _run_once(env)
+        timings.append(timing)
+        for name, ms in by_package(imported).items():
+            packages.setdefault(name, []).append(ms)
+        for name, times in imported.items():
+            if times["top_level"] or name.count(".") <= 1:
+                modules.setdefault(name, []).append(times["cumulative_ms"])
+
+    def slowest(samples):
+        medians = {name: statistics.median(ms) for name, ms in samples.items()}
+        return dict(sorted(medians.items(), key=lambda item: -item[1])[:top])
+
+    import_ms = statistics.median(timing["import_ms"] for timing in timings)
+    create_app_ms = statistics.median(timing["create_app_ms"] for timing in timings)
+    return {
+        "runs": runs,
+        "import_ms": import_ms,
+        "create_app_ms": create_app_ms,
+        "total_ms": import_ms + create_app_ms,
+        "packages_self_ms": slowest(packages),
+        "modules_cumulative_ms": slowest(modules),
+    }
@@ -0,0 +1,71 @@
+import multiprocessing
+import os
+import shutil
+
+# Serving modes:
+#   sync    - one request per worker process (the old default)
+#   gthread - GUNICORN_THREADS requests per worker, one DB connection each
+#   gevent  - GUNICORN_WORKER_CONNECTIONS greenlets per worker sharing a
+#             bounded DB pool; psycopg2 is made cooperative in post_fork
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:5000")
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "gthread")
+workers = int(os.getenv("GUNICORN_WORKERS", multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.getenv("GUNICORN_THREADS", 8))
+worker_connections = int(os.getenv("GUNICORN_WORKER_CONNECTIONS", 1000))
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", 5))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 30))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", 30))
+
+# import the app once in the master and fork workers from it, so a worker
+# (re)start costs a fork instead of an import; each child disposes of the
+# inherited DB pools (src.pool.dispose_after_fork). gevent must patch the
+# worker before the app is imported, so it loads the app per worker.
+preload_app = (
+    os.getenv("GUNICORN_PRELOAD", "false" if worker_class == "gevent" else "true")
+    == "true"
+)
+
+# size the SQLAlchemy pool to the concurrency of a single worker unless set
+# explicitly; src.config reads these when the app is loaded in the worker
+if worker_class == "gthread":
+    os.environ.setdefault("DB_POOL_SIZE", str(threads))
+    os.environ.setdefault("DB_MAX_OVERFLOW", "0")
+elif worker_class == "gevent":
+    os.environ.setdefault("DB_POOL_SIZE", "20")
+    os.environ.setdefault("DB_MAX_OVERFLOW", "10")
+
+# login rate limits are shared by every worker on the host through tmpfs
+os.environ.setdefault("RATE_LIMIT_STORAGE", "/dev/shm/users-rate-limit.db")
+
+# workers share metrics through files; must be set before the app is imported
+os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", "/tmp/prometheus_multiproc")
+# a preloaded app creates its metric files before on_starting runs
+os.makedirs(os.environ["PROMETHEUS_MULTIPROC_DIR"], exist_ok=True)
+
+
+def on_starting(server):
+    path = os.environ["PROMETHEUS_MULTIPROC_DIR"]
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path)
+    if workers > 1 and os.environ["RATE_LIMIT_STORAGE"] == "memory":
+        server.log.warning(
+            "RATE_LIMIT_STORAGE=memory keeps separate buckets in each of the "
+            "%d workers, multiplying the login limits; use a shared file",
+            workers,
+        )
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+
+    multiprocess.mark_process_dead(worker.pid)
+
+
+def post_fork(server, worker):
+    if worker_class == "gevent":
+        try:
+            from psycogreen.gevent import patch_psycopg
+        except ImportError:
+            # no psycopg2 (e.g. a SQLite database): nothing to make cooperative
+            return
+        patch_psycopg()
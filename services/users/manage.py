@@ -1,19 +1,75 @@
+import os
 import sys
 
+import click
+from flask import current_app
 from flask.cli import FlaskGroup
 
-from src import create_app, db
+from src import create_app, db, outbox, user_purger
+from src.api.users.bulk import import_users as import_user_rows, parse_rows
 from src.api.users.models import User
+from src.migrations import MigrationError, run_migrations
 
-app = create_app()
 cli = FlaskGroup(create_app=create_app)
 
+
+def __getattr__(name):
+    # manage:app is built when a server asks for it, not by every CLI command
+    if name == 'app':
+        globals()['app'] = create_app()
+        return globals()['app']
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+
 @cli.command('recreate_db')
 def recreate_db():
     db.drop_all()
     db.create_all()
     db.session.commit()
 
+@cli.command('migrate')
+def migrate():
+    """Adds new indexes and columns to an existing database without downtime."""
+    try:
+        run_migrations(db.engine, echo=click.echo)
+    except MigrationError as e:
+        raise click.ClickException(str(e))
+
+@cli.command('import_users')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'ndjson']))
+@click.option('--batch-size', default=1000, show_default=True,
+              type=click.IntRange(min=1))
+@click.option('--workers', default=os.cpu_count(), show_default=True)
+def import_users(path, fmt, batch_size, workers):
+    """Imports users from a CSV or NDJSON file, hashing on every core."""
+    fmt = fmt or ('csv' if path.endswith('.csv') else 'ndjson')
+    current_app.config['BCRYPT_POOL_KIND'] = 'process'
+    current_app.config['BCRYPT_POOL_SIZE'] = workers
+
+    with open(path, encoding='utf-8', newline='') as lines:
+        report = import_user_rows(parse_rows(lines, fmt), batch_size)
+
+    for error in report['errors']:
+        click.echo(f"row {error['row']}: {error['message']} ({error['email']})", err=True)
+    click.echo(f"Imported {report['inserted']} users, {len(report['errors'])} errors")
+
+@cli.command('publish_events')
+@click.option('--once', is_flag=True, help='Publish what is pending and exit.')
+def publish_events(once):
+    """Publishes user change events to OUTBOX_SINK, instead of or besides the
+    workers' publisher threads."""
+    if once:
+        click.echo(f'Published {outbox.drain()} events')
+        return
+    outbox.run_forever(current_app._get_current_object(),
+                       current_app.config['OUTBOX_PUBLISH_INTERVAL'] or 1.0)
+
+@cli.command('purge_users')
+def purge_users():
+    """Hard-deletes users soft-deleted more than USERS_PURGE_AFTER_SECONDS ago."""
+    click.echo(f'Purged {user_purger.purge()} users')
+
 @cli.command('seed_db')
 def seed_db():
     db.session.add(User(
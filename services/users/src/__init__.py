@@ -1,23 +1,59 @@
 import os
 
 from flask import Flask
-from flask_admin import Admin
 from flask_bcrypt import Bcrypt
 from flask_cors import CORS
 from flask_sqlalchemy import SQLAlchemy
 from werkzeug.middleware.proxy_fix import ProxyFix
 
+from src.hashing import PasswordHasher
+from src.health import ReadinessProbe
+from src.instrumentation import QueryInstrumentation
+from src.metrics import Metrics
+from src.outbox import OutboxPublisher
+from src.pool import dispose_after_fork
+from src.purge import UserPurger
+from src.rate_limit import RateLimiter
+from src.refresh_tokens import RefreshTokenStore
+from src.replicas import ReplicaRouter, RoutingSession
+from src.response_cache import ResponseCache
+from src.serializers import FastJSONProvider
+from src.signing import SigningKeys
+from src.token_cache import TokenCache
+
 # instantiate the extensions
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={"class_": RoutingSession})
 cors = CORS()
 bcrypt = Bcrypt()
-admin = Admin(template_mode="bootstrap3")
+hasher = PasswordHasher()
+token_cache = TokenCache()
+refresh_tokens = RefreshTokenStore()
+rate_limiter = RateLimiter()
+response_cache = ResponseCache()
+signing_keys = SigningKeys()
+instrumentation = QueryInstrumentation()
+metrics = Metrics()
+readiness = ReadinessProbe()
+replicas = ReplicaRouter()
+outbox = OutboxPublisher()
+user_purger = UserPurger()
+
+
+def __getattr__(name):
+    # flask-admin is only imported where the admin is enabled (development)
+    if name == "admin":
+        from flask_admin import Admin
+
+        globals()["admin"] = Admin(template_mode="bootstrap3")
+        return globals()["admin"]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 def create_app(script_info=None):
 
     # instantiate the app
     app = Flask(__name__)
+    app.json = FastJSONProvider(app)
     app.wsgi_app = ProxyFix(app.wsgi_app, x_for=1, x_proto=1, x_host=1, x_port=1)
 
     # set config
@@ -26,25 +62,32 @@ def create_app(script_info=None):
 
     # set up extensions
     db.init_app(app)
+    with app.app_context():
+        for engine in db.engines.values():
+            dispose_after_fork(engine)
     cors.init_app(app, resources={r"*": {"origins": "*"}})
     bcrypt.init_app(app)
+    instrumentation.init_app(app)
+    metrics.init_app(app)
+    refresh_tokens.init_app(app)
+    replicas.init_app(app)
+    outbox.init_app(app)
+    user_purger.init_app(app)
     if os.getenv("FLASK_ENV") == "development":
+        from src import admin
+
         admin.init_app(app)
 
     # register api
-    from src.api import api
+    from src.api import init_api
 
-    api.init_app(app)
+    init_api(app)
 
     # register blueprints
     from src.api.ping import ping_blueprint
 
     app.register_blueprint(ping_blueprint)
 
-    from src.api.users.views import users_blueprint
-
-    app.register_blueprint(users_blueprint)
-
     # shell context for flask cli
     @app.shell_context_processor
     def ctx():
@@ -3,9 +3,19 @@ from flask_restx import Api
 from src.api.auth import auth_namespace
 from src.api.ping import ping_namespace
 from src.api.users.views import users_namespace
+from src.serializers import output_json
 
-api = Api(version="1.0", title="Users API", doc="/doc")
 
-api.add_namespace(ping_namespace, path="/ping")
-api.add_namespace(users_namespace, path="/users")
-api.add_namespace(auth_namespace, path="/auth")
+def init_api(app):
+    """Registers the one Api serving every namespace; the Swagger UI at /doc
+    only when SWAGGER_UI is set (/swagger.json is always served)."""
+    doc = "/doc" if app.config.get("SWAGGER_UI") else False
+    api = Api(version="1.0", title="Users API", doc=doc)
+    api.representation("application/json")(output_json)
+
+    api.add_namespace(ping_namespace, path="/ping")
+    api.add_namespace(users_namespace, path="/users")
+    api.add_namespace(auth_namespace, path="/auth")
+
+    api.init_app(app)
+    return api
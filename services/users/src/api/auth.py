@@ -1,10 +1,21 @@
+import functools
+
 import jwt
-from flask import request
+from flask import current_app, request
 from flask_restx import Namespace, Resource, fields
 
-from src import bcrypt
-from src.api.users.crud import add_user, get_user_by_email, get_user_by_id
+from src import hasher, rate_limiter, refresh_tokens, signing_keys, token_cache
 from src.api.users.models import User
+from src.refresh_tokens import TokenReuseError
+from src.serializers import compile_serializer
+
+from src.api.users.crud import (  # isort:skip
+    DuplicateEmailError,
+    add_user,
+    get_user_by_email,
+    get_user_by_id,
+    update_password_hash,
+)
 
 auth_namespace = Namespace("auth")
 
@@ -16,6 +27,8 @@ user = auth_namespace.model(
     },
 )
 
+serialize_user = compile_serializer(user)
+
 full_user = auth_namespace.clone(
     "Full User", user, {"password": fields.String(required=True)}
 )
@@ -41,9 +54,8 @@ parser.add_argument("Authorization", location="headers")
 
 
 class Register(Resource):
-    @auth_namespace.marshal_with(user)
     @auth_namespace.expect(full_user, validate=True)
-    @auth_namespace.response(201, "Success")
+    @auth_namespace.response(201, "Success", user)
     @auth_namespace.response(400, "Sorry. That email already exists.")
     def post(self):
         post_data = request.get_json()
@@ -51,31 +63,52 @@ class Register(Resource):
         email = post_data.get("email")
         password = post_data.get("password")
 
-        user = get_user_by_email(email)
-        if user:
+        try:
+            user = add_user(username, email, password)
+        except DuplicateEmailError:
             auth_namespace.abort(400, "Sorry. That email already exists.")
-        user = add_user(username, email, password)
 
-        return user, 201
+        return serialize_user(user), 201
 
 
 class Login(Resource):
     @auth_namespace.marshal_with(tokens)
     @auth_namespace.expect(login, validate=True)
     @auth_namespace.response(200, "Success")
+    @auth_namespace.response(403, "User is inactive")
     @auth_namespace.response(404, "User does not exist")
+    @auth_namespace.response(429, "Too many login attempts")
+    @auth_namespace.response(503, "Too many password operations in progress")
     def post(self):
         post_data = request.get_json()
         email = post_data.get("email")
         password = post_data.get("password")
         response_object = {}
 
+        # remote_addr is the client address once ProxyFix has applied X-Forwarded-For
+        config = current_app.config
+        rate_limiter.limit(
+            f"login:ip:{request.remote_addr}", config.get("LOGIN_RATE_LIMIT_PER_IP")
+        )
+        rate_limiter.limit(
+            f"login:email:{email.lower()}", config.get("LOGIN_RATE_LIMIT_PER_EMAIL")
+        )
+
         user = get_user_by_email(email)
-        if not user or not bcrypt.check_password_hash(user.password, password):
+        if not user or not hasher.check_password_hash(user.password, password):
             auth_namespace.abort(404, "User does not exist")
+        if not user.active:
+            auth_namespace.abort(403, "User is inactive")
+
+        hasher.upgrade_password_hash(
+            user.password,
+            password,
+            functools.partial(update_password_hash, user.id, user.password),
+        )
 
-        access_token = user.encode_token(user.id, "access")
-        refresh_token = user.encode_token(user.id, "refresh")
+        user_id = user.id
+        refresh_token, family = refresh_tokens.issue(user)
+        access_token = user.encode_token(user_id, "access", family=family)
 
         response_object = {"access_token": access_token, "refresh_token": refresh_token}
 
@@ -93,14 +126,19 @@ class Refresh(Resource):
         response_object = {}
 
         try:
-            res = User.decode_token(refresh_token)
-            user = get_user_by_id(res)
+            payload = User.decode_token_payload(refresh_token)
+            if payload.get("typ") != "refresh":
+                raise jwt.InvalidTokenError()
+            user = get_user_by_id(payload["sub"])
 
-            if not user:
+            if not user or not user.active:
                 auth_namespace.abort(401, "Invalid token")
 
-            access_token = user.encode_token(user.id, "access")
-            refresh_token = user.encode_token(user.id, "refresh")
+            try:
+                refresh_token, family = refresh_tokens.rotate(user, payload)
+            except TokenReuseError:
+                auth_namespace.abort(401, "Token reuse detected. Please log in again.")
+            access_token = user.encode_token(payload["sub"], "access", family=family)
 
             response_object = {
                 "access_token": access_token,
@@ -120,9 +158,29 @@ class Refresh(Resource):
             return "Invalid token. Please log in again."
 
 
+class Logout(Resource):
+    @auth_namespace.expect(refresh, validate=True)
+    @auth_namespace.response(204, "Success")
+    @auth_namespace.response(401, "Invalid token")
+    def post(self):
+        """Revokes the refresh token's family and the access tokens issued
+        with it"""
+        refresh_token = request.get_json().get("refresh_token")
+
+        try:
+            payload = User.decode_token_payload(refresh_token)
+        except jwt.InvalidTokenError:
+            auth_namespace.abort(401, "Invalid token. Please log in again.")
+
+        if payload.get("typ") != "refresh" or "fam" not in payload:
+            auth_namespace.abort(401, "Invalid token. Please log in again.")
+
+        refresh_tokens.revoke_family(payload["fam"], payload["sub"])
+        return "", 204
+
+
 class Status(Resource):
-    @auth_namespace.marshal_with(user)
-    @auth_namespace.response(200, "Success")
+    @auth_namespace.response(200, "Success", user)
     @auth_namespace.response(401, "Invalid token")
     @auth_namespace.expect(parser)
     def get(self):
@@ -130,13 +188,34 @@ class Status(Resource):
         if auth_header:
             try:
                 access_token = auth_header.split(" ")[1]
-                res = User.decode_token(access_token)
-                user = get_user_by_id(res)
-
-                if not user:
+                user = token_cache.get(access_token)
+                if user is not None:
+                    # a revocation handled by another worker only reaches this
+                    # worker's cache through the revoked families
+                    if refresh_tokens.is_revoked(user["fam"]):
+                        auth_namespace.abort(401, "Token revoked. Please log in again.")
+                    return serialize_user(user), 200
+
+                payload = User.decode_token_payload(access_token)
+                if refresh_tokens.is_revoked(payload.get("fam")):
+                    auth_namespace.abort(401, "Token revoked. Please log in again.")
+                user = get_user_by_id(payload["sub"])
+
+                if not user or not user.active:
                     auth_namespace.abort(401, "Invalid token")
 
-                return user, 200
+                token_cache.set(
+                    access_token,
+                    {
+                        "id": user.id,
+                        "username": user.username,
+                        "email": user.email,
+                        "fam": payload.get("fam"),
+                    },
+                    payload["exp"],
+                )
+
+                return serialize_user(user), 200
 
             except jwt.ExpiredSignatureError:
                 auth_namespace.abort(401, "Signature expired. Please log in again.")
@@ -151,7 +230,17 @@ class Status(Resource):
             auth_namespace.abort(403, "Token required")
 
 
+class Jwks(Resource):
+    @auth_namespace.response(200, "Success")
+    def get(self):
+        """Public keys for verifying tokens locally; see src.verifier"""
+        max_age = current_app.config.get("JWKS_MAX_AGE")
+        return signing_keys.jwks(), 200, {"Cache-Control": f"public, max-age={max_age}"}
+
+
 auth_namespace.add_resource(Register, "/register")
 auth_namespace.add_resource(Login, "/login")
 auth_namespace.add_resource(Refresh, "/refresh")
+auth_namespace.add_resource(Logout, "/logout")
 auth_namespace.add_resource(Status, "/status")
+auth_namespace.add_resource(Jwks, "/jwks.json")
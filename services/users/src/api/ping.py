@@ -1,8 +1,9 @@
 from flask import Blueprint
-from flask_restx import Api, Namespace, Resource
+from flask_restx import Namespace, Resource
+
+from src import metrics, readiness
 
 ping_blueprint = Blueprint("ping", __name__)
-api = Api(ping_blueprint)
 ping_namespace = Namespace("ping")
 
 
@@ -11,5 +12,26 @@ class Ping(Resource):
         return {"status": "success", "message": "pong!"}
 
 
-api.add_resource(Ping, "/ping")
+class Live(Resource):
+    def get(self):
+        """Liveness: the worker is serving requests; never touches the database"""
+        return {"status": "success", "message": "alive"}
+
+
+class Ready(Resource):
+    @ping_namespace.response(200, "Ready")
+    @ping_namespace.response(503, "Database unavailable or pool saturated")
+    def get(self):
+        """Readiness: cached database connectivity and pool saturation check"""
+        result = readiness.check()
+        return result, 200 if result["status"] == "success" else 503
+
+
+@ping_blueprint.route("/metrics")
+def prometheus_metrics():
+    return metrics.render()
+
+
 ping_namespace.add_resource(Ping, "")
+ping_namespace.add_resource(Live, "/live")
+ping_namespace.add_resource(Ready, "/ready")
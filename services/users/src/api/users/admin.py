@@ -1,7 +1,6 @@
-from flask import current_app
 from flask_admin.contrib.sqla import ModelView
 
-from src import bcrypt
+from src import hasher, refresh_tokens, token_cache
 
 
 class UserAdminView(ModelView):
@@ -12,6 +11,10 @@ class UserAdminView(ModelView):
     column_default_sort = ("created_date", True)
 
     def on_model_change(self, form, model, is_created):
-        model.password = bcrypt.generate_password_hash(
-            model.password, current_app.config.get("BCRYPT_LOG_ROUNDS")
-        ).decode()
+        model.password = hasher.generate_password_hash(model.password)
+
+    def after_model_change(self, form, model, is_created):
+        token_cache.invalidate_user(model.id)
+
+    def after_model_delete(self, model):
+        refresh_tokens.revoke_user(model.id)
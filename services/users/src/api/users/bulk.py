@@ -0,0 +1,107 @@
+import csv
+import json
+import re
+from itertools import islice
+
+from src import hasher
+from src.api.users.crud import add_users, get_existing_emails
+from src.api.users.models import User
+
+FIELDS = ("username", "email", "password")
+
+# a value too long for its column fails the whole INSERT on PostgreSQL, so it
+# is reported as a row error instead
+MAX_LENGTHS = {
+    "username": User.__table__.c.username.type.length,
+    "email": User.__table__.c.email.type.length,
+}
+
+EMAIL = re.compile(r"[^@\s]+@[^@\s]+\.[^@\s]+")
+
+
+def parse_rows(lines, fmt):
+    """Yields (row number, record) pairs from CSV or NDJSON text lines.
+
+    A record that cannot be parsed is yielded as None so it can be reported
+    without stopping the import.
+    """
+    if fmt == "csv":
+        reader = csv.DictReader(lines)
+        for row in reader:
+            yield reader.line_num, row
+        return
+
+    for number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            record = None
+        yield number, record if isinstance(record, dict) else None
+
+
+def import_users(rows, batch_size):
+    """Hashes and inserts users in batches, collecting per-row errors."""
+    report = {"inserted": 0, "errors": []}
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            report["errors"].sort(key=lambda error: error["row"])
+            return report
+        _import_batch(batch, report)
+
+
+def _import_batch(batch, report):
+    valid = {}
+    for number, record in batch:
+        error = _validate(record)
+        if error is None and record["email"].lower() in valid:
+            error = "Duplicate email in import."
+        if error is not None:
+            email = record.get("email") if isinstance(record, dict) else None
+            report["errors"].append({"row": number, "email": email, "message": error})
+            continue
+        valid[record["email"].lower()] = (number, record)
+
+    # skip known duplicates before spending bcrypt time on them
+    for email in get_existing_emails(list(valid)):
+        number, record = valid.pop(email)
+        report["errors"].append(_duplicate(number, record))
+
+    records = [record for _, record in valid.values()]
+    hashes = hasher.generate_password_hashes(r["password"] for r in records)
+    inserted = add_users(
+        [
+            {"username": r["username"], "email": r["email"], "password": pw_hash}
+            for r, pw_hash in zip(records, hashes)
+        ]
+    )
+
+    report["inserted"] += len(inserted)
+    for email, (number, record) in valid.items():
+        if email not in inserted:
+            report["errors"].append(_duplicate(number, record))
+
+
+def _validate(record):
+    if record is None:
+        return "Could not parse row."
+    for field in FIELDS:
+        value = record.get(field)
+        if not isinstance(value, str) or not value:
+            return f"Missing {field}."
+        if field in MAX_LENGTHS and len(value) > MAX_LENGTHS[field]:
+            return f"The {field} is longer than {MAX_LENGTHS[field]} characters."
+    if not EMAIL.fullmatch(record["email"]):
+        return "Invalid email."
+    return None
+
+
+def _duplicate(number, record):
+    return {
+        "row": number,
+        "email": record["email"],
+        "message": "Sorry. That email already exists.",
+    }
@@ -1,34 +1,399 @@
-from src import db
-from src.api.users.models import User
+import contextlib
+import datetime
+import sqlite3
+import sys
+
+from sqlalchemy import any_, bindparam, func, literal, or_, select, tuple_
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+
+from src import db, refresh_tokens, token_cache
+
+from src.api.users.models import (  # isort:skip
+    PURGED_VERSION,
+    TableVersion,
+    User,
+    UserEvent,
+    bump_table_version,
+    record_user_events,
+)
+
+
+class DuplicateEmailError(Exception):
+    pass
+
+
+# What the read endpoints serialize, plus the version for their ETags. Selecting
+# columns returns read-only named-tuple rows: no password hash is loaded, no
+# entity is built and nothing enters the identity map. Writes use get_user_by_id.
+USER_ROW_COLUMNS = (
+    User.id,
+    User.username,
+    User.email,
+    User.created_date,
+    User.version,
+)
+
+# every read here leaves out soft-deleted users, which also lets the planner
+# use the partial indexes that only cover the rest
+LIVE = User.deleted_at.is_(None)
+
+
+# bound parameters one statement may carry, where the driver cannot tell;
+# SQLite builds before 3.32 default to 999
+MAX_PARAMETERS = {
+    "postgresql": 65535,
+    "sqlite": 32766 if sqlite3.sqlite_version_info >= (3, 32) else 999,
+}
+
+
+# sort name -> key; each leads an index that ends in id (SQLite indexes carry
+# the rowid implicitly), so sorted pages are read in index order
+USER_SORTS = {
+    "created_date": User.created_date,
+    "username": func.lower(User.username),
+    "email": func.lower(User.email),
+}
 
 
 def get_all_users():
-    return User.query.all()
+    # ordered explicitly: with the partial indexes the planner may scan one
+    # that is not in id order
+    statement = select(*USER_ROW_COLUMNS).where(LIVE).order_by(User.id)
+    return db.session.execute(statement).all()
+
+
+def get_users_page(limit, cursor=None, sort="created_date", **filters):
+    """Returns up to ``limit`` rows after ``cursor``, a (sort key, id) pair
+    taken from the ``sort_key`` and ``id`` of the previous page's last row.
+
+    ``sort`` is a key of USER_SORTS, prefixed with "-" for descending order;
+    ``filters`` are the keyword arguments of :func:`filter_users`.
+    """
+    statement = _sorted_users(sort, **filters)
+    if cursor is not None:
+        key, user_id = cursor
+        column = USER_SORTS[sort.lstrip("-")]
+        after = tuple_(column, User.id)
+        before = tuple_(literal(key, column.type), user_id)
+        statement = statement.where(
+            after < before if sort.startswith("-") else after > before
+        )
+    return db.session.execute(statement.limit(limit)).all()
+
+
+def iter_users(batch_size, sort="created_date", **filters):
+    # server-side cursor, so only one batch of rows is in memory at a time
+    statement = _sorted_users(sort, **filters).execution_options(yield_per=batch_size)
+    yield from db.session.execute(statement)
+
+
+def filter_users(
+    statement,
+    username=None,
+    email=None,
+    q=None,
+    active=None,
+    created_from=None,
+    created_before=None,
+):
+    """Narrows a users statement. ``username`` and ``email`` are
+    case-insensitive prefixes, ``q`` a case-insensitive substring of either,
+    and created_from/created_before a half-open range of created_date.
+
+    Postgres matches text through the trigram indexes; SQLite turns prefixes
+    into ranges over the lower() indexes and scans for substrings.
+    """
+    if username:
+        statement = statement.where(_starts_with(func.lower(User.username), username))
+    if email:
+        statement = statement.where(_starts_with(func.lower(User.email), email))
+    if q:
+        pattern = f"%{_escape_like(q.lower())}%"
+        statement = statement.where(
+            or_(
+                func.lower(User.username).like(pattern, escape="/"),
+                func.lower(User.email).like(pattern, escape="/"),
+            )
+        )
+    if active is not None:
+        statement = statement.where(User.active == active)
+    if created_from is not None:
+        statement = statement.where(User.created_date >= created_from)
+    if created_before is not None:
+        statement = statement.where(User.created_date < created_before)
+    return statement
+
+
+def _sorted_users(sort, **filters):
+    column = USER_SORTS[sort.lstrip("-")]
+    statement = filter_users(
+        select(*USER_ROW_COLUMNS, column.label("sort_key")).where(LIVE), **filters
+    )
+    if sort.startswith("-"):
+        return statement.order_by(column.desc(), User.id.desc())
+    return statement.order_by(column, User.id)
+
+
+def _escape_like(value):
+    return value.replace("/", "//").replace("%", "/%").replace("_", "/_")
+
+
+def _starts_with(expression, prefix):
+    prefix = prefix.lower()
+    if db.session.get_bind().dialect.name == "postgresql":
+        return expression.like(f"{_escape_like(prefix)}%", escape="/")
+    # SQLite only applies the LIKE optimization to plain columns, but a range
+    # over the expression index is equivalent
+    if prefix[-1] == chr(sys.maxunicode):
+        return expression >= prefix
+    upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+    return (expression >= prefix) & (expression < upper)
+
+
+def get_users_version():
+    statement = select(TableVersion.version).where(TableVersion.name == "users")
+    return db.session.execute(statement).scalar() or 0
+
+
+def get_user_events(since, limit):
+    """Outbox events of users versions after ``since``, oldest first.
+
+    Returns at least ``limit`` events when there are that many, and always
+    whole versions, so the last event's version is the cursor of the next
+    page. Versions follow commit order, so no event can still appear below it.
+    """
+    after = select(UserEvent.version).where(UserEvent.version > since)
+    last = db.session.execute(
+        after.order_by(UserEvent.version, UserEvent.id).offset(limit - 1).limit(1)
+    ).scalar()
+    statement = select(UserEvent.__table__).where(UserEvent.version > since)
+    if last is not None:
+        statement = statement.where(UserEvent.version <= last)
+    return db.session.execute(statement.order_by(UserEvent.version, UserEvent.id)).all()
+
+
+def get_user_events_purged():
+    """The highest users version whose events may have been purged."""
+    statement = select(TableVersion.version).where(TableVersion.name == PURGED_VERSION)
+    return db.session.execute(statement).scalar() or 0
+
+
+def get_user_row_by_id(user_id):
+    statement = select(*USER_ROW_COLUMNS).where(User.id == user_id, LIVE)
+    return db.session.execute(statement).first()
+
+
+def get_user_rows_by_ids(ids):
+    statement = select(*USER_ROW_COLUMNS).where(_in(User.id, ids), LIVE)
+    return db.session.execute(statement).all()
+
+
+def get_user_rows_by_emails(emails):
+    emails = [email.lower() for email in emails]
+    return db.session.execute(
+        select(*USER_ROW_COLUMNS).where(
+            _in(func.lower(User.email), emails, User.email.type), LIVE
+        )
+    ).all()
+
+
+def _in(expression, values, type_=None):
+    if db.session.get_bind().dialect.name == "postgresql":
+        # = ANY(array) binds one parameter however many values there are, so
+        # every batch size shares one prepared statement
+        array_type = postgresql.ARRAY(type_ or expression.type)
+        array = bindparam("values", list(values), type_=array_type)
+        return expression == any_(array)
+    return expression.in_(values)
 
 
 def get_user_by_id(user_id):
-    return User.query.filter_by(id=user_id).first()
+    return User.query.filter(User.id == user_id, LIVE).first()
 
 
 def get_user_by_email(email):
-    return User.query.filter_by(email=email).first()
+    # matches the ix_users_email_lower_live expression index
+    return User.query.filter(func.lower(User.email) == email.lower(), LIVE).first()
 
 
 def add_user(username, email, password):
     user = User(username=username, email=email, password=password)
     db.session.add(user)
-    db.session.commit()
+    _commit_unique_email()
     return user
 
 
+def get_existing_emails(emails):
+    existing = set()
+    for chunk in _chunks([email.lower() for email in emails]):
+        statement = select(func.lower(User.email)).where(
+            func.lower(User.email).in_(chunk), LIVE
+        )
+        existing.update(db.session.execute(statement).scalars())
+    return existing
+
+
+def add_users(rows):
+    """Inserts a batch of already-hashed users in one transaction, with as few
+    statements as the database's parameter limit allows.
+
+    Rows whose email already exists are skipped by the unique index instead of
+    aborting the batch; returns the lowercased emails that were inserted.
+    """
+    if not rows:
+        return set()
+    dialect = db.session.get_bind().dialect.name
+    insert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+    inserted = []
+    # a row binds at most one parameter per column
+    for chunk in _chunks(rows, len(User.__table__.columns)):
+        statement = (
+            insert(User.__table__)
+            .values(chunk)
+            .on_conflict_do_nothing()
+            .returning(User.id, func.lower(User.email))
+        )
+        inserted += db.session.execute(statement).all()
+    if inserted:
+        # core inserts skip the ORM flush hook that bumps the counter and
+        # records the events
+        connection = db.session.connection()
+        version = bump_table_version(connection, "users")
+        for chunk in _chunks([user_id for user_id, _ in inserted]):
+            record_user_events(connection, version, "created", chunk)
+    db.session.commit()
+    return {email for _, email in inserted}
+
+
+def _chunks(values, width=1):
+    """Splits ``values`` into runs whose ``width`` parameters each fit in one
+    statement on the bound database, leaving room for a few more."""
+    limit = _parameter_limit()
+    size = max((limit - 10) // width, 1)
+    for start in range(0, len(values), size):
+        end = start + size
+        yield values[start:end]
+
+
+def _parameter_limit():
+    connection = db.session.connection()
+    if connection.dialect.name == "sqlite":
+        # builds raise or lower the limit; Python 3.11+ can read it
+        dbapi_connection = connection.connection.dbapi_connection
+        if hasattr(dbapi_connection, "getlimit"):
+            return dbapi_connection.getlimit(sqlite3.SQLITE_LIMIT_VARIABLE_NUMBER)
+    return MAX_PARAMETERS.get(connection.dialect.name, 999)
+
+
 def update_user(user, username, email):
     user.username = username
     user.email = email
-    db.session.commit()
+    _commit_unique_email()
+    token_cache.invalidate_user(user.id)
     return user
 
 
-def delete_user(user):
-    db.session.delete(user)
+def update_user_row(user_id, username, email, versions=None):
+    """Updates a user with a single UPDATE ... RETURNING and returns the new
+    row, without reading it first.
+
+    With ``versions`` only a user at one of them is updated (a compare-and-set
+    on the version behind its ETag). Returns None when no user matched: it
+    does not exist, or another update won. Raises DuplicateEmailError from the
+    unique email index.
+    """
+    users = User.__table__
+    statement = (
+        users.update()
+        .where(users.c.id == user_id, LIVE)
+        .values(username=username, email=email, version=users.c.version + 1)
+        .returning(*USER_ROW_COLUMNS)
+    )
+    if versions is not None:
+        statement = statement.where(users.c.version.in_(versions))
+    with _unique_email():
+        row = _write_user_row(statement, user_id, "updated")
+    if row is not None:
+        token_cache.invalidate_user(user_id)
+    return row
+
+
+def update_password_hash(user_id, old_hash, new_hash):
+    # compare-and-set so a password changed meanwhile is never overwritten
+    User.query.filter_by(id=user_id, password=old_hash).update(
+        {"password": new_hash}, synchronize_session=False
+    )
     db.session.commit()
-    return user
+
+
+def delete_user(user_id):
+    """Soft-deletes a user in one UPDATE ... RETURNING and returns its row, or
+    None when there is no such user.
+
+    The user drops out of every query here at once and its email can be
+    registered again; the row is hard-deleted by the purge job later.
+    """
+    users = User.__table__
+    statement = (
+        users.update()
+        .where(users.c.id == user_id, LIVE)
+        .values(deleted_at=_utcnow(), active=False, version=users.c.version + 1)
+        .returning(*USER_ROW_COLUMNS)
+    )
+    row = _write_user_row(statement, user_id, "deleted")
+    if row is not None:
+        refresh_tokens.revoke_user(user_id)
+    return row
+
+
+def purge_deleted_users(before, limit):
+    """Hard-deletes up to ``limit`` users soft-deleted before ``before``, in
+    one short transaction; returns how many."""
+    users = User.__table__
+    expired = db.session.execute(
+        select(users.c.id)
+        .where(users.c.deleted_at < before)
+        .order_by(users.c.deleted_at)
+        .limit(limit)
+    ).scalars()
+    ids = list(expired)
+    if ids:
+        db.session.execute(users.delete().where(users.c.id.in_(ids)))
+    db.session.commit()
+    return len(ids)
+
+
+def _write_user_row(statement, user_id, event_type):
+    connection = db.session.connection()
+    row = connection.execute(statement).first()
+    if row is None:
+        db.session.rollback()
+        return None
+    # a core update skips the ORM hooks that bump the counter and record the
+    # event
+    version = bump_table_version(connection, "users")
+    record_user_events(connection, version, event_type, [user_id])
+    db.session.commit()
+    return row
+
+
+def _commit_unique_email():
+    with _unique_email():
+        db.session.commit()
+
+
+@contextlib.contextmanager
+def _unique_email():
+    # the unique index is the source of truth, so there is no racy pre-read
+    try:
+        yield
+    except IntegrityError as e:
+        db.session.rollback()
+        if "ix_users_email_lower" in str(e.orig):
+            raise DuplicateEmailError() from e
+        raise
+
+
+def _utcnow():
+    return datetime.datetime.utcnow()
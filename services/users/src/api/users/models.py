@@ -1,11 +1,23 @@
 import datetime
 import os
+import uuid
+from itertools import chain
 
-import jwt
 from flask import current_app
+from sqlalchemy import DDL, event, insert, literal, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
 from sqlalchemy.sql import func
 
-from src import bcrypt, db
+from src import db, hasher, signing_keys
+from src.metrics import JWT_LATENCY
+
+# SQLite's CURRENT_TIMESTAMP has no fractional seconds; bind parameters must use
+# the same text format or keyset comparisons on created_date break on ties
+SQLITE_DATETIME = sqlite.DATETIME(
+    storage_format="%(year)04d-%(month)02d-%(day)02d "
+    "%(hour)02d:%(minute)02d:%(second)02d"
+)
 
 
 class User(db.Model):
@@ -17,35 +29,283 @@ class User(db.Model):
     email = db.Column(db.String(128), nullable=False)
     password = db.Column(db.String(255), nullable=False)
     active = db.Column(db.Boolean, default=True, nullable=False)
-    created_date = db.Column(db.DateTime, default=func.now(), nullable=False)
+    # bumped on every update; the ETag of /users/<id>
+    version = db.Column(db.Integer, default=1, server_default="1", nullable=False)
+    created_date = db.Column(
+        db.DateTime().with_variant(SQLITE_DATETIME, "sqlite"),
+        default=func.now(),
+        nullable=False,
+    )
+    # set by a soft delete; src.purge removes the row later
+    deleted_at = db.Column(db.DateTime)
+
+    # the lookup and sort indexes only cover users that are not deleted, which
+    # is all crud ever reads; a deleted user's email can be registered again
+    __table_args__ = (
+        db.Index(
+            "ix_users_email_lower_live",
+            func.lower(email),
+            unique=True,
+            postgresql_where=deleted_at.is_(None),
+            sqlite_where=deleted_at.is_(None),
+        ),
+        db.Index(
+            "ix_users_created_date_id_live",
+            created_date,
+            id,
+            postgresql_where=deleted_at.is_(None),
+            sqlite_where=deleted_at.is_(None),
+        ),
+        # sort by username, and prefix search on SQLite (as a range)
+        db.Index(
+            "ix_users_username_lower_id_live",
+            func.lower(username),
+            id,
+            postgresql_where=deleted_at.is_(None),
+            sqlite_where=deleted_at.is_(None),
+        ),
+        # the active filter, read in created_date order
+        db.Index(
+            "ix_users_active_created_date_id_live",
+            active,
+            created_date,
+            id,
+            postgresql_where=deleted_at.is_(None),
+            sqlite_where=deleted_at.is_(None),
+        ),
+        # what the purge job deletes
+        db.Index(
+            "ix_users_deleted_at",
+            deleted_at,
+            postgresql_where=deleted_at.is_not(None),
+            sqlite_where=deleted_at.is_not(None),
+        ),
+        # prefix and substring search on Postgres
+        db.Index(
+            "ix_users_username_trgm",
+            func.lower(username).label("username_lower"),
+            postgresql_using="gin",
+            postgresql_ops={"username_lower": "gin_trgm_ops"},
+        ).ddl_if(dialect="postgresql"),
+        db.Index(
+            "ix_users_email_trgm",
+            func.lower(email).label("email_lower"),
+            postgresql_using="gin",
+            postgresql_ops={"email_lower": "gin_trgm_ops"},
+        ).ddl_if(dialect="postgresql"),
+    )
 
     def __init__(self, username="", email="", password=""):
         self.username = username
         self.email = email
-        self.password = bcrypt.generate_password_hash(
-            password, current_app.config.get("BCRYPT_LOG_ROUNDS")
-        ).decode()
+        self.password = hasher.generate_password_hash(password)
 
-    def encode_token(self, user_id, token_type):
+    def encode_token(self, user_id, token_type, jti=None, family=None):
         if token_type == "access":
             seconds = current_app.config.get("ACCESS_TOKEN_EXPIRATION")
         else:
+            token_type = "refresh"
             seconds = current_app.config.get("REFRESH_TOKEN_EXPIRATION")
         payload = {
             "exp": datetime.datetime.utcnow() + datetime.timedelta(seconds=seconds),
             "iat": datetime.datetime.utcnow(),
             "sub": user_id,
+            "typ": token_type,
+            "jti": jti or uuid.uuid4().hex,
         }
-        return jwt.encode(
-            payload, current_app.config.get("SECRET_KEY"), algorithm="HS256"
-        )
+        if family is not None:
+            payload["fam"] = family
+        with JWT_LATENCY.labels("encode").time():
+            return signing_keys.encode(payload)
 
     @staticmethod
     def decode_token(token):
-        payload = jwt.decode(
-            token, current_app.config.get("SECRET_KEY"), algorithms="HS256"
+        return User.decode_token_payload(token)["sub"]
+
+    @staticmethod
+    def decode_token_payload(token):
+        with JWT_LATENCY.labels("decode").time():
+            return signing_keys.decode(token)
+
+
+class TableVersion(db.Model):
+    """Change counter per table, bumped in the same transaction as every
+    write; the ETag of list responses, consistent across workers."""
+
+    __tablename__ = "table_versions"
+
+    name = db.Column(db.String(64), primary_key=True)
+    version = db.Column(db.Integer, default=0, nullable=False)
+
+
+def bump_table_version(connection, name):
+    """Increments a table's change counter on ``connection``'s transaction and
+    returns the new version.
+
+    The counter row stays locked until the transaction ends, so concurrent
+    writers to the table commit in version order.
+    """
+    dialect = postgresql if connection.dialect.name == "postgresql" else sqlite
+    return connection.execute(
+        dialect.insert(TableVersion)
+        .values(name=name, version=1)
+        .on_conflict_do_update(
+            index_elements=[TableVersion.name],
+            set_={"version": TableVersion.version + 1},
+        )
+        .returning(TableVersion.version)
+    ).scalar()
+
+
+class UserEvent(db.Model):
+    """Transactional outbox of user changes, written in the transaction that
+    makes the change; published by src.outbox and read by /users/changes.
+
+    ``version`` is the users table version the change committed as, so
+    reading by version never skips a change that commits late. The user
+    columns are the user as of the change; a deletion only has ``user_id``.
+    """
+
+    __tablename__ = "user_events"
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    version = db.Column(db.Integer, nullable=False)
+    type = db.Column(db.String(16), nullable=False)
+    user_id = db.Column(db.Integer, nullable=False)
+    username = db.Column(db.String(128))
+    email = db.Column(db.String(128))
+    active = db.Column(db.Boolean)
+    user_version = db.Column(db.Integer)
+    created_date = db.Column(db.DateTime().with_variant(SQLITE_DATETIME, "sqlite"))
+    recorded_at = db.Column(
+        db.DateTime, default=datetime.datetime.utcnow, nullable=False
+    )
+    published_at = db.Column(db.DateTime)
+
+    __table_args__ = (
+        db.Index("ix_user_events_version_id", version, id),
+        # unpublished events (NULL) first, then by age for the purge
+        db.Index("ix_user_events_published_at_id", published_at, id),
+    )
+
+
+# TableVersion row: the highest users version whose events may be purged
+PURGED_VERSION = "user_events_purged"
+
+
+def mark_user_events_purged(connection, version):
+    """Records that events up to users ``version`` may be gone; every event
+    after the highest purged version is still there."""
+    dialect = postgresql if connection.dialect.name == "postgresql" else sqlite
+    statement = dialect.insert(TableVersion).values(
+        name=PURGED_VERSION, version=version
+    )
+    connection.execute(
+        statement.on_conflict_do_update(
+            index_elements=[TableVersion.name],
+            set_={"version": statement.excluded.version},
+            where=TableVersion.version < statement.excluded.version,
+        )
+    )
+
+
+def record_user_events(connection, version, event_type, user_ids):
+    """Adds an outbox event per user on ``connection``'s transaction, copying
+    the user's row as it is now; ``deleted`` events only carry the id."""
+    if not user_ids:
+        return
+    if event_type == "deleted":
+        connection.execute(
+            insert(UserEvent),
+            [
+                {"version": version, "type": event_type, "user_id": user_id}
+                for user_id in user_ids
+            ],
+        )
+        return
+    users = select(
+        literal(version),
+        literal(event_type),
+        User.id,
+        User.username,
+        User.email,
+        User.active,
+        User.version,
+        User.created_date,
+    ).where(User.id.in_(user_ids))
+    connection.execute(
+        insert(UserEvent).from_select(
+            [
+                "version",
+                "type",
+                "user_id",
+                "username",
+                "email",
+                "active",
+                "user_version",
+                "created_date",
+            ],
+            users,
         )
-        return payload["sub"]
+    )
+
+
+event.listen(
+    db.metadata,
+    "before_create",
+    DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm").execute_if(dialect="postgresql"),
+)
+
+
+@event.listens_for(User, "before_update")
+def _bump_user_version(mapper, connection, target):
+    target.version = User.version + 1
+
+
+@event.listens_for(Session, "after_flush")
+def _bump_users_version(session, flush_context):
+    # every ORM write to users, including flask-admin, moves the list ETag and
+    # is recorded in the outbox
+    if not any(
+        isinstance(instance, User)
+        for instance in chain(session.new, session.dirty, session.deleted)
+    ):
+        return
+    connection = session.connection()
+    version = bump_table_version(connection, "users")
+    changes = {
+        "created": session.new,
+        "updated": (
+            instance for instance in session.dirty if session.is_modified(instance)
+        ),
+        "deleted": session.deleted,
+    }
+    for event_type, instances in changes.items():
+        user_ids = [instance.id for instance in instances if isinstance(instance, User)]
+        record_user_events(connection, version, event_type, user_ids)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _bump_users_version_bulk(orm_execute_state):
+    # Query.update()/delete() and update(User) statements bypass the flush
+    if (
+        orm_execute_state.is_update or orm_execute_state.is_delete
+    ) and orm_execute_state.bind_mapper is User.__mapper__:
+        bump_table_version(orm_execute_state.session.connection(), "users")
+
+
+class RefreshToken(db.Model):
+    """One issued refresh token; rotation marks it used and chains a new jti
+    into the same family."""
+
+    __tablename__ = "refresh_tokens"
+
+    jti = db.Column(db.String(32), primary_key=True)
+    family = db.Column(db.String(32), nullable=False, index=True)
+    user_id = db.Column(db.Integer, nullable=False, index=True)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+    used_at = db.Column(db.DateTime)
+    revoked_at = db.Column(db.DateTime, index=True)
 
 
 if os.getenv("FLASK_ENV") == "development":
@@ -1,17 +1,35 @@
-from flask import Blueprint, request
-from flask_restx import Api, Namespace, Resource, fields
+import base64
+import binascii
+import io
+from datetime import datetime, timezone
+from itertools import chain
+from urllib.parse import urlencode
+
+from flask import current_app, request, stream_with_context
+from flask_restx import Namespace, Resource, fields, inputs
+
+from src import replicas, response_cache
+from src.api.users.bulk import import_users, parse_rows
+from src.outbox import serialize_event
+from src.serializers import compile_serializer, dumps
 
 from src.api.users.crud import (  # isort:skip
+    USER_SORTS,
+    DuplicateEmailError,
     get_all_users,
-    get_user_by_id,
-    get_user_by_email,
+    get_users_page,
+    get_users_version,
+    get_user_events,
+    get_user_events_purged,
+    iter_users,
+    get_user_row_by_id,
+    get_user_rows_by_ids,
+    get_user_rows_by_emails,
     add_user,
-    update_user,
+    update_user_row,
     delete_user,
 )
 
-users_blueprint = Blueprint("users", __name__)
-api = Api(users_blueprint)
 users_namespace = Namespace("users")
 
 
@@ -25,6 +43,9 @@ user = users_namespace.model(
     },
 )
 
+# marshal(obj, user) without the per-field dispatch; the model still drives /doc
+serialize_user = compile_serializer(user)
+
 user_post = users_namespace.inherit(
     "User post",
     user,
@@ -33,12 +54,262 @@ user_post = users_namespace.inherit(
     },
 )
 
+bulk_error = users_namespace.model(
+    "Bulk import error",
+    {
+        "row": fields.Integer,
+        "email": fields.String,
+        "message": fields.String,
+    },
+)
+
+bulk_result = users_namespace.model(
+    "Bulk import result",
+    {
+        "inserted": fields.Integer,
+        "errors": fields.List(fields.Nested(bulk_error)),
+    },
+)
+
+batch_lookup = users_namespace.model(
+    "User batch lookup",
+    {
+        "ids": fields.List(fields.Integer, description="Either ids"),
+        "emails": fields.List(fields.String, description="or emails"),
+    },
+)
+
+batch_result = users_namespace.model(
+    "User batch result",
+    {
+        "users": fields.List(
+            fields.Nested(user), description="Found users, in request order"
+        ),
+        "missing": fields.List(
+            fields.Raw, description="Ids or emails not found, in request order"
+        ),
+    },
+)
+
+user_state = users_namespace.inherit(
+    "User state",
+    user,
+    {
+        "active": fields.Boolean,
+        "version": fields.Integer,
+    },
+)
+
+user_change = users_namespace.model(
+    "User change",
+    {
+        "id": fields.Integer(description="Event id; deliveries may repeat"),
+        "version": fields.Integer(description="Users version of the change"),
+        "type": fields.String(enum=["created", "updated", "deleted"]),
+        "recorded_at": fields.DateTime,
+        "user": fields.Nested(
+            user_state, description="The user after the change; id if deleted"
+        ),
+    },
+)
+
+user_changes = users_namespace.model(
+    "User changes",
+    {
+        "changes": fields.List(fields.Nested(user_change)),
+        "cursor": fields.Integer(description="since of the next request"),
+    },
+)
+
+bulk_parser = users_namespace.parser()
+bulk_parser.add_argument("batch_size", type=int, location="args")
+
+
+def utc_datetime(value):
+    """ISO 8601 date or datetime, as the naive UTC that created_date stores"""
+    value = inputs.datetime_from_iso8601(value)
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+utc_datetime.__schema__ = {"type": "string", "format": "date-time"}
+
+FILTERS = ("q", "username", "email", "active", "created_from", "created_before")
+SORTS = tuple(chain.from_iterable((name, f"-{name}") for name in USER_SORTS))
+
+parser = users_namespace.parser()
+parser.add_argument("limit", type=int, location="args", help="Page size")
+parser.add_argument("cursor", location="args", help="Cursor from X-Next-Cursor")
+parser.add_argument("stream", choices=("ndjson", "json"), location="args")
+parser.add_argument("q", location="args", help="Username or email contains")
+parser.add_argument("username", location="args", help="Username starts with")
+parser.add_argument("email", location="args", help="Email starts with")
+parser.add_argument("active", type=inputs.boolean, location="args")
+parser.add_argument(
+    "created_from", type=utc_datetime, location="args", help="Created at or after"
+)
+parser.add_argument(
+    "created_before", type=utc_datetime, location="args", help="Created before"
+)
+parser.add_argument(
+    "sort",
+    choices=SORTS,
+    default="created_date",
+    location="args",
+    help="Sort key; prefix with - for descending",
+)
+
+
+changes_parser = users_namespace.parser()
+changes_parser.add_argument(
+    "since",
+    type=inputs.natural,
+    default=0,
+    location="args",
+    help="cursor of the previous page, or the version in the ETag of /users",
+)
+changes_parser.add_argument("limit", type=int, location="args", help="Page size")
+
+
+def encode_cursor(key, user_id):
+    if isinstance(key, datetime):
+        key = key.isoformat()
+    raw = f"{key}|{user_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor, sort="created_date"):
+    try:
+        key, user_id = base64.urlsafe_b64decode(cursor.encode()).decode().rsplit("|", 1)
+        if sort.lstrip("-") == "created_date":
+            key = datetime.fromisoformat(key)
+        return key, int(user_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        users_namespace.abort(400, "Invalid cursor")
+
+
+def cache_headers(etag):
+    max_age = current_app.config.get("USERS_CACHE_MAX_AGE")
+    return {
+        "ETag": f'"{etag}"',
+        "Cache-Control": f"public, max-age={max_age}, must-revalidate",
+    }
+
+
+def user_etag(row):
+    return f"user-{row.id}-{row.version}"
+
+
+def if_match_versions(user_id):
+    """The versions of the user the If-Match ETags name, or None when any
+    version will do (no If-Match, or *)."""
+    if not request.if_match or request.if_match.star_tag:
+        return None
+    prefix = f"user-{user_id}-"
+    versions = [
+        tag.removeprefix(prefix)
+        for tag in request.if_match.as_set()
+        if tag.startswith(prefix)
+    ]
+    return [int(version) for version in versions if version.isdigit()]
+
+
+def not_modified(etag):
+    """A 304 for a matching If-None-Match, else None.
+
+    The comparison is weak, as If-None-Match requires: a proxy that compresses
+    the body (nginx gzip) sends our ETag back as W/"...".
+    """
+    if request.if_none_match.contains_weak(etag):
+        return current_app.response_class(status=304, headers=cache_headers(etag))
+    return None
+
+
+def json_response(data, headers):
+    body = dumps(data) + "\n"
+    return current_app.response_class(
+        body, mimetype="application/json", headers=headers
+    )
+
+
+def stream_users(stream, sort, filters):
+    batch_size = current_app.config.get("USERS_STREAM_BATCH_SIZE")
+    rows = (
+        dumps(serialize_user(row)) for row in iter_users(batch_size, sort, **filters)
+    )
+
+    if stream == "ndjson":
+        body = (f"{row}\n" for row in rows)
+        mimetype = "application/x-ndjson"
+    else:
+
+        def body():
+            yield "["
+            for i, row in enumerate(rows):
+                yield f",{row}" if i else row
+            yield "]"
+
+        body = body()
+        mimetype = "application/json"
+
+    return current_app.response_class(stream_with_context(body), mimetype=mimetype)
+
 
 class UsersList(Resource):
-    @users_namespace.marshal_with(user, as_list=True)
+    @users_namespace.expect(parser)
+    @users_namespace.response(200, "Success", [user])
+    @users_namespace.response(400, "Invalid cursor")
     def get(self):
-        """Returns all users"""
-        return get_all_users(), 200
+        """Returns all users, or a keyset-paginated page or stream of users
+
+        Searching, filtering and sorting always return pages.
+        """
+        args = parser.parse_args()
+        filters = {name: args[name] for name in FILTERS if args[name] not in (None, "")}
+        sort = args["sort"]
+
+        if args["stream"]:
+            return stream_users(args["stream"], sort, filters)
+
+        # any write to users changes the version, in every worker
+        etag = f"users-{get_users_version()}"
+        response = not_modified(etag)
+        if response is not None:
+            return response
+
+        if (
+            args["limit"] is None
+            and args["cursor"] is None
+            and not filters
+            and sort == "created_date"
+        ):
+            body = response_cache.get(etag)
+            if body is not None:
+                return current_app.response_class(
+                    body, mimetype="application/json", headers=cache_headers(etag)
+                )
+            response = json_response(
+                [serialize_user(found) for found in get_all_users()],
+                cache_headers(etag),
+            )
+            response_cache.set(etag, response.get_data())
+            return response
+
+        max_limit = current_app.config.get("USERS_PAGE_MAX_LIMIT")
+        limit = min(max(args["limit"] or max_limit, 1), max_limit)
+        cursor = decode_cursor(args["cursor"], sort) if args["cursor"] else None
+
+        users = get_users_page(limit, cursor, sort, **filters)
+        headers = cache_headers(etag)
+        if len(users) == limit:
+            next_cursor = encode_cursor(users[-1].sort_key, users[-1].id)
+            query = {**request.args, "limit": limit, "cursor": next_cursor}
+            next_url = f"{request.base_url}?{urlencode(query)}"
+            headers["X-Next-Cursor"] = next_cursor
+            headers["Link"] = f'<{next_url}>; rel="next"'
+
+        return [serialize_user(found) for found in users], 200, headers
 
     @users_namespace.expect(user_post, validate=True)
     @users_namespace.response(201, "<user_email> was added!")
@@ -51,70 +322,174 @@ class UsersList(Resource):
         password = post_data.get("password")
         response = {}
 
-        user = get_user_by_email(email)
-        if user:
+        try:
+            add_user(username, email, password)
+        except DuplicateEmailError:
             response["message"] = "Sorry. That email already exists."
             return response, 400
 
-        add_user(username, email, password)
-
         response["message"] = f"{email} was added!"
 
         return response, 201
 
 
-class Users(Resource):
-    @users_namespace.marshal_with(user)
+class UsersBulk(Resource):
+    @users_namespace.marshal_with(bulk_result)
+    @users_namespace.expect(bulk_parser)
     @users_namespace.response(200, "Success")
+    @users_namespace.response(415, "Send text/csv or application/x-ndjson")
+    def post(self):
+        """Imports users from a CSV or NDJSON body"""
+        if request.mimetype == "text/csv":
+            fmt = "csv"
+        elif request.mimetype == "application/x-ndjson":
+            fmt = "ndjson"
+        else:
+            users_namespace.abort(415, "Send text/csv or application/x-ndjson")
+
+        args = bulk_parser.parse_args()
+        max_batch_size = current_app.config.get("USERS_BULK_BATCH_SIZE")
+        batch_size = min(max(args["batch_size"] or max_batch_size, 1), max_batch_size)
+        lines = io.TextIOWrapper(request.stream, encoding="utf-8", newline="")
+
+        return import_users(parse_rows(lines, fmt), batch_size), 200
+
+
+class UsersBatch(Resource):
+    @users_namespace.expect(batch_lookup, validate=True)
+    @users_namespace.response(200, "Success", batch_result)
+    @users_namespace.response(400, "Send either ids or emails, up to <max> of them")
+    @replicas.read_only
+    def post(self):
+        """Looks up many users by id or by email in one query"""
+        post_data = request.get_json()
+        ids, emails = post_data.get("ids"), post_data.get("emails")
+        keys = ids if ids is not None else emails
+        max_keys = current_app.config.get("USERS_LOOKUP_MAX_KEYS")
+        if (ids is None) == (emails is None) or len(keys) > max_keys:
+            users_namespace.abort(
+                400, f"Send either ids or emails, up to {max_keys} of them"
+            )
+
+        if ids is not None:
+            found = {row.id: row for row in get_user_rows_by_ids(set(ids))}
+            lookups = ids
+        else:
+            rows = get_user_rows_by_emails(set(emails))
+            found = {row.email.lower(): row for row in rows}
+            lookups = [email.lower() for email in emails]
+
+        users, missing = [], []
+        for key, lookup in zip(keys, lookups):
+            row = found.get(lookup)
+            if row is None:
+                missing.append(key)
+            else:
+                users.append(serialize_user(row))
+        return {"users": users, "missing": missing}, 200
+
+
+class UsersChanges(Resource):
+    @users_namespace.expect(changes_parser)
+    @users_namespace.response(200, "Success", user_changes)
+    @users_namespace.response(410, "Changes up to <version> were purged")
+    def get(self):
+        """Returns the changes to users after a cursor, oldest first
+
+        Start from the version in the ETag of a full GET /users (users-<n>)
+        and pass each response's cursor as the next since. An empty page
+        returns the same cursor. After a 410, resync from GET /users.
+        """
+        args = changes_parser.parse_args()
+        since = args["since"]
+        purged = get_user_events_purged()
+        if since < purged:
+            users_namespace.abort(
+                410, f"Changes up to {purged} were purged; resync from /users"
+            )
+
+        max_limit = current_app.config.get("USERS_PAGE_MAX_LIMIT")
+        limit = min(max(args["limit"] or max_limit, 1), max_limit)
+        events = get_user_events(since, limit)
+        cursor = events[-1].version if events else since
+        return {
+            "changes": [serialize_event(event) for event in events],
+            "cursor": cursor,
+        }, 200
+
+
+class Users(Resource):
+    @users_namespace.response(200, "Success", user)
+    @users_namespace.response(304, "Not modified")
     @users_namespace.response(404, "User <user_id> does not exist")
     def get(self, user_id):
         """Returns a single user"""
-        user = get_user_by_id(user_id)
-        if not user:
+        found = get_user_row_by_id(user_id)
+        if not found:
             users_namespace.abort(404, f"User {user_id} does not exist")
 
-        return user, 200
+        etag = user_etag(found)
+        response = not_modified(etag)
+        if response is not None:
+            return response
+
+        return serialize_user(found), 200, cache_headers(etag)
 
     @users_namespace.expect(user, validate=True)
     @users_namespace.response(200, "Success")
-    @users_namespace.response(400, "Sorry. That email already exists.")
     @users_namespace.response(404, "User <user_id> does not exist")
+    @users_namespace.response(409, "Sorry. That email already exists.")
+    @users_namespace.response(412, "User <user_id> has changed")
     def put(self, user_id):
-        """Updates a user"""
+        """Updates a user
+
+        With If-Match set to the ETag of GET /users/<user_id>, the update only
+        applies to that version; 412 when the user has changed since (or no
+        longer exists). The response carries the new ETag.
+        """
         post_data = request.get_json()
         username = post_data.get("username")
         email = post_data.get("email")
         response = {}
 
-        user = get_user_by_id(user_id)
-        if not user:
-            users_namespace.abort(404, f"User {user_id} does not exist")
+        versions = if_match_versions(user_id)
+        if versions == []:
+            users_namespace.abort(412, f"User {user_id} has changed")
 
-        if get_user_by_email(email):
+        try:
+            found = update_user_row(user_id, username, email, versions)
+        except DuplicateEmailError:
             response["message"] = "Sorry. That email already exists."
-            return response, 400
+            return response, 409
 
-        update_user(user, username, email)
+        if not found:
+            if request.if_match:
+                users_namespace.abort(412, f"User {user_id} has changed")
+            users_namespace.abort(404, f"User {user_id} does not exist")
 
-        response["message"] = f"{user.id} was updated!"
+        response["message"] = f"{found.id} was updated!"
 
-        return response, 200
+        return response, 200, {"ETag": f'"{user_etag(found)}"'}
 
     @users_namespace.response(200, "<user_id> was removed!")
     @users_namespace.response(404, "User <user_id> does not exist")
     def delete(self, user_id):
-        """Deletes a user"""
+        """Deletes a user
+
+        The user is soft-deleted at once and purged from the table later.
+        """
         response = {}
-        user = get_user_by_id(user_id)
-        if not user:
+        found = delete_user(user_id)
+        if not found:
             users_namespace.abort(404, f"User {user_id} does not exist")
 
-        delete_user(user)
-
-        response["message"] = f"{user.email} was removed!"
+        response["message"] = f"{found.email} was removed!"
 
         return response, 200
 
 
 users_namespace.add_resource(UsersList, "")
+users_namespace.add_resource(UsersBulk, "/bulk")
+users_namespace.add_resource(UsersBatch, "/batch")
+users_namespace.add_resource(UsersChanges, "/changes")
 users_namespace.add_resource(Users, "/<int:user_id>")
@@ -1,17 +1,120 @@
 import os
 
+from src.pool import InstrumentedQueuePool
+
+
+def engine_options(url):
+    options = {
+        "poolclass": InstrumentedQueuePool,
+        "pool_size": int(os.getenv("DB_POOL_SIZE", 5)),
+        "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", 10)),
+        "pool_timeout": float(os.getenv("DB_POOL_TIMEOUT", 10)),
+        "pool_recycle": int(os.getenv("DB_POOL_RECYCLE", 1800)),
+        "pool_pre_ping": os.getenv("DB_POOL_PRE_PING", "true") == "true",
+        "connect_args": {},
+    }
+    statement_timeout = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", 30000))
+
+    if os.getenv("DB_PGBOUNCER") == "true":
+        # PgBouncer in transaction mode rejects startup options and cannot pin
+        # server-side prepared statements to a connection; set statement_timeout
+        # on the database role instead
+        if url is not None and url.startswith("postgresql+psycopg:"):
+            options["connect_args"]["prepare_threshold"] = None
+        elif url is not None and url.startswith("postgresql+asyncpg:"):
+            options["connect_args"]["statement_cache_size"] = 0
+    elif statement_timeout and url is not None and url.startswith("postgresql"):
+        options["connect_args"]["options"] = f"-c statement_timeout={statement_timeout}"
+
+    return options
+
+
+def database_url(url):
+    if url is not None and url.startswith("postgres://"):
+        url = url.replace("postgres://", "postgresql://", 1)
+    return url
+
+
+def replica_urls():
+    urls = os.getenv("DATABASE_REPLICA_URLS", "").split(",")
+    return [database_url(url.strip()) for url in urls if url.strip()]
+
 
 class BaseConfig:
     TESTING = False
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     SECRET_KEY = "my_precious"
-    BCRYPT_LOG_ROUNDS = 13
+    BCRYPT_LOG_ROUNDS = int(os.getenv("BCRYPT_LOG_ROUNDS", 13))
     ACCESS_TOKEN_EXPIRATION = 900
     REFRESH_TOKEN_EXPIRATION = 2592000
+    USERS_PAGE_MAX_LIMIT = 1000
+    USERS_STREAM_BATCH_SIZE = 1000
+    USERS_BULK_BATCH_SIZE = 1000
+    USERS_LOOKUP_MAX_KEYS = int(os.getenv("USERS_LOOKUP_MAX_KEYS", 5000))
+    USERS_CACHE_MAX_AGE = int(os.getenv("USERS_CACHE_MAX_AGE", 0))
+    RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", 64))
+    RESPONSE_CACHE_MAX_ENTRY_BYTES = int(
+        os.getenv("RESPONSE_CACHE_MAX_ENTRY_BYTES", 1 << 20)
+    )
+    PASSWORD_HASH_SCHEME = os.getenv("PASSWORD_HASH_SCHEME", "bcrypt")
+    ARGON2_TIME_COST = int(os.getenv("ARGON2_TIME_COST", 3))
+    ARGON2_MEMORY_COST = int(os.getenv("ARGON2_MEMORY_COST", 65536))
+    ARGON2_PARALLELISM = int(os.getenv("ARGON2_PARALLELISM", 1))
+    BCRYPT_POOL_KIND = os.getenv("BCRYPT_POOL_KIND", "thread")
+    BCRYPT_POOL_SIZE = int(os.getenv("BCRYPT_POOL_SIZE", os.cpu_count() or 1))
+    BCRYPT_QUEUE_SIZE = int(os.getenv("BCRYPT_QUEUE_SIZE", 32))
+    BCRYPT_QUEUE_TIMEOUT = float(os.getenv("BCRYPT_QUEUE_TIMEOUT", 1.0))
+    BCRYPT_RETRY_AFTER = int(os.getenv("BCRYPT_RETRY_AFTER", 1))
+    TOKEN_CACHE_TTL = int(os.getenv("TOKEN_CACHE_TTL", 60))
+    TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", 10000))
+    # "<requests>/<seconds>" token buckets checked before the password hash
+    LOGIN_RATE_LIMIT_PER_IP = os.getenv("LOGIN_RATE_LIMIT_PER_IP", "20/60")
+    LOGIN_RATE_LIMIT_PER_EMAIL = os.getenv("LOGIN_RATE_LIMIT_PER_EMAIL", "5/60")
+    # "memory" is per process; more than one worker needs a shared SQLite file
+    RATE_LIMIT_STORAGE = os.getenv("RATE_LIMIT_STORAGE", "memory")
+    RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", 100000))
+    JWT_KEYS_DIR = os.getenv("JWT_KEYS_DIR")
+    JWT_KEY_ID = os.getenv("JWT_KEY_ID")
+    JWKS_MAX_AGE = int(os.getenv("JWKS_MAX_AGE", 300))
+    REFRESH_TOKEN_SYNC_INTERVAL = float(os.getenv("REFRESH_TOKEN_SYNC_INTERVAL", 5))
+    REFRESH_TOKEN_COMPACT_INTERVAL = int(
+        os.getenv("REFRESH_TOKEN_COMPACT_INTERVAL", 3600)
+    )
+    REFRESH_TOKEN_COMPACT_BATCH_SIZE = 1000
+    REFRESH_TOKEN_BLOOM_BITS = 1 << 20
+    REFRESH_TOKEN_BLOOM_HASHES = 7
+    SLOW_QUERY_THRESHOLD_MS = float(os.getenv("SLOW_QUERY_THRESHOLD_MS", 100))
+    SERVER_TIMING = os.getenv("SERVER_TIMING", "true") == "true"
+    READINESS_CACHE_SECONDS = float(os.getenv("READINESS_CACHE_SECONDS", 5))
+    READINESS_MAX_POOL_SATURATION = float(
+        os.getenv("READINESS_MAX_POOL_SATURATION", 0.9)
+    )
+    METRICS_REFRESH_INTERVAL = float(os.getenv("METRICS_REFRESH_INTERVAL", 1.0))
+    SWAGGER_UI = os.getenv("SWAGGER_UI", "true") == "true"
+    SQLALCHEMY_REPLICA_URIS = []
+    REPLICA_CHECK_INTERVAL = float(os.getenv("REPLICA_CHECK_INTERVAL", 5))
+    REPLICA_MAX_LAG_SECONDS = float(os.getenv("REPLICA_MAX_LAG_SECONDS", 5))
+    # bounds connecting to a replica and its lag query, so a replica that does
+    # not answer is marked down instead of stalling the request that checks
+    REPLICA_CHECK_TIMEOUT = float(os.getenv("REPLICA_CHECK_TIMEOUT", 2))
+    # longer than the lag a replica may have and still serve reads
+    REPLICA_STICKY_SECONDS = int(os.getenv("REPLICA_STICKY_SECONDS", 10))
+    # "" (none), "queue" or "file:<path>"; see src.outbox
+    OUTBOX_SINK = os.getenv("OUTBOX_SINK", "")
+    OUTBOX_PUBLISH_INTERVAL = float(os.getenv("OUTBOX_PUBLISH_INTERVAL", 1.0))
+    # without a sink, how often events are marked published and purged
+    OUTBOX_PURGE_INTERVAL = float(os.getenv("OUTBOX_PURGE_INTERVAL", 3600))
+    OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", 500))
+    OUTBOX_QUEUE_SIZE = int(os.getenv("OUTBOX_QUEUE_SIZE", 1000))
+    OUTBOX_RETENTION_SECONDS = int(os.getenv("OUTBOX_RETENTION_SECONDS", 604800))
+    USERS_PURGE_INTERVAL = float(os.getenv("USERS_PURGE_INTERVAL", 3600))
+    USERS_PURGE_AFTER_SECONDS = int(os.getenv("USERS_PURGE_AFTER_SECONDS", 2592000))
+    USERS_PURGE_BATCH_SIZE = int(os.getenv("USERS_PURGE_BATCH_SIZE", 500))
 
 
 class DevelopmentConfig(BaseConfig):
     SQLALCHEMY_DATABASE_URI = os.environ.get("DATABASE_URL")
+    SQLALCHEMY_REPLICA_URIS = replica_urls()
     BCRYPT_LOG_ROUNDS = 4
 
 
@@ -22,13 +125,18 @@ class TestingConfig(BaseConfig):
     BCRYPT_LOG_ROUNDS = 4
     ACCESS_TOKEN_EXPIRATION = 3
     REFRESH_TOKEN_EXPIRATION = 3
+    REFRESH_TOKEN_COMPACT_INTERVAL = 0
+    OUTBOX_PUBLISH_INTERVAL = 0
+    OUTBOX_PURGE_INTERVAL = 0
+    USERS_PURGE_INTERVAL = 0
+    LOGIN_RATE_LIMIT_PER_IP = None
+    LOGIN_RATE_LIMIT_PER_EMAIL = None
 
 
 class ProductionConfig(BaseConfig):
-    url = os.environ.get("DATABASE_URL")
-
-    if url is not None and url.startswith("postgres://"):
-        url = url.replace("postgres://", "postgresql://", 1)
+    url = database_url(os.environ.get("DATABASE_URL"))
 
     SQLALCHEMY_DATABASE_URI = url
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options(url)
+    SQLALCHEMY_REPLICA_URIS = replica_urls()
     SECRET_KEY = os.getenv("SECRET_KEY", "my_precious")
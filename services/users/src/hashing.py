@@ -0,0 +1,258 @@
+import os
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import flask_bcrypt
+from flask import current_app
+from werkzeug.exceptions import ServiceUnavailable
+
+from src.metrics import PASSWORD_HASH_BUCKETS as LATENCY_BUCKETS
+from src.metrics import PASSWORD_HASH_LATENCY
+
+
+def _argon2_hasher(params):
+    # optional dependency, only needed when argon2 is configured or stored
+    from argon2 import PasswordHasher as Argon2Hasher
+
+    _, time_cost, memory_cost, parallelism = params
+    return Argon2Hasher(
+        time_cost=time_cost, memory_cost=memory_cost, parallelism=parallelism
+    )
+
+
+def _generate_password_hash(password, params):
+    if params[0] == "argon2":
+        return _argon2_hasher(params).hash(password)
+    return flask_bcrypt.generate_password_hash(password, params[1]).decode()
+
+
+def _check_password_hash(pw_hash, password):
+    if pw_hash.startswith("$argon2"):
+        from argon2 import PasswordHasher as Argon2Hasher
+        from argon2.exceptions import InvalidHash, VerificationError
+
+        # verification reads the cost parameters from the hash itself
+        try:
+            return Argon2Hasher().verify(pw_hash, password)
+        except (VerificationError, InvalidHash):
+            return False
+    return flask_bcrypt.check_password_hash(pw_hash, password)
+
+
+def _needs_rehash(pw_hash, params):
+    if params[0] == "argon2":
+        if not pw_hash.startswith("$argon2"):
+            return True
+        return _argon2_hasher(params).check_needs_rehash(pw_hash)
+    # $2b$<rounds>$<salt and hash>
+    parts = pw_hash.split("$")
+    return len(parts) != 4 or not parts[1].startswith("2") or int(parts[2]) != params[1]
+
+
+def _gevent_patched():
+    monkey = sys.modules.get("gevent.monkey")
+    return monkey is not None and monkey.is_module_patched("threading")
+
+
+def _done_callback(fn):
+    """``fn`` ready for add_done_callback.
+
+    gevent's thread pool calls done-callbacks inside the event loop, where
+    nothing may block, not even taking a patched lock; there ``fn`` runs in a
+    greenlet of its own instead.
+    """
+    if not _gevent_patched():
+        return fn
+    import gevent
+
+    return lambda future: gevent.spawn(fn, future)
+
+
+class PasswordHasher:
+    """Runs bcrypt or argon2 on a bounded worker pool.
+
+    At most BCRYPT_POOL_SIZE hashes run at once and BCRYPT_QUEUE_SIZE more may
+    wait for a free worker. Anything beyond that is rejected with a 503 so a
+    login burst cannot pile up behind the pool and starve other endpoints.
+    Both KDFs release the GIL, so the default thread pool hashes in parallel.
+
+    PASSWORD_HASH_SCHEME picks the KDF for new hashes; hashes of either kind
+    are verified. BCRYPT_LOG_ROUNDS or the ARGON2_* settings set the cost, and
+    stored hashes made with other settings are upgraded after the next
+    successful login.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._key = None
+        self._executor = None
+        self._slots = None
+        self._pool_size = 0
+        self._in_flight = 0
+        self._completed = 0
+        self._rejected = 0
+        self._latency_sum = 0.0
+        self._latency_max = 0.0
+        self._latency_buckets = [0] * len(LATENCY_BUCKETS)
+
+    def generate_password_hash(self, password, rounds=None):
+        return self._run(_generate_password_hash, password, self._params(rounds))
+
+    def check_password_hash(self, pw_hash, password):
+        return self._run(_check_password_hash, pw_hash, password)
+
+    def needs_rehash(self, pw_hash):
+        return _needs_rehash(pw_hash, self._params())
+
+    def upgrade_password_hash(self, pw_hash, password, store):
+        """Rehashes ``password`` in the background if ``pw_hash`` was made with
+        other settings, then calls ``store(new_hash)`` in an app context.
+
+        Never blocks the caller: when the pool is busy the upgrade is skipped
+        and the next login tries again. Returns the future, or None.
+        """
+        if not self.needs_rehash(pw_hash):
+            return None
+        future = self._submit(
+            _generate_password_hash, password, self._params(), timeout=0, reject=False
+        )
+        if future is None:
+            return None
+        app = current_app._get_current_object()
+
+        def stored(future):
+            if future.exception() is not None:
+                return
+            with app.app_context():
+                try:
+                    store(future.result())
+                except Exception:
+                    app.logger.exception("Storing an upgraded password hash failed")
+
+        future.add_done_callback(_done_callback(stored))
+        return future
+
+    def generate_password_hashes(self, passwords, rounds=None):
+        """Hashes many passwords in parallel for bulk imports.
+
+        Keeps at most BCRYPT_POOL_SIZE hashes outstanding and waits for a slot
+        instead of failing, so interactive logins queue behind a bounded amount
+        of bulk work rather than being rejected.
+        """
+        params = self._params(rounds)
+        window = current_app.config.get("BCRYPT_POOL_SIZE")
+        pending = deque()
+        hashes = []
+        for password in passwords:
+            if len(pending) >= window:
+                hashes.append(pending.popleft().result())
+            pending.append(
+                self._submit(_generate_password_hash, password, params, timeout=None)
+            )
+        hashes.extend(future.result() for future in pending)
+        return hashes
+
+    def stats(self):
+        with self._lock:
+            return {
+                "pool_size": self._pool_size,
+                "in_flight": self._in_flight,
+                "queue_depth": max(self._in_flight - self._pool_size, 0),
+                "completed": self._completed,
+                "rejected": self._rejected,
+                "latency_seconds_sum": self._latency_sum,
+                "latency_seconds_max": self._latency_max,
+                "latency_seconds_buckets": dict(
+                    zip(LATENCY_BUCKETS, self._latency_buckets)
+                ),
+            }
+
+    def _params(self, rounds=None):
+        """Picklable KDF settings for the worker functions."""
+        config = current_app.config
+        if rounds is None and config.get("PASSWORD_HASH_SCHEME") == "argon2":
+            return (
+                "argon2",
+                config.get("ARGON2_TIME_COST"),
+                config.get("ARGON2_MEMORY_COST"),
+                config.get("ARGON2_PARALLELISM"),
+            )
+        if rounds is None:
+            rounds = config.get("BCRYPT_LOG_ROUNDS")
+        return ("bcrypt", rounds)
+
+    def _run(self, fn, *args):
+        timeout = current_app.config.get("BCRYPT_QUEUE_TIMEOUT")
+        return self._submit(fn, *args, timeout=timeout).result()
+
+    def _submit(self, fn, *args, timeout, reject=True):
+        executor, slots = self._get_executor()
+
+        if not slots.acquire(timeout=timeout):
+            if not reject:
+                return None
+            with self._lock:
+                self._rejected += 1
+            raise ServiceUnavailable(
+                "Too many password operations in progress. Please retry.",
+                retry_after=current_app.config.get("BCRYPT_RETRY_AFTER"),
+            )
+
+        with self._lock:
+            self._in_flight += 1
+        start = time.perf_counter()
+
+        def done(future):
+            slots.release()
+            self._record(time.perf_counter() - start)
+
+        try:
+            future = executor.submit(fn, *args)
+        except BaseException:
+            done(None)
+            raise
+        future.add_done_callback(_done_callback(done))
+        return future
+
+    def _record(self, elapsed):
+        PASSWORD_HASH_LATENCY.observe(elapsed)
+        with self._lock:
+            self._in_flight -= 1
+            self._completed += 1
+            self._latency_sum += elapsed
+            self._latency_max = max(self._latency_max, elapsed)
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if elapsed <= bound:
+                    self._latency_buckets[i] += 1
+                    break
+
+    def _get_executor(self):
+        config = current_app.config
+        kind = config.get("BCRYPT_POOL_KIND")
+        pool_size = config.get("BCRYPT_POOL_SIZE")
+        queue_size = config.get("BCRYPT_QUEUE_SIZE")
+        # the pid is part of the key so forked workers never share a pool
+        key = (os.getpid(), kind, pool_size, queue_size)
+
+        with self._lock:
+            if self._key != key:
+                if self._executor is not None and self._key[0] == key[0]:
+                    self._executor.shutdown(wait=False)
+                if kind == "process":
+                    self._executor = ProcessPoolExecutor(max_workers=pool_size)
+                elif _gevent_patched():
+                    from gevent import threadpool
+
+                    # greenlet "threads" would run bcrypt on the event loop
+                    self._executor = threadpool.ThreadPoolExecutor(pool_size)
+                else:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=pool_size, thread_name_prefix="bcrypt"
+                    )
+                self._slots = threading.BoundedSemaphore(pool_size + queue_size)
+                self._pool_size = pool_size
+                self._key = key
+            return self._executor, self._slots
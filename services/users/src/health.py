@@ -0,0 +1,56 @@
+import threading
+import time
+
+from flask import current_app
+from sqlalchemy import exc, text
+
+
+class ReadinessProbe:
+    """Cached deep health check shared by concurrent probes.
+
+    The database is queried at most once per READINESS_CACHE_SECONDS per
+    worker; probes arriving while a check is running wait for it and reuse its
+    result, so health traffic stays constant however often the ALB polls.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._result = None
+        self._checked = 0.0
+
+    def check(self):
+        interval = current_app.config.get("READINESS_CACHE_SECONDS")
+        if self._fresh(interval):
+            return self._result
+        with self._lock:
+            if not self._fresh(interval):
+                self._result = self._probe()
+                self._checked = time.monotonic()
+            return self._result
+
+    def _fresh(self, interval):
+        return self._result is not None and time.monotonic() - self._checked < interval
+
+    def _probe(self):
+        from src import db
+        from src.pool import pool_stats
+
+        stats = pool_stats(db.engine)
+        # only a bounded QueuePool has a capacity; other pools never saturate
+        overflow = stats.get("max_overflow", 0)
+        capacity = stats.get("size", 0) + overflow if overflow >= 0 else 0
+        saturation = stats.get("checked_out", 0) / capacity if capacity else 0.0
+        result = {"pool_saturation": round(saturation, 3)}
+
+        # a saturated pool would make the probe itself wait for a connection
+        if saturation >= current_app.config.get("READINESS_MAX_POOL_SATURATION"):
+            return {**result, "status": "fail", "database": "pool saturated"}
+
+        try:
+            with db.engine.connect() as conn:
+                conn.execute(text("SELECT 1"))
+        except exc.SQLAlchemyError:
+            current_app.logger.exception("Readiness check failed")
+            return {**result, "status": "fail", "database": "unavailable"}
+
+        return {**result, "status": "success", "database": "ok"}
@@ -0,0 +1,107 @@
+import json
+import logging
+import time
+
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+
+class RequestStats:
+    __slots__ = ("start", "queries", "db_seconds", "slowest_seconds", "slowest")
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.slowest_seconds = 0.0
+        self.slowest = None
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, many):
+    # kept on the statement's own context, which goes away with it, because
+    # after_cursor_execute does not run when the statement raises
+    context._query_start = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, many):
+    elapsed = time.perf_counter() - context._query_start
+    if not has_request_context():
+        return
+    stats = g.get("db_stats")
+    if stats is None:
+        return
+
+    stats.queries += 1
+    stats.db_seconds += elapsed
+    if elapsed > stats.slowest_seconds:
+        stats.slowest_seconds = elapsed
+        stats.slowest = statement
+
+    threshold = current_app.config.get("SLOW_QUERY_THRESHOLD_MS")
+    if threshold is not None and elapsed * 1000 >= threshold:
+        logger.warning(
+            json.dumps(
+                {
+                    "event": "slow_query",
+                    "endpoint": request.endpoint,
+                    "method": request.method,
+                    "path": request.path,
+                    "duration_ms": round(elapsed * 1000, 3),
+                    "statement": statement,
+                }
+            )
+        )
+
+
+class QueryInstrumentation:
+    """Counts queries and DB time per request.
+
+    Engine events are attached once to every Engine, so replicas and engines
+    created later are covered too. Totals are returned in a Server-Timing
+    header and logged as one JSON line per request.
+    """
+
+    def init_app(self, app):
+        if not event.contains(Engine, "before_cursor_execute", _before_cursor_execute):
+            event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+            event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+
+    def _before_request(self):
+        g.db_stats = RequestStats()
+
+    def _after_request(self, response):
+        stats = g.pop("db_stats", None)
+        if stats is None:
+            return response
+
+        total_ms = (time.perf_counter() - stats.start) * 1000
+        db_ms = stats.db_seconds * 1000
+        if current_app.config.get("SERVER_TIMING"):
+            response.headers.add(
+                "Server-Timing",
+                f'db;dur={db_ms:.2f};desc="{stats.queries} queries", '
+                f"app;dur={total_ms:.2f}",
+            )
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(
+                json.dumps(
+                    {
+                        "event": "request",
+                        "endpoint": request.endpoint,
+                        "method": request.method,
+                        "path": request.path,
+                        "status": response.status_code,
+                        "duration_ms": round(total_ms, 3),
+                        "db_queries": stats.queries,
+                        "db_ms": round(db_ms, 3),
+                        "slowest_query_ms": round(stats.slowest_seconds * 1000, 3),
+                        "slowest_query": stats.slowest,
+                    }
+                )
+            )
+        return response
@@ -0,0 +1,169 @@
+import os
+import threading
+import time
+
+from flask import request
+
+from prometheus_client import (  # isort:skip
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+REQUESTS = Counter(
+    "http_requests_total", "HTTP requests", ["method", "endpoint", "status"]
+)
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds", "HTTP request latency", ["method", "endpoint"]
+)
+IN_FLIGHT = Gauge(
+    "http_requests_in_flight", "HTTP requests in flight", multiprocess_mode="livesum"
+)
+JWT_LATENCY = Histogram(
+    "jwt_operation_duration_seconds",
+    "JWT encode/decode latency",
+    ["operation"],
+    buckets=(0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01),
+)
+PASSWORD_HASH_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+PASSWORD_HASH_LATENCY = Histogram(
+    "password_hash_duration_seconds",
+    "Password hash and check latency, including the wait for a pool worker",
+    buckets=PASSWORD_HASH_BUCKETS,
+)
+# component state right now; livesum adds up live workers
+DB_POOL = Gauge(
+    "db_pool", "SQLAlchemy pool stats", ["stat"], multiprocess_mode="livesum"
+)
+BCRYPT = Gauge(
+    "bcrypt_pool", "Password hashing pool stats", ["stat"], multiprocess_mode="livesum"
+)
+TOKEN_CACHE = Gauge(
+    "token_cache", "Access token cache stats", ["stat"], multiprocess_mode="livesum"
+)
+# cumulative component counts; counters keep what recycled workers counted
+DB_POOL_EVENTS = Counter("db_pool_events", "SQLAlchemy pool counts", ["stat"])
+BCRYPT_EVENTS = Counter("bcrypt_pool_events", "Password hashing pool counts", ["stat"])
+TOKEN_CACHE_EVENTS = Counter(
+    "token_cache_events", "Access token cache counts", ["stat"]
+)
+# the largest value any worker has seen
+DB_POOL_MAX = Gauge(
+    "db_pool_max", "SQLAlchemy pool maxima", ["stat"], multiprocess_mode="max"
+)
+BCRYPT_MAX = Gauge(
+    "bcrypt_pool_max", "Password hashing pool maxima", ["stat"], multiprocess_mode="max"
+)
+
+COUNTED_STATS = {
+    "wait_count",
+    "wait_seconds_sum",
+    "timeouts",
+    "completed",
+    "rejected",
+    "hits",
+    "misses",
+}
+MAX_STATS = {"wait_seconds_max", "latency_seconds_max"}
+
+
+class Metrics:
+    """Prometheus metrics for the users service.
+
+    Request metrics are recorded in before/after_request hooks. Pool, bcrypt
+    and token cache stats are copied at most once per METRICS_REFRESH_INTERVAL
+    so the per-request cost stays in microseconds: current values into
+    gauges, cumulative counts into counters (by the increase since the last
+    copy) and maxima into max gauges. Hash latency is observed as it happens.
+    With PROMETHEUS_MULTIPROC_DIR set every gunicorn worker writes to shared
+    files and /metrics aggregates all of them.
+    """
+
+    def __init__(self):
+        self._refreshed = 0.0
+        self._interval = 1.0
+        self._lock = threading.Lock()
+        # (counter, stat) -> the count already added, for this process
+        self._counted = {}
+        self._counted_pid = None
+        # labelled children are cached; labels() costs more than observe()
+        self._children = {}
+
+    def init_app(self, app):
+        self._interval = app.config.get("METRICS_REFRESH_INTERVAL", 1.0)
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+
+    def render(self):
+        self.refresh()
+        if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+            registry = CollectorRegistry()
+            multiprocess.MultiProcessCollector(registry)
+        else:
+            registry = REGISTRY
+        return generate_latest(registry), 200, {"Content-Type": CONTENT_TYPE_LATEST}
+
+    def refresh(self):
+        from src import db, hasher, token_cache
+        from src.pool import pool_stats
+
+        self._refreshed = time.monotonic()
+        hasher_stats = hasher.stats()
+        # PASSWORD_HASH_LATENCY has the distribution
+        del hasher_stats["latency_seconds_sum"], hasher_stats["latency_seconds_buckets"]
+        with self._lock:
+            if self._counted_pid != os.getpid():
+                # a forked worker counts from zero in its own files
+                self._counted = {}
+                self._counted_pid = os.getpid()
+            self._export(pool_stats(db.engine), DB_POOL, DB_POOL_EVENTS, DB_POOL_MAX)
+            self._export(hasher_stats, BCRYPT, BCRYPT_EVENTS, BCRYPT_MAX)
+            self._export(token_cache.stats(), TOKEN_CACHE, TOKEN_CACHE_EVENTS)
+
+    def _export(self, stats, gauge, counter, maximum=None):
+        for name, value in stats.items():
+            if not isinstance(value, (int, float)):
+                continue
+            if name in COUNTED_STATS:
+                counted = self._counted.get((counter, name), 0)
+                # a count below what was added belongs to a new pool
+                counter.labels(name).inc(value - counted if value >= counted else value)
+                self._counted[(counter, name)] = value
+            elif name in MAX_STATS:
+                maximum.labels(name).set(value)
+            else:
+                gauge.labels(name).set(value)
+
+    def _before_request(self):
+        request.environ["metrics.start"] = time.perf_counter()
+        IN_FLIGHT.inc()
+
+    def _after_request(self, response):
+        req = request._get_current_object()
+        start = req.environ.get("metrics.start")
+        if start is not None:
+            key = (req.method, req.endpoint, response.status_code)
+            children = self._children.get(key)
+            if children is None:
+                method, endpoint, status = key
+                endpoint = endpoint or "none"
+                children = self._children[key] = (
+                    REQUEST_LATENCY.labels(method, endpoint),
+                    REQUESTS.labels(method, endpoint, status),
+                )
+            children[0].observe(time.perf_counter() - start)
+            children[1].inc()
+
+        if time.monotonic() - self._refreshed >= self._interval:
+            self.refresh()
+        return response
+
+    def _teardown_request(self, exc):
+        if request.environ.pop("metrics.start", None) is not None:
+            IN_FLIGHT.dec()
@@ -0,0 +1,182 @@
+from sqlalchemy import inspect, text
+
+
+class MigrationError(Exception):
+    pass
+
+
+def create_index(conn, name, table, columns, unique=False, using=None, where=None):
+    """Builds an index without blocking writes on a populated table.
+
+    On Postgres the index is built CONCURRENTLY outside a transaction; an
+    invalid leftover from an interrupted build is dropped and rebuilt first.
+    """
+    unique = "UNIQUE " if unique else ""
+    using = f"USING {using} " if using else ""
+    where = f" WHERE {where}" if where else ""
+    if conn.dialect.name == "postgresql":
+        invalid = conn.execute(
+            text(
+                "SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+                "WHERE c.relname = :name AND NOT i.indisvalid"
+            ),
+            {"name": name},
+        ).first()
+        if invalid:
+            conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+        concurrently = "CONCURRENTLY "
+    else:
+        concurrently = ""
+    conn.execute(
+        text(
+            f"CREATE {unique}INDEX {concurrently}IF NOT EXISTS {name} "
+            f"ON {table} {using}({columns}){where}"
+        )
+    )
+
+
+def drop_index(conn, name):
+    concurrently = "CONCURRENTLY " if conn.dialect.name == "postgresql" else ""
+    conn.execute(text(f"DROP INDEX {concurrently}IF EXISTS {name}"))
+
+
+def check_duplicate_emails(conn, where="TRUE"):
+    duplicates = conn.execute(
+        text(
+            f"SELECT lower(email) FROM users WHERE {where} GROUP BY lower(email) "
+            "HAVING count(*) > 1 LIMIT 10"
+        )
+    ).scalars()
+    duplicates = list(duplicates)
+    if duplicates:
+        raise MigrationError(
+            "Resolve duplicate emails before adding the unique index: "
+            + ", ".join(duplicates)
+        )
+
+
+def soft_delete_applied(conn):
+    # users_soft_delete replaces the full lookup indexes with partial ones
+    columns = {column["name"] for column in inspect(conn).get_columns("users")}
+    return "deleted_at" in columns
+
+
+def users_email_indexes(conn):
+    if soft_delete_applied(conn):
+        return
+    check_duplicate_emails(conn)
+    create_index(conn, "ix_users_email_lower", "users", "lower(email)", unique=True)
+    create_index(conn, "ix_users_created_date_id", "users", "created_date, id")
+
+
+def users_version_columns(conn):
+    from src.api.users.models import TableVersion
+
+    columns = {column["name"] for column in inspect(conn).get_columns("users")}
+    if "version" not in columns:
+        # a constant default is a catalog-only change on Postgres 11+
+        conn.execute(
+            text("ALTER TABLE users ADD COLUMN version INTEGER NOT NULL DEFAULT 1")
+        )
+    TableVersion.__table__.create(conn, checkfirst=True)
+
+
+def refresh_tokens_table(conn):
+    from src.api.users.models import RefreshToken
+
+    RefreshToken.__table__.create(conn, checkfirst=True)
+
+
+def users_search_indexes(conn):
+    if not soft_delete_applied(conn):
+        create_index(conn, "ix_users_username_lower_id", "users", "lower(username), id")
+    if conn.dialect.name == "postgresql":
+        conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+        create_index(
+            conn,
+            "ix_users_username_trgm",
+            "users",
+            "lower(username) gin_trgm_ops",
+            using="gin",
+        )
+        create_index(
+            conn,
+            "ix_users_email_trgm",
+            "users",
+            "lower(email) gin_trgm_ops",
+            using="gin",
+        )
+
+
+def user_events_table(conn):
+    from src.api.users.models import UserEvent
+
+    UserEvent.__table__.create(conn, checkfirst=True)
+
+
+def users_soft_delete(conn):
+    if not soft_delete_applied(conn):
+        conn.execute(text("ALTER TABLE users ADD COLUMN deleted_at TIMESTAMP"))
+    live = "deleted_at IS NULL"
+    check_duplicate_emails(conn, where=live)
+    create_index(
+        conn,
+        "ix_users_email_lower_live",
+        "users",
+        "lower(email)",
+        unique=True,
+        where=live,
+    )
+    create_index(
+        conn, "ix_users_created_date_id_live", "users", "created_date, id", where=live
+    )
+    create_index(
+        conn,
+        "ix_users_username_lower_id_live",
+        "users",
+        "lower(username), id",
+        where=live,
+    )
+    create_index(
+        conn,
+        "ix_users_deleted_at",
+        "users",
+        "deleted_at",
+        where="deleted_at IS NOT NULL",
+    )
+    # the partial indexes are in place, so the full ones can go
+    for name in (
+        "ix_users_email_lower",
+        "ix_users_created_date_id",
+        "ix_users_username_lower_id",
+    ):
+        drop_index(conn, name)
+
+
+def users_active_index(conn):
+    create_index(
+        conn,
+        "ix_users_active_created_date_id_live",
+        "users",
+        "active, created_date, id",
+        where="deleted_at IS NULL",
+    )
+
+
+# applied in order; every step must be idempotent
+MIGRATIONS = [
+    users_email_indexes,
+    refresh_tokens_table,
+    users_version_columns,
+    users_search_indexes,
+    user_events_table,
+    users_soft_delete,
+    users_active_index,
+]
+
+
+def run_migrations(engine, echo=print):
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        for migration in MIGRATIONS:
+            echo(f"Applying {migration.__name__}")
+            migration(conn)
@@ -0,0 +1,235 @@
+import datetime
+import logging
+import os
+import queue
+import threading
+import time
+
+from flask import current_app
+from sqlalchemy import delete, select, update
+
+from src.serializers import dumps
+
+logger = logging.getLogger(__name__)
+
+
+class NullSink:
+    """Drops events; the feed at /users/changes still serves them."""
+
+    def send(self, events):
+        pass
+
+
+class FileSink:
+    """Appends events to a file as NDJSON, one event per line."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def send(self, events):
+        lines = "".join(dumps(event) + "\n" for event in events)
+        with self._lock, open(self.path, "a") as f:
+            f.write(lines)
+            f.flush()
+            os.fsync(f.fileno())
+
+
+class QueueSink:
+    """In-process stand-in for a message broker: a bounded queue of batches.
+
+    A full queue fails the send, so the batch stays unpublished and is
+    retried.
+    """
+
+    def __init__(self, maxsize):
+        self.queue = queue.Queue(maxsize)
+
+    def send(self, events):
+        self.queue.put_nowait(events)
+
+
+def make_sink(url, queue_size=1000):
+    """Sink for OUTBOX_SINK: "" or "null", "queue", or "file:<path>"."""
+    scheme, _, rest = url.partition(":")
+    if scheme in ("", "null"):
+        return NullSink()
+    if scheme == "queue":
+        return QueueSink(queue_size)
+    if scheme == "file" and rest:
+        return FileSink(rest[2:] if rest.startswith("//") else rest)
+    raise ValueError(f"Unknown OUTBOX_SINK {url!r}")
+
+
+def serialize_event(row):
+    user = {"id": row.user_id}
+    if row.type != "deleted":
+        user.update(
+            username=row.username,
+            email=row.email,
+            active=row.active,
+            created_date=row.created_date,
+            version=row.user_version,
+        )
+    return {
+        "id": row.id,
+        "version": row.version,
+        "type": row.type,
+        "recorded_at": row.recorded_at,
+        "user": user,
+    }
+
+
+class OutboxPublisher:
+    """Publishes the user_events outbox to OUTBOX_SINK.
+
+    Every write to users records its events in the same transaction
+    (src.api.users.models). A background thread per worker sends unpublished
+    events to the sink every OUTBOX_PUBLISH_INTERVAL seconds, in batches of
+    OUTBOX_BATCH_SIZE, and marks them published. Delivery is at least once:
+    a batch is sent again if marking it fails, so consumers dedupe on the
+    event id. Events published more than OUTBOX_RETENTION_SECONDS ago are
+    deleted, and /users/changes answers 410 for cursors before them.
+
+    Without a sink the events are still recorded for /users/changes, but
+    nothing polls for them: the thread only wakes every OUTBOX_PURGE_INTERVAL
+    seconds to mark them published and purge them.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._app = None
+        self._publisher_pid = None
+
+    def init_app(self, app):
+        self._app = app
+        app.before_request(self._ensure_publisher)
+
+    def publish(self):
+        """Sends one batch of unpublished events; returns how many."""
+        from src import db
+        from src.api.users.models import UserEvent
+
+        batch_size = current_app.config.get("OUTBOX_BATCH_SIZE")
+        # other workers skip the locked batch instead of sending it again
+        events = db.session.execute(
+            select(UserEvent.__table__)
+            .where(UserEvent.published_at.is_(None))
+            .order_by(UserEvent.id)
+            .limit(batch_size)
+            .with_for_update(skip_locked=True)
+        ).all()
+        if not events:
+            db.session.rollback()
+            return 0
+        try:
+            self.get_sink().send([serialize_event(event) for event in events])
+        except Exception:
+            db.session.rollback()
+            raise
+        db.session.execute(
+            update(UserEvent)
+            .where(UserEvent.id.in_([event.id for event in events]))
+            .values(published_at=_utcnow())
+        )
+        db.session.commit()
+        return len(events)
+
+    def purge(self):
+        """Deletes events published before the retention period; returns how
+        many."""
+        from src import db
+        from src.api.users.models import UserEvent, mark_user_events_purged
+
+        batch_size = current_app.config.get("OUTBOX_BATCH_SIZE")
+        retention = current_app.config.get("OUTBOX_RETENTION_SECONDS")
+        cutoff = _utcnow() - datetime.timedelta(seconds=retention)
+        deleted = 0
+        while True:
+            events = db.session.execute(
+                select(UserEvent.id, UserEvent.version)
+                .where(UserEvent.published_at < cutoff)
+                .order_by(UserEvent.published_at, UserEvent.id)
+                .limit(batch_size)
+            ).all()
+            if not events:
+                break
+            db.session.execute(
+                delete(UserEvent).where(
+                    UserEvent.id.in_([event.id for event in events])
+                )
+            )
+            mark_user_events_purged(
+                db.session.connection(), max(event.version for event in events)
+            )
+            db.session.commit()
+            deleted += len(events)
+            if len(events) < batch_size:
+                break
+        return deleted
+
+    def drain(self):
+        """Publishes until no full batch is left, then purges; returns how
+        many events were published."""
+        batch_size = current_app.config.get("OUTBOX_BATCH_SIZE")
+        published = 0
+        while True:
+            count = self.publish()
+            published += count
+            if count < batch_size:
+                break
+        self.purge()
+        return published
+
+    def get_sink(self):
+        url = current_app.config.get("OUTBOX_SINK") or ""
+        sink = current_app.extensions.get("outbox_sink")
+        if sink is None or sink[0] != url:
+            with self._lock:
+                sink = current_app.extensions.get("outbox_sink")
+                if sink is None or sink[0] != url:
+                    queue_size = current_app.config.get("OUTBOX_QUEUE_SIZE")
+                    sink = (url, make_sink(url, queue_size))
+                    current_app.extensions["outbox_sink"] = sink
+        return sink[1]
+
+    def run_forever(self, app, interval):
+        while True:
+            with app.app_context():
+                try:
+                    published = self.drain()
+                    if published:
+                        logger.info("Published %d user events", published)
+                except Exception:
+                    logger.exception("Publishing user events failed")
+                finally:
+                    from src import db
+
+                    db.session.remove()
+            time.sleep(interval)
+
+    def _ensure_publisher(self):
+        interval = current_app.config.get("OUTBOX_PUBLISH_INTERVAL")
+        name = "outbox-publisher"
+        if isinstance(self.get_sink(), NullSink):
+            interval = current_app.config.get("OUTBOX_PURGE_INTERVAL")
+            name = "outbox-purger"
+        if not interval or self._publisher_pid == os.getpid():
+            return
+        with self._lock:
+            if self._publisher_pid == os.getpid():
+                return
+            # started lazily so every forked worker gets its own thread
+            self._publisher_pid = os.getpid()
+        app = self._app or current_app._get_current_object()
+        thread = threading.Thread(
+            target=self.run_forever,
+            args=(app, interval),
+            name=name,
+            daemon=True,
+        )
+        thread.start()
+
+
+def _utcnow():
+    return datetime.datetime.utcnow()
@@ -0,0 +1,74 @@
+import os
+import threading
+import time
+import weakref
+
+from sqlalchemy import exc
+from sqlalchemy.pool import QueuePool
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool that records how long checkouts wait for a connection."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._stats_lock = threading.Lock()
+        self.wait_count = 0
+        self.wait_seconds_sum = 0.0
+        self.wait_seconds_max = 0.0
+        self.timeouts = 0
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            with self._stats_lock:
+                self.timeouts += 1
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._stats_lock:
+                self.wait_count += 1
+                self.wait_seconds_sum += elapsed
+                self.wait_seconds_max = max(self.wait_seconds_max, elapsed)
+
+
+def pool_stats(engine):
+    pool = engine.pool
+    stats = {"pool": type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        stats.update(
+            size=pool.size(),
+            checked_out=pool.checkedout(),
+            checked_in=pool.checkedin(),
+            overflow=max(pool.overflow(), 0),
+            max_overflow=pool._max_overflow,
+        )
+    if isinstance(pool, InstrumentedQueuePool):
+        with pool._stats_lock:
+            stats.update(
+                wait_count=pool.wait_count,
+                wait_seconds_sum=pool.wait_seconds_sum,
+                wait_seconds_max=pool.wait_seconds_max,
+                timeouts=pool.timeouts,
+            )
+    return stats
+
+
+_engines = weakref.WeakSet()
+
+
+def dispose_after_fork(engine):
+    """Gives every forked child (gunicorn --preload workers) fresh pools
+    instead of connections shared with the parent."""
+    _engines.add(engine)
+
+
+def _dispose_engines():
+    for engine in list(_engines):
+        # close=False leaves the parent's connections open for the parent
+        engine.dispose(close=False)
+
+
+os.register_at_fork(after_in_child=_dispose_engines)
@@ -0,0 +1,79 @@
+import datetime
+import logging
+import os
+import threading
+import time
+
+from flask import current_app
+
+logger = logging.getLogger(__name__)
+
+
+class UserPurger:
+    """Hard-deletes soft-deleted users once they are old enough.
+
+    A background thread per worker runs every USERS_PURGE_INTERVAL seconds and
+    removes users deleted more than USERS_PURGE_AFTER_SECONDS ago, at most
+    USERS_PURGE_BATCH_SIZE rows per transaction, so each batch holds its
+    locks briefly and vacuum can reclaim the space as it goes.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._app = None
+        self._purger_pid = None
+
+    def init_app(self, app):
+        self._app = app
+        app.before_request(self._ensure_purger)
+
+    def purge(self):
+        """Deletes every user due for purging; returns how many."""
+        from src.api.users.crud import purge_deleted_users
+
+        batch_size = current_app.config.get("USERS_PURGE_BATCH_SIZE")
+        after = current_app.config.get("USERS_PURGE_AFTER_SECONDS")
+        before = _utcnow() - datetime.timedelta(seconds=after)
+        purged = 0
+        while True:
+            count = purge_deleted_users(before, batch_size)
+            purged += count
+            if count < batch_size:
+                return purged
+
+    def _ensure_purger(self):
+        interval = current_app.config.get("USERS_PURGE_INTERVAL")
+        if not interval or self._purger_pid == os.getpid():
+            return
+        with self._lock:
+            if self._purger_pid == os.getpid():
+                return
+            # started lazily so every forked worker gets its own thread
+            self._purger_pid = os.getpid()
+        app = self._app or current_app._get_current_object()
+        thread = threading.Thread(
+            target=self._purge_forever,
+            args=(app, interval),
+            name="user-purger",
+            daemon=True,
+        )
+        thread.start()
+
+    def _purge_forever(self, app, interval):
+        while True:
+            time.sleep(interval)
+            with app.app_context():
+                try:
+                    purged = self.purge()
+                    if purged:
+                        logger.info("Purged %d deleted users", purged)
+                except Exception:
+                    logger.exception("Purging deleted users failed")
+                finally:
+                    from src import db
+
+                    db.session.remove()
+
+
+def _utcnow():
+    return datetime.datetime.utcnow()
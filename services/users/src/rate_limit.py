@@ -0,0 +1,159 @@
+import functools
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+
+from flask import current_app
+from werkzeug.exceptions import TooManyRequests
+
+logger = logging.getLogger(__name__)
+
+
+@functools.lru_cache(maxsize=None)
+def parse_limit(limit):
+    """Parses ``"<requests>/<seconds>"`` into (capacity, refill per second)."""
+    requests, seconds = limit.split("/")
+    return float(requests), float(requests) / float(seconds)
+
+
+class MemoryBuckets:
+    """Token buckets in a dict; state is private to the worker process."""
+
+    def __init__(self, max_keys):
+        self.max_keys = max_keys
+        self._lock = threading.Lock()
+        self._buckets = {}
+
+    def take(self, key, capacity, rate, now):
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (capacity, now))[:2]
+            tokens = min(capacity, tokens + (now - updated) * rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets[key] = (tokens, now, capacity, rate)
+            if len(self._buckets) > self.max_keys:
+                self._prune(now)
+            return allowed, tokens
+
+    def _prune(self, now):
+        # a bucket that has refilled is indistinguishable from a missing one
+        for key, (tokens, updated, capacity, rate) in list(self._buckets.items()):
+            if tokens + (now - updated) * rate >= capacity:
+                del self._buckets[key]
+        # still full of active buckets: forget the oldest rather than scan on
+        # every take
+        for key in list(self._buckets)[: len(self._buckets) - self.max_keys // 2]:
+            del self._buckets[key]
+
+
+class SQLiteBuckets:
+    """Token buckets in a SQLite file shared by every worker on the host.
+
+    Each take is one UPSERT that refills and spends in a single atomic
+    statement. Put the file on tmpfs (/dev/shm) so it never touches disk.
+    When the file stays locked past the timeout the take falls back to
+    buckets private to the process, so a burst contending for the file is
+    still limited (per worker) rather than failing with a 500 or let through.
+    """
+
+    TAKE = (
+        "INSERT INTO buckets (key, tokens, updated, capacity, rate, allowed) "
+        "VALUES (:key, :capacity - 1, :now, :capacity, :rate, 1) "
+        "ON CONFLICT (key) DO UPDATE SET "
+        "allowed = min(:capacity, tokens + (:now - updated) * :rate) >= 1, "
+        "tokens = min(:capacity, tokens + (:now - updated) * :rate) "
+        "- (min(:capacity, tokens + (:now - updated) * :rate) >= 1), "
+        "updated = :now, capacity = :capacity, rate = :rate "
+        "RETURNING allowed, tokens"
+    )
+
+    def __init__(self, path, max_keys):
+        self.path = path
+        self.max_keys = max_keys
+        self._local = threading.local()
+        self._takes = 0
+        self._fallback = MemoryBuckets(max_keys)
+
+    def take(self, key, capacity, rate, now):
+        try:
+            conn = self._connect()
+            allowed, tokens = conn.execute(
+                self.TAKE, {"key": key, "capacity": capacity, "rate": rate, "now": now}
+            ).fetchone()
+            self._takes += 1
+            if self._takes % self.max_keys == 0:
+                # a bucket that has refilled is indistinguishable from a missing
+                # one
+                conn.execute(
+                    "DELETE FROM buckets "
+                    "WHERE tokens + (? - updated) * rate >= capacity",
+                    (now,),
+                )
+        except sqlite3.OperationalError as e:
+            logger.warning("Rate limit storage %r unavailable: %s", self.path, e)
+            return self._fallback.take(key, capacity, rate, now)
+        return bool(allowed), tokens
+
+    def _connect(self):
+        # sqlite connections must not cross a fork or be shared by threads
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, isolation_level=None, timeout=1)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=OFF")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS buckets (key TEXT PRIMARY KEY, "
+                "tokens REAL NOT NULL, updated REAL NOT NULL, capacity REAL NOT NULL, "
+                "rate REAL NOT NULL, allowed INTEGER)"
+            )
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+
+class RateLimiter:
+    """Token-bucket rate limiting keyed by arbitrary strings.
+
+    Limits are ``"<requests>/<seconds>"`` config values: a bucket holds up to
+    ``requests`` tokens and refills over ``seconds``; a falsy limit disables
+    the check. RATE_LIMIT_STORAGE is ``memory`` or the path of a SQLite file
+    shared by every gunicorn worker on the host. ``memory`` is private to each
+    worker, which multiplies every limit by the number of workers, so it only
+    suits a single process; gunicorn.conf.py defaults to a shared file and
+    warns when ``memory`` is used with more than one worker.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._storage = None
+        self._backend = None
+
+    def limit(self, key, limit):
+        """Spends a token for ``key`` or raises TooManyRequests with the
+        seconds until one is available."""
+        if not limit:
+            return
+        capacity, rate = parse_limit(limit)
+        allowed, tokens = self._get_backend().take(key, capacity, rate, time.time())
+        if not allowed:
+            raise TooManyRequests(
+                "Too many attempts. Please retry later.",
+                retry_after=max(1, math.ceil((1 - tokens) / rate)),
+            )
+
+    def _get_backend(self):
+        storage = current_app.config.get("RATE_LIMIT_STORAGE")
+        if self._storage != storage:
+            with self._lock:
+                if self._storage != storage:
+                    max_keys = current_app.config.get("RATE_LIMIT_MAX_KEYS")
+                    if storage == "memory":
+                        self._backend = MemoryBuckets(max_keys)
+                    else:
+                        self._backend = SQLiteBuckets(storage, max_keys)
+                    self._storage = storage
+        return self._backend
@@ -0,0 +1,288 @@
+import datetime
+import hashlib
+import logging
+import os
+import threading
+import time
+import uuid
+
+from flask import current_app
+from sqlalchemy import delete, select, update
+
+logger = logging.getLogger(__name__)
+
+
+class TokenReuseError(Exception):
+    pass
+
+
+class BloomFilter:
+    """Fixed-size bloom filter; lookups cost ``hashes`` bit tests."""
+
+    def __init__(self, bits, hashes):
+        self.bits = bits
+        self.hashes = hashes
+        self._array = bytearray((bits + 7) // 8)
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.bits for i in range(self.hashes))
+
+    def add(self, key):
+        for position in self._positions(key):
+            self._array[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key):
+        return all(
+            self._array[position >> 3] & (1 << (position & 7))
+            for position in self._positions(key)
+        )
+
+
+class RefreshTokenStore:
+    """Refresh-token families with single-use rotation and revocation.
+
+    Every login starts a family; each refresh atomically marks the presented
+    jti used and issues the next one in the same family. Presenting a jti that
+    was already used is a replay, and the whole family is revoked.
+
+    Revoked families are mirrored into a per-worker bloom filter so access
+    tokens can be checked without a query: a miss is final, a hit is
+    confirmed against the table. Revocations made by other workers are pulled
+    in every REFRESH_TOKEN_SYNC_INTERVAL. Expired rows are deleted by a
+    background thread every REFRESH_TOKEN_COMPACT_INTERVAL, which also rebuilds
+    the filter since bloom filters cannot forget.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._bloom = None
+        self._synced_at = None
+        self._checked = 0.0
+        self._app = None
+        self._compactor_pid = None
+
+    def init_app(self, app):
+        self._app = app
+
+    def issue(self, user, family=None):
+        """Returns a new refresh token for ``user``, starting a family unless
+        one is given."""
+        from src import db
+        from src.api.users.models import RefreshToken
+
+        self._ensure_compactor()
+        # read before the commit expires the instance and forces a reload
+        user_id = user.id
+        jti = uuid.uuid4().hex
+        family = family or uuid.uuid4().hex
+        seconds = current_app.config.get("REFRESH_TOKEN_EXPIRATION")
+        db.session.add(
+            RefreshToken(
+                jti=jti,
+                family=family,
+                user_id=user_id,
+                expires_at=_utcnow() + datetime.timedelta(seconds=seconds),
+            )
+        )
+        db.session.commit()
+        return user.encode_token(user_id, "refresh", jti=jti, family=family), family
+
+    def rotate(self, user, payload):
+        """Consumes a decoded refresh token and returns its successor.
+
+        Raises TokenReuseError, after revoking the family, when the token was
+        already used or its family revoked.
+        """
+        from src import db
+        from src.api.users.models import RefreshToken
+
+        jti, family = payload.get("jti"), payload.get("fam")
+        if jti is None or family is None:
+            raise TokenReuseError()
+
+        used = db.session.execute(
+            update(RefreshToken)
+            .where(
+                RefreshToken.jti == jti,
+                RefreshToken.family == family,
+                RefreshToken.used_at.is_(None),
+                RefreshToken.revoked_at.is_(None),
+            )
+            .values(used_at=_utcnow())
+        ).rowcount
+        if used != 1:
+            db.session.rollback()
+            logger.warning("Refresh token reuse detected for family %s", family)
+            self.revoke_family(family, user.id)
+            raise TokenReuseError()
+
+        return self.issue(user, family)
+
+    def revoke_family(self, family, user_id=None):
+        from src import db, token_cache
+        from src.api.users.models import RefreshToken
+
+        db.session.execute(
+            update(RefreshToken)
+            .where(RefreshToken.family == family, RefreshToken.revoked_at.is_(None))
+            .values(revoked_at=_utcnow())
+        )
+        db.session.commit()
+        self._get_bloom().add(family)
+        if user_id is not None:
+            token_cache.invalidate_user(user_id)
+
+    def revoke_user(self, user_id):
+        from src import db, token_cache
+        from src.api.users.models import RefreshToken
+
+        families = db.session.execute(
+            update(RefreshToken)
+            .where(RefreshToken.user_id == user_id, RefreshToken.revoked_at.is_(None))
+            .values(revoked_at=_utcnow())
+            .returning(RefreshToken.family)
+        ).scalars()
+        bloom = self._get_bloom()
+        for family in set(families):
+            bloom.add(family)
+        db.session.commit()
+        token_cache.invalidate_user(user_id)
+
+    def is_revoked(self, family):
+        from src import replicas
+
+        if family is None:
+            return False
+        # a lagging replica could let a revocation slip past the sync window
+        with replicas.primary():
+            self._sync()
+            if family not in self._get_bloom():
+                return False
+            return self._family_revoked(family)
+
+    def compact(self):
+        """Deletes expired rows and rebuilds the filter from live revocations."""
+        from src import db
+        from src.api.users.models import RefreshToken
+
+        batch_size = current_app.config.get("REFRESH_TOKEN_COMPACT_BATCH_SIZE")
+        deleted = 0
+        while True:
+            expired = (
+                select(RefreshToken.jti)
+                .where(RefreshToken.expires_at < _utcnow())
+                .limit(batch_size)
+            )
+            count = db.session.execute(
+                delete(RefreshToken).where(RefreshToken.jti.in_(expired))
+            ).rowcount
+            db.session.commit()
+            deleted += count
+            if count < batch_size:
+                break
+
+        # build the replacement before swapping so lookups never see a gap
+        now = _utcnow()
+        bloom = self._new_bloom()
+        for family in self._revoked_families(since=None):
+            bloom.add(family)
+        with self._lock:
+            self._bloom = bloom
+            self._synced_at = now
+            self._checked = time.monotonic()
+        return deleted
+
+    def _family_revoked(self, family):
+        from src import db
+        from src.api.users.models import RefreshToken
+
+        return (
+            db.session.execute(
+                select(RefreshToken.jti)
+                .where(
+                    RefreshToken.family == family,
+                    RefreshToken.revoked_at.is_not(None),
+                )
+                .limit(1)
+            ).first()
+            is not None
+        )
+
+    def _revoked_families(self, since):
+        from src import db
+        from src.api.users.models import RefreshToken
+
+        statement = select(RefreshToken.family).where(
+            RefreshToken.revoked_at.is_not(None)
+        )
+        if since is not None:
+            statement = statement.where(RefreshToken.revoked_at >= since)
+        return db.session.execute(statement.distinct()).scalars().all()
+
+    def _new_bloom(self):
+        return BloomFilter(
+            current_app.config.get("REFRESH_TOKEN_BLOOM_BITS"),
+            current_app.config.get("REFRESH_TOKEN_BLOOM_HASHES"),
+        )
+
+    def _get_bloom(self):
+        if self._bloom is None:
+            self._sync(force=True)
+        return self._bloom
+
+    def _sync(self, force=False):
+        interval = current_app.config.get("REFRESH_TOKEN_SYNC_INTERVAL")
+        if not force and time.monotonic() - self._checked < interval:
+            return
+        with self._lock:
+            if not force and time.monotonic() - self._checked < interval:
+                # another thread synced while this one waited
+                return
+            now = _utcnow()
+            since = self._synced_at
+            if since is not None:
+                # overlap by one interval to cover clock skew between workers
+                since -= datetime.timedelta(seconds=interval + 1)
+            families = self._revoked_families(since)
+            if self._bloom is None or since is None:
+                self._bloom = self._new_bloom()
+            for family in families:
+                self._bloom.add(family)
+            self._synced_at = now
+            self._checked = time.monotonic()
+
+    def _ensure_compactor(self):
+        interval = current_app.config.get("REFRESH_TOKEN_COMPACT_INTERVAL")
+        if not interval or self._compactor_pid == os.getpid():
+            return
+        # started lazily so every forked worker gets its own thread
+        self._compactor_pid = os.getpid()
+        app = self._app or current_app._get_current_object()
+        thread = threading.Thread(
+            target=self._compact_forever,
+            args=(app, interval),
+            name="refresh-token-compactor",
+            daemon=True,
+        )
+        thread.start()
+
+    def _compact_forever(self, app, interval):
+        while True:
+            time.sleep(interval)
+            with app.app_context():
+                try:
+                    deleted = self.compact()
+                    logger.info("Compacted %d expired refresh tokens", deleted)
+                except Exception:
+                    logger.exception("Refresh token compaction failed")
+                finally:
+                    from src import db
+
+                    db.session.remove()
+
+
+def _utcnow():
+    return datetime.datetime.utcnow()
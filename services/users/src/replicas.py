@@ -0,0 +1,226 @@
+import contextlib
+import functools
+import logging
+import math
+import random
+import threading
+import time
+
+from flask import current_app, g, has_app_context, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import create_engine, event, exc, text
+from sqlalchemy.sql.dml import UpdateBase
+
+from src.pool import dispose_after_fork
+
+logger = logging.getLogger(__name__)
+
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+# set after a write so the client reads its own writes from the primary
+STICKY_COOKIE = "read_primary"
+
+# makes the lag query give up after :ms milliseconds; set_config(..., true)
+# only lasts for the check's transaction, so it also works through PgBouncer
+STATEMENT_TIMEOUTS = {
+    "postgresql": "SELECT set_config('statement_timeout', :ms, true)",
+}
+
+# seconds behind the primary; an idle replica that has replayed everything it
+# received is current however old its last transaction is
+LAG_QUERIES = {
+    "postgresql": (
+        "SELECT coalesce(CASE WHEN pg_last_wal_receive_lsn() = "
+        "pg_last_wal_replay_lsn() THEN 0 ELSE extract(epoch FROM now() - "
+        "pg_last_xact_replay_timestamp()) END, 0)"
+    ),
+}
+
+
+class RoutingSession(Session):
+    """Session that runs the reads of a routed request on its replica.
+
+    Flushes, INSERT/UPDATE/DELETE statements and SELECT ... FOR UPDATE still
+    go to the primary, so a safe request that writes writes correctly.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and has_app_context():
+            replica = g.get("read_replica")
+            if replica is not None and not _is_write(clause):
+                return replica
+        return super().get_bind(mapper, clause, bind, **kwargs)
+
+
+def _is_write(clause):
+    return isinstance(clause, UpdateBase) or (
+        getattr(clause, "_for_update_arg", None) is not None
+    )
+
+
+def replica_engine_options(url, options, connect_timeout):
+    """``options`` for a replica engine, with a libpq connect_timeout so an
+    unreachable replica fails fast instead of after the OS TCP timeout."""
+    if not connect_timeout or not url.startswith("postgresql"):
+        return options
+    connect_args = dict(
+        options.get("connect_args", {}),
+        connect_timeout=max(1, math.ceil(connect_timeout)),
+    )
+    return dict(options, connect_args=connect_args)
+
+
+class ReplicaSet:
+    """Engines for one list of replica URLs and the last health check."""
+
+    def __init__(self, urls, options, connect_timeout=None):
+        self.urls = urls
+        self.engines = [
+            create_engine(url, **replica_engine_options(url, options, connect_timeout))
+            for url in urls
+        ]
+        self.healthy = []
+        self.checked = -math.inf
+        self.lock = threading.Lock()
+        for engine in self.engines:
+            event.listen(engine, "handle_error", self._handle_error)
+            dispose_after_fork(engine)
+
+    def _handle_error(self, context):
+        # stop routing to a failing replica now; the next check brings it back
+        if context.is_disconnect or isinstance(
+            context.sqlalchemy_exception, exc.OperationalError
+        ):
+            self.healthy = [
+                engine for engine in self.healthy if engine is not context.engine
+            ]
+
+    def dispose(self):
+        for engine in self.engines:
+            engine.dispose()
+
+
+class ReplicaRouter:
+    """Sends the reads of GET, HEAD and OPTIONS requests to a read replica.
+
+    SQLALCHEMY_REPLICA_URIS lists the replicas; without any, everything uses
+    the primary. Every REPLICA_CHECK_INTERVAL seconds one request measures
+    each replica's lag, giving up after REPLICA_CHECK_TIMEOUT, and requests
+    are spread over those no more than REPLICA_MAX_LAG_SECONDS behind. When
+    none qualify, reads fall back to the primary. A successful write sets a
+    cookie that keeps the client's reads on the primary for
+    REPLICA_STICKY_SECONDS, so it reads its own writes.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+
+    @contextlib.contextmanager
+    def primary(self):
+        """Runs the reads inside the block on the primary."""
+        replica = g.pop("read_replica", None) if has_app_context() else None
+        try:
+            yield
+        finally:
+            if replica is not None:
+                g.read_replica = replica
+
+    def read_only(self, view):
+        """Routes a view that only reads like a GET even if it is not one,
+        e.g. a lookup taking a body; it does not make the client sticky."""
+
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            g.read_only = True
+            if STICKY_COOKIE not in request.cookies:
+                g.read_replica = self._choose()
+            return view(*args, **kwargs)
+
+        return wrapper
+
+    def lag(self, engine):
+        """Seconds ``engine`` is behind the primary; infinite when it is down."""
+        query = LAG_QUERIES.get(engine.dialect.name, "SELECT 0")
+        timeout = STATEMENT_TIMEOUTS.get(engine.dialect.name)
+        try:
+            with engine.connect() as conn:
+                if timeout is not None:
+                    ms = current_app.config.get("REPLICA_CHECK_TIMEOUT") * 1000
+                    conn.execute(text(timeout), {"ms": str(int(ms))})
+                return float(conn.execute(text(query)).scalar())
+        except exc.SQLAlchemyError as e:
+            logger.warning("Read replica %r is unavailable: %s", engine.url, e)
+            return math.inf
+
+    def _before_request(self):
+        g.read_replica = None
+        if request.method in SAFE_METHODS and STICKY_COOKIE not in request.cookies:
+            g.read_replica = self._choose()
+
+    def _after_request(self, response):
+        if (
+            request.method not in SAFE_METHODS
+            and not g.get("read_only")
+            and response.status_code < 400
+            and current_app.config.get("SQLALCHEMY_REPLICA_URIS")
+        ):
+            response.set_cookie(
+                STICKY_COOKIE,
+                "1",
+                max_age=current_app.config.get("REPLICA_STICKY_SECONDS"),
+                httponly=True,
+                samesite="Lax",
+            )
+        return response
+
+    def _teardown_request(self, exc):
+        g.pop("read_replica", None)
+        g.pop("read_only", None)
+
+    def _choose(self):
+        replica_set = self._get_replica_set()
+        if replica_set is None:
+            return None
+        healthy = self._check(replica_set)
+        return random.choice(healthy) if healthy else None
+
+    def _check(self, replica_set):
+        interval = current_app.config.get("REPLICA_CHECK_INTERVAL")
+        if time.monotonic() - replica_set.checked < interval:
+            return replica_set.healthy
+        # one request measures while the others keep the last result
+        if not replica_set.lock.acquire(blocking=False):
+            return replica_set.healthy
+        try:
+            max_lag = current_app.config.get("REPLICA_MAX_LAG_SECONDS")
+            replica_set.healthy = [
+                engine for engine in replica_set.engines if self.lag(engine) <= max_lag
+            ]
+            replica_set.checked = time.monotonic()
+        finally:
+            replica_set.lock.release()
+        return replica_set.healthy
+
+    def _get_replica_set(self):
+        urls = tuple(current_app.config.get("SQLALCHEMY_REPLICA_URIS") or ())
+        if not urls:
+            return None
+        replica_set = current_app.extensions.get("replicas")
+        if replica_set is None or replica_set.urls != urls:
+            with self._lock:
+                replica_set = current_app.extensions.get("replicas")
+                if replica_set is None or replica_set.urls != urls:
+                    if replica_set is not None:
+                        replica_set.dispose()
+                    replica_set = ReplicaSet(
+                        urls,
+                        current_app.config.get("SQLALCHEMY_ENGINE_OPTIONS", {}),
+                        current_app.config.get("REPLICA_CHECK_TIMEOUT"),
+                    )
+                    current_app.extensions["replicas"] = replica_set
+        return replica_set
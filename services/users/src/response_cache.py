@@ -0,0 +1,56 @@
+import threading
+from collections import OrderedDict
+
+from flask import current_app, request
+
+
+class ResponseCache:
+    """In-process LRU of serialized JSON responses keyed by URL and ETag.
+
+    The ETag comes from a version counter read from the database on every
+    request, so a write in any worker changes the key and stale entries are
+    never served; they simply age out. Bodies larger than
+    RESPONSE_CACHE_MAX_ENTRY_BYTES are not kept.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, etag):
+        key = (request.full_path, etag)
+        with self._lock:
+            body = self._entries.get(key)
+            if body is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return body
+
+    def set(self, etag, body):
+        maxsize = current_app.config.get("RESPONSE_CACHE_SIZE")
+        if maxsize <= 0 or len(body) > current_app.config.get(
+            "RESPONSE_CACHE_MAX_ENTRY_BYTES"
+        ):
+            return
+        key = (request.full_path, etag)
+        with self._lock:
+            self._entries[key] = body
+            self._entries.move_to_end(key)
+            while len(self._entries) > maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+            }
@@ -0,0 +1,131 @@
+import json
+from collections.abc import Mapping
+from datetime import date, datetime
+
+from flask import current_app, make_response
+from flask.json.provider import DefaultJSONProvider
+from flask_restx import fields
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speedup
+    orjson = None
+
+# field types whose format() can be inlined; anything else goes through the
+# field's own output() so the result is always what marshal() would give
+_CONVERTERS = {
+    fields.Integer: "int({v})",
+    fields.String: "str({v})",
+    fields.Boolean: "bool({v})",
+    fields.Float: "float({v})",
+    fields.Raw: "{v}",
+}
+
+
+def _format_datetime(value, field):
+    if type(value) is datetime:
+        return value.isoformat()
+    return field.format(value)
+
+
+def compile_serializer(model):
+    """Builds a function equivalent to ``marshal(obj, model)`` for one object.
+
+    The per-field dispatch of flask-restx is resolved once here: plain
+    Integer/String/Boolean/Float/Raw/DateTime(iso8601) fields become inline
+    conversions in generated code, and everything else (nested fields,
+    attributes, masks, defaults for missing values) falls back to the field's
+    own ``output``. Works on ORM objects, dicts and SQLAlchemy row mappings.
+    """
+    names = {"Mapping": Mapping, "_format_datetime": _format_datetime}
+    mapping_reads, object_reads, items = [], [], []
+
+    for i, (key, field) in enumerate(model.items()):
+        if isinstance(field, type):
+            field = field()
+        names[f"f{i}"] = field
+        fallback = f"f{i}.output({key!r}, obj)"
+        plain = field.attribute is None and field.mask is None
+
+        if plain and type(field) is fields.DateTime and field.dt_format == "iso8601":
+            expression = f"_format_datetime(v{i}, f{i})"
+        elif plain and type(field) in _CONVERTERS:
+            expression = _CONVERTERS[type(field)].format(v=f"v{i}")
+        else:
+            items.append(f"{key!r}: {fallback}")
+            continue
+
+        mapping_reads.append(f"v{i} = get({key!r})")
+        object_reads.append(f"v{i} = getattr(obj, {key!r}, None)")
+        # a missing value takes the field's default exactly as marshal() does
+        items.append(f"{key!r}: {fallback} if v{i} is None else {expression}")
+
+    source = "\n".join(
+        [
+            "def serialize(obj):",
+            "    if isinstance(obj, Mapping):",
+            "        get = obj.get",
+            *(f"        {line}" for line in mapping_reads or ["pass"]),
+            "    else:",
+            *(f"        {line}" for line in object_reads or ["pass"]),
+            "    return {" + ", ".join(items) + "}",
+        ]
+    )
+    exec(compile(source, f"<serializer {model.name}>", "exec"), names)
+    return names["serialize"]
+
+
+def _default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(data):
+    """Serializes to a JSON string with orjson when it is installed."""
+    if orjson is not None:
+        try:
+            return orjson.dumps(data, default=_default).decode()
+        except TypeError:
+            # orjson rejects non-str keys and >64-bit ints; json does not
+            pass
+    return json.dumps(data, default=_default)
+
+
+def output_json(data, code, headers=None):
+    """flask-restx representation using :func:`dumps`.
+
+    RESTX_JSON settings (and the indent added in debug) are honoured by
+    falling back to the stdlib encoder.
+    """
+    settings = current_app.config.get("RESTX_JSON", {})
+    if current_app.debug:
+        settings.setdefault("indent", 4)
+    if settings:
+        dumped = json.dumps(data, **settings) + "\n"
+    else:
+        dumped = dumps(data) + "\n"
+
+    resp = make_response(dumped, code)
+    resp.headers.extend(headers or {})
+    return resp
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider (``jsonify``, ``app.json``) backed by orjson.
+
+    Dates, dataclasses and the rest still go through Flask's ``default`` so
+    the output matches the stock provider; indented output falls back to it.
+    """
+
+    def dumps(self, obj, **kwargs):
+        # orjson output is always compact, which is what jsonify asks for
+        if orjson is None or set(kwargs) - {"separators"}:
+            return super().dumps(obj, **kwargs)
+        option = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        try:
+            return orjson.dumps(obj, default=self.default, option=option).decode()
+        except TypeError:
+            return super().dumps(obj, **kwargs)
@@ -0,0 +1,122 @@
+import json
+import os
+import threading
+
+import jwt
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ed25519, rsa
+from flask import current_app
+from jwt.algorithms import OKPAlgorithm, RSAAlgorithm
+
+
+class KeyRingState:
+    __slots__ = ("source", "kid", "algorithm", "private_key", "public_keys", "jwks")
+
+    def __init__(self, source, kid, algorithm, private_key, public_keys, jwks):
+        self.source = source
+        self.kid = kid
+        self.algorithm = algorithm
+        self.private_key = private_key
+        self.public_keys = public_keys
+        self.jwks = jwks
+
+
+class SigningKeys:
+    """Signs and verifies tokens with the keys in JWT_KEYS_DIR.
+
+    Every ``<kid>.pem`` private key in the directory is published in the JWKS
+    and accepted for verification; JWT_KEY_ID selects the one that signs.
+    Rotating is: add the new key, deploy so verifiers fetch it, switch
+    JWT_KEY_ID, and delete the old file once REFRESH_TOKEN_EXPIRATION has
+    passed. RSA keys sign RS256 and Ed25519 keys sign EdDSA; EdDSA signing is
+    an order of magnitude cheaper. Without JWT_KEYS_DIR tokens fall back to
+    HS256 with SECRET_KEY and the JWKS is empty.
+
+    Keys are parsed once and reused until the config changes.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._state = None
+
+    def encode(self, payload):
+        state = self._load()
+        if state.kid is None:
+            return jwt.encode(payload, state.private_key, algorithm="HS256")
+        return jwt.encode(
+            payload,
+            state.private_key,
+            algorithm=state.algorithm,
+            headers={"kid": state.kid},
+        )
+
+    def decode(self, token):
+        state = self._load()
+        if state.kid is None:
+            return jwt.decode(token, state.private_key, algorithms="HS256")
+        kid = jwt.get_unverified_header(token).get("kid")
+        if kid not in state.public_keys:
+            raise jwt.InvalidTokenError("Unknown signing key")
+        algorithm, key = state.public_keys[kid]
+        return jwt.decode(token, key, algorithms=[algorithm])
+
+    def jwks(self):
+        return self._load().jwks
+
+    def _load(self):
+        config = current_app.config
+        source = (
+            config.get("JWT_KEYS_DIR"),
+            config.get("JWT_KEY_ID"),
+            config.get("SECRET_KEY"),
+        )
+        state = self._state
+        if state is not None and state.source == source:
+            return state
+        with self._lock:
+            if self._state is None or self._state.source != source:
+                self._state = _read_keys(*source)
+            return self._state
+
+
+def _read_keys(keys_dir, active_kid, secret_key):
+    source = (keys_dir, active_kid, secret_key)
+    if not keys_dir:
+        return KeyRingState(source, None, "HS256", secret_key, {}, {"keys": []})
+
+    private_keys = {}
+    for name in sorted(os.listdir(keys_dir)):
+        kid, ext = os.path.splitext(name)
+        if ext != ".pem":
+            continue
+        with open(os.path.join(keys_dir, name), "rb") as f:
+            private_keys[kid] = serialization.load_pem_private_key(
+                f.read(), password=None
+            )
+
+    if active_kid not in private_keys:
+        raise ValueError(f"JWT_KEY_ID {active_kid!r} not found in {keys_dir}")
+
+    public_keys = {}
+    jwks = []
+    for kid, private_key in private_keys.items():
+        if isinstance(private_key, rsa.RSAPrivateKey):
+            algorithm, to_jwk = "RS256", RSAAlgorithm.to_jwk
+        elif isinstance(private_key, ed25519.Ed25519PrivateKey):
+            algorithm, to_jwk = "EdDSA", OKPAlgorithm.to_jwk
+        else:
+            raise ValueError(f"Unsupported key type for {kid}: use RSA or Ed25519")
+        public_key = private_key.public_key()
+        public_keys[kid] = (algorithm, public_key)
+        jwk = json.loads(to_jwk(public_key))
+        jwk.update({"kid": kid, "alg": algorithm, "use": "sig"})
+        jwks.append(jwk)
+
+    return KeyRingState(
+        source,
+        active_kid,
+        public_keys[active_kid][0],
+        private_keys[active_kid],
+        public_keys,
+        {"keys": jwks},
+    )
@@ -1,6 +1,6 @@
 import pytest
 
-from src import create_app, db
+from src import create_app, db, response_cache
 from src.api.users.models import User
 
 
@@ -21,9 +21,12 @@ def test_database():
 
     os.getenv("DATABASE_TEST_URL")
     db.create_all()
+    # change counters restart with the tables, so cached bodies would collide
+    response_cache.clear()
     yield db
     db.session.remove()
     db.drop_all()
+    response_cache.clear()
 
 
 @pytest.fixture(scope="function")
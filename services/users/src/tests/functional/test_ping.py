@@ -1,4 +1,12 @@
 import json
+from collections import Counter
+
+import pytest
+from prometheus_client import REGISTRY
+from sqlalchemy import create_engine, pool
+
+from src import create_app, db, hasher, metrics, readiness
+from src.config import BaseConfig
 
 
 def test_ping(test_app):
@@ -8,3 +16,122 @@ def test_ping(test_app):
     assert res.status_code == 200
     assert "pong" in data["message"]
     assert "success" in data["status"]
+
+
+def test_metrics(test_app):
+    client = test_app.test_client()
+    client.get("/ping")
+    res = client.get("/metrics")
+    body = res.data.decode()
+
+    assert res.status_code == 200
+    assert res.content_type.startswith("text/plain")
+    assert 'http_requests_total{endpoint="ping_ping",method="GET",status="200"}' in body
+    assert "http_request_duration_seconds_bucket" in body
+    assert "http_requests_in_flight" in body
+    assert 'db_pool{stat="checked_out"}' in body
+    assert 'bcrypt_pool{stat="queue_depth"}' in body
+    assert 'bcrypt_pool_events_total{stat="completed"}' in body
+    assert 'bcrypt_pool_max{stat="latency_seconds_max"}' in body
+    assert 'token_cache_events_total{stat="hits"}' in body
+    assert "password_hash_duration_seconds_bucket" in body
+    assert "latency_seconds_buckets" not in body
+
+
+def test_metrics_count_increases(test_app):
+    def sample(name, **labels):
+        return REGISTRY.get_sample_value(name, labels) or 0
+
+    metrics.refresh()
+    completed = sample("bcrypt_pool_events_total", stat="completed")
+    hashed = sample("password_hash_duration_seconds_count")
+
+    hasher.generate_password_hash("pw", rounds=4)
+    metrics.refresh()
+    metrics.refresh()
+
+    assert sample("bcrypt_pool_events_total", stat="completed") == completed + 1
+    assert sample("password_hash_duration_seconds_count") == hashed + 1
+
+
+def test_ping_live(test_app):
+    client = test_app.test_client()
+    res = client.get("/ping/live")
+    data = json.loads(res.data.decode())
+    assert res.status_code == 200
+    assert "success" in data["status"]
+
+
+def test_ping_ready(test_app, monkeypatch):
+    probes = []
+    probe = readiness._probe
+    monkeypatch.setattr(readiness, "_result", None)
+    monkeypatch.setattr(readiness, "_probe", lambda: probes.append(1) or probe())
+
+    client = test_app.test_client()
+    res = client.get("/ping/ready")
+    data = json.loads(res.data.decode())
+    client.get("/ping/ready")
+
+    assert res.status_code == 200
+    assert "success" in data["status"]
+    assert "ok" in data["database"]
+    assert data["pool_saturation"] == 0
+    assert len(probes) == 1
+
+
+@pytest.mark.parametrize(
+    "engine_options",
+    [
+        {"poolclass": pool.StaticPool},
+        {"poolclass": pool.NullPool},
+        {"poolclass": pool.SingletonThreadPool},
+        {"poolclass": pool.QueuePool, "pool_size": 2, "max_overflow": -1},
+    ],
+)
+def test_ping_ready_without_pool_capacity(test_app, monkeypatch, engine_options):
+    engine = create_engine("sqlite://", **engine_options)
+    monkeypatch.setitem(db.engines, None, engine)
+    monkeypatch.setattr(readiness, "_result", None)
+
+    client = test_app.test_client()
+    with engine.connect():
+        res = client.get("/ping/ready")
+    data = json.loads(res.data.decode())
+    engine.dispose()
+
+    assert res.status_code == 200
+    assert "ok" in data["database"]
+    assert data["pool_saturation"] == 0
+
+
+def test_ping_ready_database_unavailable(test_app, monkeypatch):
+    def broken_probe():
+        return {"status": "fail", "database": "unavailable", "pool_saturation": 0}
+
+    monkeypatch.setattr(readiness, "_result", None)
+    monkeypatch.setattr(readiness, "_probe", broken_probe)
+
+    client = test_app.test_client()
+    res = client.get("/ping/ready")
+    data = json.loads(res.data.decode())
+
+    assert res.status_code == 503
+    assert "unavailable" in data["database"]
+
+
+def test_routes_registered_once(test_app):
+    rules = Counter(rule.rule for rule in test_app.url_map.iter_rules())
+
+    assert [rule for rule, count in rules.items() if count > 1] == []
+    assert rules["/swagger.json"] == 1
+    assert rules["/doc"] == 1
+
+
+def test_swagger_ui_disabled(monkeypatch):
+    monkeypatch.setattr(BaseConfig, "SWAGGER_UI", False)
+    app = create_app()
+    client = app.test_client()
+
+    assert client.get("/doc").status_code == 404
+    assert client.get("/swagger.json").status_code == 200
@@ -3,6 +3,9 @@ import json
 import pytest
 from flask import current_app
 
+from src import token_cache
+from src.api.users.crud import update_user
+
 
 def test_user_registration(test_app, test_database):
     client = test_app.test_client()
@@ -23,12 +26,12 @@ def test_user_registration(test_app, test_database):
 
 
 def test_user_registration_duplicate_email(test_app, test_database, add_user):
-    add_user("you", "me@user.com", "testpassword")
+    add_user("you", "you@user.com", "testpassword")
     client = test_app.test_client()
     res = client.post(
         "/auth/register",
         data=json.dumps(
-            {"username": "me", "email": "me@user.com", "password": "testpassword"}
+            {"username": "me", "email": "YOU@user.com", "password": "testpassword"}
         ),
         content_type="application/json",
     )
@@ -188,3 +191,34 @@ def test_invalid_status(test_app, test_database):
     assert res.status_code == 401
     assert res.content_type == "application/json"
     assert "Invalid token. Please log in again." in data["message"]
+
+
+def test_user_status_cached(test_app, test_database, add_user):
+    user = add_user("us", "us@user.com", "testpassword")
+    token = user.encode_token(user.id, "access")
+    client = test_app.test_client()
+    hits = token_cache.stats()["hits"]
+
+    for _ in range(2):
+        res = client.get("/auth/status", headers={"Authorization": f"Bearer {token}"})
+        data = json.loads(res.data.decode())
+
+        assert res.status_code == 200
+        assert "us@user.com" in data["email"]
+
+    assert token_cache.stats()["hits"] == hits + 1
+
+
+def test_user_status_cache_invalidated_on_update(test_app, test_database, add_user):
+    user = add_user("them", "them@user.com", "testpassword")
+    token = user.encode_token(user.id, "access")
+    client = test_app.test_client()
+    client.get("/auth/status", headers={"Authorization": f"Bearer {token}"})
+
+    update_user(user, "renamed", "renamed@user.com")
+    res = client.get("/auth/status", headers={"Authorization": f"Bearer {token}"})
+    data = json.loads(res.data.decode())
+
+    assert res.status_code == 200
+    assert "renamed" in data["username"]
+    assert "renamed@user.com" in data["email"]
@@ -0,0 +1,148 @@
+import json
+import os
+import subprocess
+import sys
+import time
+
+from src import bcrypt, hasher
+from src.api.users.models import User
+
+
+def test_generate_and_check_password_hash(test_app):
+    pw_hash = hasher.generate_password_hash("testpassword")
+
+    assert bcrypt.check_password_hash(pw_hash, "testpassword")
+    assert hasher.check_password_hash(pw_hash, "testpassword")
+    assert not hasher.check_password_hash(pw_hash, "wrongpassword")
+
+
+def test_hasher_stats(test_app):
+    completed = hasher.stats()["completed"]
+    hasher.generate_password_hash("testpassword")
+    stats = hasher.stats()
+
+    assert stats["completed"] == completed + 1
+    assert stats["in_flight"] == 0
+    assert stats["queue_depth"] == 0
+    assert stats["latency_seconds_sum"] > 0
+
+
+def test_needs_rehash(test_app, monkeypatch):
+    pw_hash = hasher.generate_password_hash("testpassword")
+
+    assert not hasher.needs_rehash(pw_hash)
+    monkeypatch.setitem(test_app.config, "BCRYPT_LOG_ROUNDS", 5)
+    assert hasher.needs_rehash(pw_hash)
+    monkeypatch.setitem(test_app.config, "BCRYPT_LOG_ROUNDS", 4)
+    monkeypatch.setitem(test_app.config, "PASSWORD_HASH_SCHEME", "argon2")
+    assert hasher.needs_rehash(pw_hash)
+
+
+def test_argon2(test_app, monkeypatch):
+    monkeypatch.setitem(test_app.config, "PASSWORD_HASH_SCHEME", "argon2")
+    monkeypatch.setitem(test_app.config, "ARGON2_TIME_COST", 1)
+    monkeypatch.setitem(test_app.config, "ARGON2_MEMORY_COST", 1024)
+    pw_hash = hasher.generate_password_hash("testpassword")
+
+    assert pw_hash.startswith("$argon2id$")
+    assert hasher.check_password_hash(pw_hash, "testpassword")
+    assert not hasher.check_password_hash(pw_hash, "wrongpassword")
+    assert not hasher.needs_rehash(pw_hash)
+    monkeypatch.setitem(test_app.config, "ARGON2_TIME_COST", 2)
+    assert hasher.needs_rehash(pw_hash)
+
+
+def test_login_upgrades_password_hash(test_app, test_database, add_user, monkeypatch):
+    user = add_user("upgrade", "upgrade@user.com", "testpassword")
+    old_hash = user.password
+    monkeypatch.setitem(test_app.config, "PASSWORD_HASH_SCHEME", "argon2")
+    monkeypatch.setitem(test_app.config, "ARGON2_TIME_COST", 1)
+    monkeypatch.setitem(test_app.config, "ARGON2_MEMORY_COST", 1024)
+    futures = []
+    upgrade = hasher.upgrade_password_hash
+    monkeypatch.setattr(
+        hasher,
+        "upgrade_password_hash",
+        lambda *args: futures.append(upgrade(*args)) or futures[-1],
+    )
+
+    client = test_app.test_client()
+    res = client.post(
+        "/auth/login",
+        data=json.dumps({"email": "upgrade@user.com", "password": "testpassword"}),
+        content_type="application/json",
+    )
+    futures[0].result(timeout=5)
+    # the store callback runs right after the hash completes
+    for _ in range(50):
+        test_database.session.expire_all()
+        if test_database.session.get(User, user.id).password != old_hash:
+            break
+        time.sleep(0.1)
+
+    assert res.status_code == 200
+    new_hash = test_database.session.get(User, user.id).password
+    assert new_hash.startswith("$argon2id$")
+    assert hasher.check_password_hash(new_hash, "testpassword")
+    assert hasher.upgrade_password_hash(new_hash, "testpassword", None) is None
+
+
+def test_login_pool_full(test_app, test_database, add_user, monkeypatch):
+    add_user("busy", "busy@user.com", "testpassword")
+    monkeypatch.setitem(test_app.config, "BCRYPT_POOL_SIZE", 1)
+    monkeypatch.setitem(test_app.config, "BCRYPT_QUEUE_SIZE", 0)
+    monkeypatch.setitem(test_app.config, "BCRYPT_QUEUE_TIMEOUT", 0)
+    _, slots = hasher._get_executor()
+    slots.acquire()
+    rejected = hasher.stats()["rejected"]
+    try:
+        client = test_app.test_client()
+        res = client.post(
+            "/auth/login",
+            data=json.dumps({"email": "busy@user.com", "password": "testpassword"}),
+            content_type="application/json",
+        )
+        data = json.loads(res.data.decode())
+    finally:
+        slots.release()
+
+    assert res.status_code == 503
+    assert res.headers["Retry-After"] == "1"
+    assert "Too many password operations" in data["message"]
+    assert hasher.stats()["rejected"] == rejected + 1
+
+
+# a gevent worker: many greenlets hashing through a small pool
+GEVENT_CHILD = """
+from gevent import monkey
+monkey.patch_all()
+import gevent
+from src import create_app, hasher
+app = create_app()
+app.config.from_object("src.config.TestingConfig")
+app.config.update(BCRYPT_POOL_SIZE=1, BCRYPT_QUEUE_SIZE=4, BCRYPT_QUEUE_TIMEOUT=5)
+def login():
+    with app.app_context():
+        return hasher.generate_password_hash("pw")
+gevent.joinall([gevent.spawn(login) for _ in range(300)], raise_error=True)
+gevent.sleep(0.1)
+with app.app_context():
+    print(hasher.stats()["in_flight"])
+"""
+
+
+def test_pool_slots_released_under_gevent():
+    root = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
+    env = dict(os.environ, PYTHONPATH=root)
+    result = subprocess.run(
+        [sys.executable, "-c", GEVENT_CHILD],
+        capture_output=True,
+        text=True,
+        env=env,
+        cwd=root,
+        timeout=120,
+    )
+
+    assert result.returncode == 0, result.stderr
+    assert "BlockingSwitchOutError" not in result.stderr
+    assert result.stdout.strip() == "0"
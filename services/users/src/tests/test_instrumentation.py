@@ -0,0 +1,68 @@
+import json
+import logging
+
+import pytest
+from flask import current_app
+from sqlalchemy import exc, text
+
+
+def test_server_timing_header(test_app, test_database, add_user):
+    user = add_user("timed", "timed@user.com", "testpassword")
+    client = test_app.test_client()
+    res = client.get(f"/users/{user.id}")
+
+    assert res.status_code == 200
+    assert 'desc="1 queries"' in res.headers["Server-Timing"]
+    assert "app;dur=" in res.headers["Server-Timing"]
+
+
+def test_request_log(test_app, test_database, caplog):
+    client = test_app.test_client()
+    with caplog.at_level(logging.INFO, logger="src.instrumentation"):
+        client.get("/users/999")
+
+    record = json.loads(caplog.records[-1].getMessage())
+    assert record["event"] == "request"
+    assert record["endpoint"] == "users_users"
+    assert record["status"] == 404
+    assert record["db_queries"] == 1
+    assert "FROM users" in record["slowest_query"]
+
+
+def test_slow_query_log(test_app, test_database, caplog):
+    current_app.config["SLOW_QUERY_THRESHOLD_MS"] = 0
+    client = test_app.test_client()
+    try:
+        with caplog.at_level(logging.WARNING, logger="src.instrumentation"):
+            client.get("/users/999")
+    finally:
+        current_app.config["SLOW_QUERY_THRESHOLD_MS"] = 100
+
+    record = json.loads(caplog.records[-1].getMessage())
+    assert record["event"] == "slow_query"
+    assert record["endpoint"] == "users_users"
+    assert "FROM users" in record["statement"]
+
+
+def test_failed_statement_leaves_no_state(test_app, test_database):
+    with test_database.engine.connect() as conn:
+        with pytest.raises(exc.OperationalError):
+            conn.execute(text("SELECT * FROM no_such_table"))
+        conn.rollback()
+
+        assert "query_start" not in conn.info
+        assert conn.execute(text("SELECT 1")).scalar() == 1
+
+
+def test_failed_write_still_counts_later_queries(test_app, test_database, add_user):
+    add_user("twice", "twice@user.com", "testpassword")
+    client = test_app.test_client()
+    body = json.dumps(
+        {"username": "twice", "email": "twice@user.com", "password": "pw"}
+    )
+    for _ in range(3):
+        res = client.post("/users", data=body, content_type="application/json")
+        assert res.status_code == 400
+
+    res = client.get("/users/999")
+    assert 'desc="1 queries"' in res.headers["Server-Timing"]
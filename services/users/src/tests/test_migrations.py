@@ -0,0 +1,52 @@
+import pytest
+from sqlalchemy import text
+
+from src.api.users.crud import DuplicateEmailError, add_user, get_users_page
+from src.migrations import MigrationError, run_migrations
+
+
+def index_names(engine):
+    with engine.connect() as conn:
+        if conn.dialect.name == "postgresql":
+            query = "SELECT indexname FROM pg_indexes WHERE tablename = 'users'"
+        else:
+            query = "SELECT name FROM sqlite_master WHERE tbl_name = 'users'"
+        return set(conn.execute(text(query)).scalars())
+
+
+def test_run_migrations_adds_indexes(test_app, test_database):
+    with test_database.engine.begin() as conn:
+        conn.execute(text("DROP INDEX ix_users_email_lower_live"))
+        conn.execute(text("DROP INDEX ix_users_created_date_id_live"))
+        conn.execute(text("DROP INDEX ix_users_username_lower_id_live"))
+        conn.execute(text("DROP INDEX ix_users_deleted_at"))
+        conn.execute(text("DROP INDEX ix_users_active_created_date_id_live"))
+        conn.execute(text("ALTER TABLE users DROP COLUMN deleted_at"))
+        conn.execute(text("DROP TABLE user_events"))
+
+    run_migrations(test_database.engine, echo=lambda message: None)
+    run_migrations(test_database.engine, echo=lambda message: None)
+
+    indexes = index_names(test_database.engine)
+    assert "ix_users_email_lower_live" in indexes
+    assert "ix_users_deleted_at" in indexes
+    assert "ix_users_active_created_date_id_live" in indexes
+    assert "ix_users_email_lower" not in indexes
+    assert "ix_users_created_date_id" not in indexes
+    add_user("indexed", "indexed@user.com", "testpassword")
+    with pytest.raises(DuplicateEmailError):
+        add_user("indexed", "Indexed@User.com", "testpassword")
+    assert len(get_users_page(10)) == 1
+    assert len(get_users_page(10, sort="username", username="ind")) == 1
+
+
+def test_run_migrations_duplicate_emails(test_app, test_database, add_user):
+    with test_database.engine.begin() as conn:
+        conn.execute(text("DROP INDEX ix_users_email_lower_live"))
+    add_user("dupe", "dupe@user.com", "testpassword")
+    add_user("dupe", "DUPE@user.com", "testpassword")
+
+    with pytest.raises(MigrationError) as e:
+        run_migrations(test_database.engine, echo=lambda message: None)
+
+    assert "dupe@user.com" in str(e.value)
@@ -0,0 +1,215 @@
+import json
+import threading
+
+import pytest
+
+from src import db, outbox
+from src.api.users.crud import add_users
+from src.api.users.models import UserEvent
+from src.outbox import FileSink, NullSink, QueueSink, make_sink
+
+
+def head(client):
+    """The users version from the ETag of the list, where a consumer starts."""
+    return int(client.get("/users").headers["ETag"].strip('"').split("-")[1])
+
+
+def changes(client, since, limit=None):
+    url = f"/users/changes?since={since}"
+    if limit is not None:
+        url += f"&limit={limit}"
+    return client.get(url)
+
+
+def use_sink(app, monkeypatch, url):
+    """A fresh sink, after dropping what earlier tests left unpublished."""
+    monkeypatch.setitem(app.config, "OUTBOX_SINK", "")
+    outbox.drain()
+    monkeypatch.setitem(app.config, "OUTBOX_SINK", url)
+    app.extensions.pop("outbox_sink", None)
+    return outbox.get_sink()
+
+
+def test_changes_feed(test_app, test_database):
+    client = test_app.test_client()
+    since = head(client)
+    res = client.post(
+        "/users",
+        data=json.dumps(
+            {"username": "feed", "email": "feed@feed.com", "password": "pw"}
+        ),
+        content_type="application/json",
+    )
+    assert res.status_code == 201
+    user_id = client.get("/users").json[-1]["id"]
+    client.put(
+        f"/users/{user_id}",
+        data=json.dumps({"username": "fed", "email": "fed@feed.com"}),
+        content_type="application/json",
+    )
+    client.delete(f"/users/{user_id}")
+
+    res = changes(client, since)
+    data = res.json
+
+    assert res.status_code == 200
+    assert [change["type"] for change in data["changes"]] == [
+        "created",
+        "updated",
+        "deleted",
+    ]
+    created, updated, deleted = data["changes"]
+    assert created["user"]["email"] == "feed@feed.com"
+    assert created["user"]["active"] is True
+    assert created["user"]["version"] == 1
+    assert updated["user"]["username"] == "fed"
+    assert updated["user"]["version"] == 2
+    assert deleted["user"] == {"id": user_id}
+    assert created["version"] < updated["version"] < deleted["version"]
+    assert data["cursor"] == deleted["version"] == head(client)
+
+    empty = changes(client, data["cursor"]).json
+    assert empty == {"changes": [], "cursor": data["cursor"]}
+
+
+def test_changes_pages_keep_whole_versions(test_app, test_database):
+    client = test_app.test_client()
+    since = head(client)
+    rows = [
+        {"username": f"bulk{i}", "email": f"bulk{i}@feed.com", "password": "x"}
+        for i in range(3)
+    ]
+    add_users(rows[:2])
+    add_users(rows[2:])
+
+    first = changes(client, since, limit=1).json
+    second = changes(client, first["cursor"], limit=1).json
+
+    assert [change["user"]["email"] for change in first["changes"]] == [
+        "bulk0@feed.com",
+        "bulk1@feed.com",
+    ]
+    assert [change["user"]["email"] for change in second["changes"]] == [
+        "bulk2@feed.com"
+    ]
+    assert changes(client, second["cursor"]).json["changes"] == []
+
+
+def test_changes_invalid_since(test_app, test_database):
+    client = test_app.test_client()
+
+    assert changes(client, -1).status_code == 400
+    assert changes(client, "abc").status_code == 400
+
+
+def test_publish_to_queue(test_app, test_database, add_user, monkeypatch):
+    sink = use_sink(test_app, monkeypatch, "queue")
+    add_user("queued", "queued@feed.com", "testpassword")
+
+    assert outbox.drain() == 1
+    batch = sink.queue.get_nowait()
+    assert [event["user"]["email"] for event in batch] == ["queued@feed.com"]
+    assert outbox.drain() == 0
+    assert sink.queue.empty()
+
+
+def test_failed_send_is_retried(test_app, test_database, add_user, monkeypatch):
+    sink = use_sink(test_app, monkeypatch, "queue")
+    add_user("retried", "retried@feed.com", "testpassword")
+
+    def broken_send(events):
+        raise ConnectionError("sink unavailable")
+
+    with monkeypatch.context() as patched:
+        patched.setattr(sink, "send", broken_send)
+        with pytest.raises(ConnectionError):
+            outbox.publish()
+
+    assert outbox.publish() == 1
+    assert sink.queue.get_nowait()[0]["user"]["email"] == "retried@feed.com"
+
+
+def test_publish_to_file(test_app, test_database, add_user, monkeypatch, tmp_path):
+    path = tmp_path / "events.ndjson"
+    use_sink(test_app, monkeypatch, f"file://{path}")
+    add_user("filed", "filed@feed.com", "testpassword")
+    add_user("filed2", "filed2@feed.com", "testpassword")
+    outbox.drain()
+
+    events = [json.loads(line) for line in path.read_text().splitlines()]
+    assert [event["user"]["email"] for event in events] == [
+        "filed@feed.com",
+        "filed2@feed.com",
+    ]
+    assert events[0]["version"] < events[1]["version"]
+
+
+def test_purge(test_app, test_database, add_user, monkeypatch):
+    client = test_app.test_client()
+    use_sink(test_app, monkeypatch, "")
+    add_user("purged", "purged@feed.com", "testpassword")
+    outbox.drain()
+    add_user("kept", "kept@feed.com", "testpassword")
+    current = head(client)
+
+    monkeypatch.setitem(test_app.config, "OUTBOX_RETENTION_SECONDS", -1)
+    assert outbox.purge() > 0
+
+    remaining = db.session.execute(db.select(UserEvent.user_id)).scalars().all()
+    assert len(remaining) == 1
+    assert changes(client, 0).status_code == 410
+    res = changes(client, current - 1)
+    assert res.status_code == 200
+    assert [change["user"]["email"] for change in res.json["changes"]] == [
+        "kept@feed.com"
+    ]
+
+
+def test_null_sink_marks_events_published(
+    test_app, test_database, add_user, monkeypatch
+):
+    client = test_app.test_client()
+    use_sink(test_app, monkeypatch, "")
+    since = head(client)
+    add_user("dropped", "dropped@feed.com", "testpassword")
+
+    assert outbox.drain() == 1
+    unpublished = db.select(UserEvent).where(UserEvent.published_at.is_(None))
+    assert db.session.execute(unpublished).first() is None
+    feed = changes(client, since).json["changes"]
+    assert [change["user"]["email"] for change in feed] == ["dropped@feed.com"]
+
+
+@pytest.mark.parametrize(
+    "url, interval, name",
+    [("", 3600, "outbox-purger"), ("queue", 1, "outbox-publisher")],
+)
+def test_publisher_interval(test_app, monkeypatch, url, interval, name):
+    threads = []
+
+    class Thread:
+        def __init__(self, target, args, name, daemon):
+            threads.append((args[1], name))
+
+        def start(self):
+            pass
+
+    monkeypatch.setitem(test_app.config, "OUTBOX_SINK", url)
+    monkeypatch.setitem(test_app.config, "OUTBOX_PUBLISH_INTERVAL", 1)
+    monkeypatch.setitem(test_app.config, "OUTBOX_PURGE_INTERVAL", 3600)
+    monkeypatch.setattr(outbox, "_publisher_pid", None)
+    monkeypatch.setattr(threading, "Thread", Thread)
+    test_app.extensions.pop("outbox_sink", None)
+
+    outbox._ensure_publisher()
+
+    assert threads == [(interval, name)]
+
+
+def test_make_sink(tmp_path):
+    assert isinstance(make_sink(""), NullSink)
+    assert isinstance(make_sink("queue", 5), QueueSink)
+    assert make_sink(f"file://{tmp_path}/a.ndjson").path == f"{tmp_path}/a.ndjson"
+    assert isinstance(make_sink("file:events.ndjson"), FileSink)
+    with pytest.raises(ValueError):
+        make_sink("kafka://broker")
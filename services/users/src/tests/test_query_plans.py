@@ -0,0 +1,142 @@
+import re
+
+import pytest
+from sqlalchemy import event, func, select
+
+from src.api.users.crud import LIVE
+from src.api.users.models import User
+
+# a full table scan in SQLite and in Postgres
+FULL_SCAN = re.compile(r"^SCAN users$|Seq Scan on users", re.M)
+# the whole result is sorted instead of being read in index order
+SORTED = re.compile(r"TEMP B-TREE FOR ORDER BY|(?<!Incremental )Sort  \(")
+
+
+@pytest.fixture
+def query_plan(test_app, test_database):
+    """Requests a URL and returns the plan of the users page query it ran."""
+    engine = test_database.engine
+
+    def _query_plan(url):
+        statements = []
+
+        def capture(conn, cursor, statement, parameters, context, many):
+            if "sort_key" in statement:
+                statements.append((statement, parameters))
+
+        event.listen(engine, "before_cursor_execute", capture)
+        try:
+            assert test_app.test_client().get(url).status_code == 200
+        finally:
+            event.remove(engine, "before_cursor_execute", capture)
+
+        statement, parameters = statements[-1]
+        with engine.connect() as conn:
+            if conn.dialect.name == "postgresql":
+                # tiny test tables are always cheaper to scan; only an
+                # unusable index can make the planner pick one now
+                conn.exec_driver_sql("SET enable_seqscan = off")
+                rows = conn.exec_driver_sql(f"EXPLAIN {statement}", parameters)
+                return "\n".join(row[0] for row in rows)
+            rows = conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters)
+            return "\n".join(row[-1] for row in rows)
+
+    return _query_plan
+
+
+@pytest.mark.parametrize(
+    "query",
+    [
+        "sort=created_date",
+        "sort=-created_date",
+        "sort=username",
+        "sort=-username",
+        "sort=email",
+        "sort=-email",
+        "sort=username&cursor=a3Jpc3RpYW58Mg==",
+        "sort=-created_date&cursor=MjAyMC0wMS0wMVQwMDowMDowMHwy",
+    ],
+)
+def test_sorted_pages_read_in_index_order(query_plan, query):
+    plan = query_plan(f"/users?limit=10&{query}")
+
+    assert not FULL_SCAN.search(plan), plan
+    assert not SORTED.search(plan), plan
+
+
+def search(index):
+    """SQLite looking rows up through ``index``."""
+    return rf"^SEARCH users USING INDEX {index} \("
+
+
+def index_scan(index):
+    """Postgres looking rows up through ``index``."""
+    return rf"Index (Only )?Scan using {index} on users"
+
+
+def bitmap_scan(*indexes):
+    """Postgres matching through every one of the trigram ``indexes``."""
+    return "(?s)" + ".*".join(f"Bitmap Index Scan on {index}" for index in indexes)
+
+
+# query -> the (SQLite, Postgres) plan its filter must produce; "no full scan"
+# alone would also accept a SCAN ... USING INDEX that reads every row
+FILTER_PLANS = {
+    "username=kri": (
+        search("ix_users_username_lower_id_live"),
+        bitmap_scan("ix_users_username_trgm"),
+    ),
+    "email=kri": (
+        search("ix_users_email_lower_live"),
+        bitmap_scan("ix_users_email_trgm"),
+    ),
+    # SQLite cannot index a substring: it reads in created_date order and the
+    # limit ends the scan (see filter_users)
+    "q=kri": (
+        r"^SCAN users USING INDEX ix_users_created_date_id_live$",
+        bitmap_scan("ix_users_username_trgm", "ix_users_email_trgm"),
+    ),
+    "active=true": (
+        search("ix_users_active_created_date_id_live"),
+        index_scan("ix_users_active_created_date_id_live"),
+    ),
+    "active=false": (
+        search("ix_users_active_created_date_id_live"),
+        index_scan("ix_users_active_created_date_id_live"),
+    ),
+    "created_from=2020-01-01&created_before=2021-01-01": (
+        search("ix_users_created_date_id_live"),
+        index_scan("ix_users_created_date_id_live"),
+    ),
+    "username=kri&sort=-email": (
+        search("ix_users_username_lower_id_live"),
+        bitmap_scan("ix_users_username_trgm"),
+    ),
+}
+
+
+@pytest.mark.parametrize("query", list(FILTER_PLANS))
+def test_filtered_pages_use_indexes(query_plan, test_database, query):
+    plan = query_plan(f"/users?limit=10&{query}")
+    sqlite, postgresql = FILTER_PLANS[query]
+    postgres = test_database.engine.dialect.name == "postgresql"
+
+    assert not FULL_SCAN.search(plan), plan
+    assert re.search(postgresql if postgres else sqlite, plan, re.M), plan
+
+
+def test_email_lookup_uses_live_index(test_app, test_database):
+    statement = select(User.id).where(func.lower(User.email) == "kri@kri.com", LIVE)
+    sql = str(
+        statement.compile(test_database.engine, compile_kwargs={"literal_binds": True})
+    )
+    with test_database.engine.connect() as conn:
+        if conn.dialect.name == "postgresql":
+            conn.exec_driver_sql("SET enable_seqscan = off")
+            rows = conn.exec_driver_sql(f"EXPLAIN {sql}")
+            plan = "\n".join(row[0] for row in rows)
+        else:
+            rows = conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {sql}")
+            plan = "\n".join(row[-1] for row in rows)
+
+    assert "ix_users_email_lower_live" in plan, plan
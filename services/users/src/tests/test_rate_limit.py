@@ -0,0 +1,94 @@
+import json
+import sqlite3
+
+import pytest
+from werkzeug.exceptions import TooManyRequests
+
+from src.rate_limit import RateLimiter
+
+
+def login(client, email, ip="10.0.0.1"):
+    return client.post(
+        "/auth/login",
+        data=json.dumps({"email": email, "password": "testpassword"}),
+        content_type="application/json",
+        headers={"X-Forwarded-For": ip},
+    )
+
+
+def test_login_rate_limited_per_email(test_app, test_database, add_user, monkeypatch):
+    monkeypatch.setitem(test_app.config, "LOGIN_RATE_LIMIT_PER_EMAIL", "2/60")
+    add_user("limited", "limited@user.com", "testpassword")
+    client = test_app.test_client()
+
+    assert login(client, "limited@user.com", "10.0.0.1").status_code == 200
+    assert login(client, "LIMITED@user.com", "10.0.0.2").status_code == 200
+    res = login(client, "limited@user.com", "10.0.0.3")
+    data = json.loads(res.data.decode())
+
+    assert res.status_code == 429
+    assert res.headers["Retry-After"] == "30"
+    assert "Too many attempts" in data["message"]
+
+
+def test_login_rate_limited_per_ip(test_app, test_database, monkeypatch):
+    monkeypatch.setitem(test_app.config, "LOGIN_RATE_LIMIT_PER_IP", "3/60")
+    client = test_app.test_client()
+
+    for i in range(3):
+        assert login(client, f"nobody{i}@user.com", "10.0.1.1").status_code == 404
+    assert login(client, "nobody@user.com", "10.0.1.1").status_code == 429
+    assert login(client, "nobody@user.com", "10.0.1.2").status_code == 404
+
+
+@pytest.mark.parametrize("storage", ["memory", "sqlite"])
+def test_rate_limiter_refills(test_app, tmp_path, monkeypatch, storage):
+    if storage == "sqlite":
+        storage = str(tmp_path / "rate-limit.db")
+    monkeypatch.setitem(test_app.config, "RATE_LIMIT_STORAGE", storage)
+    limiter = RateLimiter()
+    now = [1000.0]
+    monkeypatch.setattr("src.rate_limit.time.time", lambda: now[0])
+
+    limiter.limit("key", "2/10")
+    limiter.limit("key", "2/10")
+    with pytest.raises(TooManyRequests) as e:
+        limiter.limit("key", "2/10")
+    assert e.value.retry_after == 5
+
+    now[0] += 5
+    limiter.limit("key", "2/10")
+    with pytest.raises(TooManyRequests):
+        limiter.limit("key", "2/10")
+
+
+def test_rate_limiter_shared_between_workers(test_app, tmp_path, monkeypatch):
+    monkeypatch.setitem(
+        test_app.config, "RATE_LIMIT_STORAGE", str(tmp_path / "rate-limit.db")
+    )
+    first, second = RateLimiter(), RateLimiter()
+
+    first.limit("key", "1/60")
+    with pytest.raises(TooManyRequests):
+        second.limit("key", "1/60")
+
+
+def test_rate_limiter_falls_back_when_locked(test_app, tmp_path, monkeypatch):
+    path = str(tmp_path / "rate-limit.db")
+    monkeypatch.setitem(test_app.config, "RATE_LIMIT_STORAGE", path)
+    limiter = RateLimiter()
+    limiter.limit("key", "1/60")
+
+    holder = sqlite3.connect(path, isolation_level=None)
+    holder.execute("BEGIN EXCLUSIVE")
+    try:
+        # the process's own bucket still limits while the file is locked
+        limiter.limit("key", "1/60")
+        with pytest.raises(TooManyRequests):
+            limiter.limit("key", "1/60")
+    finally:
+        holder.rollback()
+        holder.close()
+
+    with pytest.raises(TooManyRequests):
+        limiter.limit("key", "1/60")
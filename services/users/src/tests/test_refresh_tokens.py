@@ -0,0 +1,129 @@
+import datetime
+import json
+
+from src import refresh_tokens, token_cache
+from src.api.users.models import RefreshToken, User
+from src.refresh_tokens import BloomFilter
+
+
+def login(client, email):
+    res = client.post(
+        "/auth/login",
+        data=json.dumps({"email": email, "password": "testpassword"}),
+        content_type="application/json",
+    )
+    return json.loads(res.data.decode())
+
+
+def refresh(client, refresh_token):
+    return client.post(
+        "/auth/refresh",
+        data=json.dumps({"refresh_token": refresh_token}),
+        content_type="application/json",
+    )
+
+
+def status(client, access_token):
+    return client.get(
+        "/auth/status", headers={"Authorization": f"Bearer {access_token}"}
+    )
+
+
+def test_bloom_filter():
+    bloom = BloomFilter(1 << 12, 5)
+    for key in ("a", "b", "c"):
+        bloom.add(key)
+
+    assert "a" in bloom
+    assert "c" in bloom
+    assert "d" not in bloom
+
+
+def test_refresh_rotates_token(test_app, test_database, add_user):
+    add_user("rotate", "rotate@user.com", "testpassword")
+    client = test_app.test_client()
+    tokens = login(client, "rotate@user.com")
+
+    res = refresh(client, tokens["refresh_token"])
+    data = json.loads(res.data.decode())
+
+    assert res.status_code == 200
+    assert data["refresh_token"] != tokens["refresh_token"]
+    assert refresh(client, data["refresh_token"]).status_code == 200
+
+
+def test_refresh_replay_revokes_family(test_app, test_database, add_user):
+    add_user("replay", "replay@user.com", "testpassword")
+    client = test_app.test_client()
+    tokens = login(client, "replay@user.com")
+    rotated = json.loads(refresh(client, tokens["refresh_token"]).data.decode())
+
+    res = refresh(client, tokens["refresh_token"])
+    data = json.loads(res.data.decode())
+
+    assert res.status_code == 401
+    assert "Token reuse detected. Please log in again." in data["message"]
+    assert refresh(client, rotated["refresh_token"]).status_code == 401
+    assert status(client, rotated["access_token"]).status_code == 401
+
+
+def test_refresh_rejects_access_token(test_app, test_database, add_user):
+    add_user("access", "access@user.com", "testpassword")
+    client = test_app.test_client()
+    tokens = login(client, "access@user.com")
+
+    res = refresh(client, tokens["access_token"])
+    data = json.loads(res.data.decode())
+
+    assert res.status_code == 401
+    assert "Invalid token. Please log in again." in data["message"]
+
+
+def test_logout_revokes_family(test_app, test_database, add_user):
+    add_user("logout", "logout@user.com", "testpassword")
+    client = test_app.test_client()
+    tokens = login(client, "logout@user.com")
+    other = login(client, "logout@user.com")
+
+    res = client.post(
+        "/auth/logout",
+        data=json.dumps({"refresh_token": tokens["refresh_token"]}),
+        content_type="application/json",
+    )
+
+    assert res.status_code == 204
+    assert refresh(client, tokens["refresh_token"]).status_code == 401
+    assert status(client, tokens["access_token"]).status_code == 401
+    assert status(client, other["access_token"]).status_code == 200
+
+
+def test_revocation_elsewhere_rejects_cached_token(test_app, test_database, add_user):
+    add_user("elsewhere", "elsewhere@user.com", "testpassword")
+    client = test_app.test_client()
+    tokens = login(client, "elsewhere@user.com")
+    assert status(client, tokens["access_token"]).status_code == 200
+    hits = token_cache.stats()["hits"]
+
+    # as another worker would: the family is revoked, this cache is not cleared
+    family = User.decode_token_payload(tokens["refresh_token"])["fam"]
+    refresh_tokens.revoke_family(family)
+
+    assert status(client, tokens["access_token"]).status_code == 401
+    assert token_cache.stats()["hits"] == hits + 1
+
+
+def test_compact_deletes_expired_tokens(test_app, test_database, add_user):
+    user = add_user("compact", "compact@user.com", "testpassword")
+    _, family = refresh_tokens.issue(user)
+    _, live_family = refresh_tokens.issue(user)
+    refresh_tokens.revoke_family(family)
+    refresh_tokens.revoke_family(live_family)
+    RefreshToken.query.filter_by(family=family).update(
+        {"expires_at": datetime.datetime.utcnow() - datetime.timedelta(seconds=1)}
+    )
+    test_database.session.commit()
+
+    assert refresh_tokens.compact() == 1
+    assert RefreshToken.query.filter_by(family=family).count() == 0
+    assert not refresh_tokens.is_revoked(family)
+    assert refresh_tokens.is_revoked(live_family)
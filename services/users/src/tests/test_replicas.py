@@ -0,0 +1,138 @@
+import json
+import math
+
+import pytest
+from sqlalchemy import create_engine, insert, update
+
+from src import db, replicas
+from src.api.users.models import User
+from src.replicas import STICKY_COOKIE, replica_engine_options
+
+
+@pytest.fixture
+def replica(test_app, test_database, tmp_path, monkeypatch):
+    """A second SQLite database standing in for a read replica; it holds a
+    user the primary does not have."""
+    url = f"sqlite:///{tmp_path}/replica.db"
+    engine = create_engine(url)
+    db.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(
+            insert(User.__table__).values(
+                username="replica", email="replica@replica.com", password="x"
+            )
+        )
+    engine.dispose()
+
+    monkeypatch.setitem(test_app.config, "SQLALCHEMY_REPLICA_URIS", [url])
+    monkeypatch.setitem(test_app.config, "REPLICA_CHECK_INTERVAL", 0)
+    yield url
+    forget_replicas(test_app)
+
+
+def forget_replicas(app):
+    replica_set = app.extensions.pop("replicas", None)
+    if replica_set is not None:
+        replica_set.dispose()
+
+
+def emails(res):
+    return [user["email"] for user in json.loads(res.data.decode())]
+
+
+def test_reads_go_to_replica(test_app, replica, add_user):
+    add_user("primary", "primary@primary.com", "testpassword")
+    client = test_app.test_client()
+
+    assert emails(client.get("/users?limit=10")) == ["replica@replica.com"]
+
+
+def test_read_your_writes(test_app, replica):
+    client = test_app.test_client()
+    res = client.post(
+        "/users",
+        data=json.dumps(
+            {"username": "sticky", "email": "sticky@user.com", "password": "pw"}
+        ),
+        content_type="application/json",
+    )
+
+    assert res.status_code == 201
+    assert "Max-Age=10" in res.headers["Set-Cookie"]
+    assert "sticky@user.com" in emails(client.get("/users?limit=10"))
+
+    client.delete_cookie("localhost", STICKY_COOKIE)
+    assert emails(client.get("/users?limit=10")) == ["replica@replica.com"]
+
+
+def test_failed_write_is_not_sticky(test_app, replica):
+    client = test_app.test_client()
+    res = client.post(
+        "/users", data=json.dumps({"email": "x"}), content_type="application/json"
+    )
+
+    assert res.status_code == 400
+    assert "Set-Cookie" not in res.headers
+
+
+def test_read_only_post_goes_to_replica(test_app, replica):
+    client = test_app.test_client()
+    res = client.post(
+        "/users/batch",
+        data=json.dumps({"emails": ["replica@replica.com"]}),
+        content_type="application/json",
+    )
+
+    assert res.json["missing"] == []
+    assert "Set-Cookie" not in res.headers
+
+
+def test_fallback_when_replica_down(test_app, test_database, tmp_path, monkeypatch):
+    monkeypatch.setitem(
+        test_app.config,
+        "SQLALCHEMY_REPLICA_URIS",
+        [f"sqlite:///{tmp_path}/missing/replica.db"],
+    )
+    client = test_app.test_client()
+    res = client.get("/users?limit=10")
+
+    assert res.status_code == 200
+    assert "replica@replica.com" not in emails(res)
+    forget_replicas(test_app)
+
+
+def test_fallback_when_replica_lags(test_app, replica, monkeypatch):
+    monkeypatch.setattr(replicas, "lag", lambda engine: math.inf)
+    client = test_app.test_client()
+
+    assert "replica@replica.com" not in emails(client.get("/users?limit=10"))
+
+    monkeypatch.setattr(replicas, "lag", lambda engine: 1)
+    assert emails(client.get("/users?limit=10")) == ["replica@replica.com"]
+
+
+def test_writes_in_routed_request_use_primary(test_app, replica):
+    with test_app.test_request_context("/users"):
+        test_app.preprocess_request()
+        replica_engine = db.session.get_bind(clause=User.__table__.select())
+
+        assert replica_engine.url.database.endswith("replica.db")
+        assert db.session.get_bind(clause=update(User)) is db.engine
+        locked = User.__table__.select().with_for_update()
+        assert db.session.get_bind(clause=locked) is db.engine
+        with replicas.primary():
+            assert db.session.get_bind(clause=User.__table__.select()) is db.engine
+
+
+def test_replica_engine_options_connect_timeout():
+    options = {"pool_size": 5, "connect_args": {"options": "-c statement_timeout=1"}}
+
+    postgres = replica_engine_options("postgresql://replica/users", options, 2.5)
+    assert postgres["connect_args"] == {
+        "options": "-c statement_timeout=1",
+        "connect_timeout": 3,
+    }
+    assert postgres["pool_size"] == 5
+    assert options["connect_args"] == {"options": "-c statement_timeout=1"}
+    assert replica_engine_options("sqlite:///replica.db", options, 2.5) is options
+    assert replica_engine_options("postgresql://replica/users", options, 0) is options
@@ -0,0 +1,82 @@
+import json
+from datetime import date, datetime
+
+from flask import jsonify
+from flask_restx import Model, fields, marshal
+
+from src.api.users.views import user
+from src.serializers import compile_serializer, dumps
+
+
+class Obj:
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+def test_compiled_serializer_matches_marshal(test_app):
+    serialize = compile_serializer(user)
+    created = datetime(2022, 11, 3, 12, 30, 15, 123456)
+    values = [
+        {"id": 1, "username": "dict", "email": "d@user.com", "created_date": created},
+        {"id": 2, "username": None, "email": "n@user.com", "created_date": None},
+        {"username": "missing"},
+        Obj(id=3, username="obj", email="o@user.com", created_date=created),
+        Obj(id="4", username=5, email="o@user.com", created_date=date(2022, 1, 1)),
+        Obj(),
+    ]
+
+    for value in values:
+        assert serialize(value) == marshal(value, user)
+
+
+def test_compiled_serializer_fallback_fields(test_app):
+    nested = Model("Nested", {"name": fields.String})
+    model = Model(
+        "Complex",
+        {
+            "renamed": fields.String(attribute="name"),
+            "count": fields.Integer(default=7),
+            "child": fields.Nested(nested, allow_null=True),
+            "tags": fields.List(fields.String),
+            "flag": fields.Boolean,
+        },
+    )
+    serialize = compile_serializer(model)
+    values = [
+        Obj(name="a", count=None, child=Obj(name="b"), tags=["x", 1], flag=0),
+        {"name": "c", "child": None, "tags": None},
+    ]
+
+    for value in values:
+        assert serialize(value) == marshal(value, model)
+
+
+def test_dumps(test_app):
+    data = [{"id": 1, "email": "é@user.com", "created": datetime(2022, 1, 1)}]
+
+    assert json.loads(dumps(data)) == [
+        {"id": 1, "email": "é@user.com", "created": "2022-01-01T00:00:00"}
+    ]
+    assert json.loads(dumps({1: "int key"})) == {"1": "int key"}
+
+
+def test_json_provider(test_app):
+    data = {"b": 1, "a": [datetime(2022, 1, 1)], "c": None}
+    with test_app.test_request_context():
+        body = jsonify(data).get_data(as_text=True)
+
+    assert list(json.loads(body)) == ["a", "b", "c"]
+    assert json.loads(body)["a"] == ["Sat, 01 Jan 2022 00:00:00 GMT"]
+
+
+def test_swagger_docs(test_app):
+    client = test_app.test_client()
+    res = client.get("/swagger.json")
+    spec = json.loads(res.data.decode())
+
+    assert res.status_code == 200
+    assert "User" in spec["definitions"]
+    get_user = spec["paths"]["/users/{user_id}"]["get"]
+    assert get_user["responses"]["200"]["schema"]["$ref"] == "#/definitions/User"
+    status = spec["paths"]["/auth/status"]["get"]
+    assert "schema" in status["responses"]["200"]
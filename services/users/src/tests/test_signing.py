@@ -0,0 +1,101 @@
+import json
+
+import jwt
+import pytest
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ed25519, rsa
+
+from src.api.users.models import User
+from src.verifier import TokenVerifier
+
+
+def write_key(path, kid, private_key):
+    pem = private_key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption(),
+    )
+    (path / f"{kid}.pem").write_bytes(pem)
+
+
+@pytest.fixture
+def keys_dir(test_app, tmp_path, monkeypatch):
+    write_key(tmp_path, "old", rsa.generate_private_key(65537, 2048))
+    write_key(tmp_path, "new", ed25519.Ed25519PrivateKey.generate())
+    monkeypatch.setitem(test_app.config, "JWT_KEYS_DIR", str(tmp_path))
+    monkeypatch.setitem(test_app.config, "JWT_KEY_ID", "old")
+    return tmp_path
+
+
+def test_sign_with_active_key(test_app, test_database, add_user, keys_dir):
+    user = add_user("signed", "signed@user.com", "testpassword")
+    token = user.encode_token(user.id, "access")
+    header = jwt.get_unverified_header(token)
+
+    assert header["kid"] == "old"
+    assert header["alg"] == "RS256"
+    assert User.decode_token(token) == user.id
+
+
+def test_rotate_signing_key(test_app, test_database, add_user, keys_dir):
+    user = add_user("rotated", "rotated@user.com", "testpassword")
+    old_token = user.encode_token(user.id, "access")
+
+    test_app.config["JWT_KEY_ID"] = "new"
+    new_token = user.encode_token(user.id, "access")
+
+    assert jwt.get_unverified_header(new_token)["alg"] == "EdDSA"
+    assert User.decode_token(new_token) == user.id
+    assert User.decode_token(old_token) == user.id
+
+    current = keys_dir / "current"
+    current.mkdir()
+    (keys_dir / "new.pem").rename(current / "new.pem")
+    test_app.config["JWT_KEYS_DIR"] = str(current)
+    with pytest.raises(jwt.InvalidTokenError):
+        User.decode_token(old_token)
+
+
+def test_jwks(test_app, keys_dir):
+    client = test_app.test_client()
+    res = client.get("/auth/jwks.json")
+    data = json.loads(res.data.decode())
+
+    assert res.status_code == 200
+    assert "max-age=300" in res.headers["Cache-Control"]
+    assert {key["kid"]: key["alg"] for key in data["keys"]} == {
+        "new": "EdDSA",
+        "old": "RS256",
+    }
+    assert all("d" not in key for key in data["keys"])
+
+
+def test_jwks_without_keys(test_app):
+    client = test_app.test_client()
+    res = client.get("/auth/jwks.json")
+
+    assert res.status_code == 200
+    assert json.loads(res.data.decode()) == {"keys": []}
+
+
+def test_verifier(test_app, test_database, add_user, keys_dir, monkeypatch):
+    user = add_user("verified", "verified@user.com", "testpassword")
+    client = test_app.test_client()
+    fetches = []
+
+    def fetch():
+        fetches.append(1)
+        return json.loads(client.get("/auth/jwks.json").data.decode())
+
+    verifier = TokenVerifier("http://users/auth/jwks.json")
+    monkeypatch.setattr(verifier, "fetch", fetch)
+
+    token = user.encode_token(user.id, "access")
+    assert verifier.verify(token)["sub"] == user.id
+    assert verifier.verify(token)["sub"] == user.id
+    assert len(fetches) == 1
+
+    with pytest.raises(jwt.InvalidTokenError):
+        verifier.verify(user.encode_token(user.id, "refresh"))
+    with pytest.raises(jwt.InvalidTokenError):
+        verifier.verify(jwt.encode({"sub": 1}, "secret", headers={"kid": "forged"}))
@@ -0,0 +1,122 @@
+import datetime
+import json
+
+from sqlalchemy import select
+
+from src import db, user_purger
+from src.api.users.models import User
+
+
+def login(client, email):
+    return client.post(
+        "/auth/login",
+        data=json.dumps({"email": email, "password": "testpassword"}),
+        content_type="application/json",
+    )
+
+
+def deleted_at(user_id):
+    statement = select(User.deleted_at).where(User.id == user_id)
+    return db.session.execute(statement).scalar()
+
+
+def test_deleted_user_is_hidden(test_app, test_database, add_user):
+    user = add_user("gone", "gone@user.com", "testpassword")
+    user_id = user.id
+    client = test_app.test_client()
+
+    assert client.delete(f"/users/{user_id}").status_code == 200
+
+    assert deleted_at(user_id) is not None
+    assert client.get(f"/users/{user_id}").status_code == 404
+    assert "gone@user.com" not in [
+        found["email"] for found in client.get("/users").json
+    ]
+    res = client.post(
+        "/users/batch",
+        data=json.dumps({"ids": [user_id]}),
+        content_type="application/json",
+    )
+    assert res.json["missing"] == [user_id]
+    assert login(client, "gone@user.com").status_code == 404
+    assert client.delete(f"/users/{user_id}").status_code == 404
+    res = client.put(
+        f"/users/{user_id}",
+        data=json.dumps({"username": "back", "email": "gone@user.com"}),
+        content_type="application/json",
+    )
+    assert res.status_code == 404
+
+
+def test_deleted_email_can_register_again(test_app, test_database, add_user):
+    user = add_user("again", "again@user.com", "testpassword")
+    client = test_app.test_client()
+    client.delete(f"/users/{user.id}")
+
+    res = client.post(
+        "/users",
+        data=json.dumps(
+            {"username": "again", "email": "Again@user.com", "password": "pw"}
+        ),
+        content_type="application/json",
+    )
+
+    assert res.status_code == 201
+
+
+def test_deleted_user_tokens_rejected(test_app, test_database, add_user):
+    user = add_user("tokens", "tokens@user.com", "testpassword")
+    client = test_app.test_client()
+    tokens = login(client, "tokens@user.com").json
+    headers = {"Authorization": f"Bearer {tokens['access_token']}"}
+    assert client.get("/auth/status", headers=headers).status_code == 200
+
+    client.delete(f"/users/{user.id}")
+
+    assert client.get("/auth/status", headers=headers).status_code == 401
+    res = client.post(
+        "/auth/refresh",
+        data=json.dumps({"refresh_token": tokens["refresh_token"]}),
+        content_type="application/json",
+    )
+    assert res.status_code == 401
+
+
+def test_inactive_user_cannot_log_in(test_app, test_database, add_user):
+    user = add_user("inactive", "inactive@user.com", "testpassword")
+    client = test_app.test_client()
+    tokens = login(client, "inactive@user.com").json
+    user.active = False
+    db.session.commit()
+
+    assert login(client, "inactive@user.com").status_code == 403
+    headers = {"Authorization": f"Bearer {tokens['access_token']}"}
+    assert client.get("/auth/status", headers=headers).status_code == 401
+
+
+def test_purge(test_app, test_database, add_user, monkeypatch):
+    client = test_app.test_client()
+    kept = add_user("kept", "kept@purge.com", "testpassword")
+    ids = [
+        add_user(f"purged{i}", f"purged{i}@purge.com", "testpassword").id
+        for i in range(3)
+    ]
+    for user_id in ids:
+        client.delete(f"/users/{user_id}")
+    recent = add_user("recent", "recent@purge.com", "testpassword").id
+    client.delete(f"/users/{recent}")
+    db.session.execute(
+        User.__table__.update()
+        .where(User.id.in_(ids))
+        .values(deleted_at=datetime.datetime.utcnow() - datetime.timedelta(days=31))
+    )
+    db.session.commit()
+    monkeypatch.setitem(test_app.config, "USERS_PURGE_BATCH_SIZE", 2)
+
+    assert user_purger.purge() == 3
+
+    remaining = db.session.execute(select(User.id)).scalars().all()
+    assert not set(ids) & set(remaining)
+    assert kept.id in remaining
+    assert recent in remaining
+    assert user_purger.purge() == 0
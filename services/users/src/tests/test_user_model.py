@@ -9,7 +9,7 @@ def test_passwords_are_random(test_app, test_database, add_user):
 
 
 def test_encode_token(test_app, test_database, add_user):
-    user = add_user("test_user", "test_user@test.com", "testpassword")
+    user = add_user("test_user_3", "test_user_3@test.com", "testpassword")
     token = user.encode_token(user.id, "access")
     token_two = user.encode_token(user.id, "")
 
@@ -18,7 +18,7 @@ def test_encode_token(test_app, test_database, add_user):
 
 
 def test_decode_token(test_app, test_database, add_user):
-    user = add_user("test_user", "test_user@test.com", "testpassword")
+    user = add_user("test_user_4", "test_user_4@test.com", "testpassword")
     token = user.encode_token(user.id, "access")
 
     assert isinstance(token, str)
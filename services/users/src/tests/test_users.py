@@ -1,11 +1,25 @@
 import json
+import sqlite3
+from datetime import datetime
 
 import pytest
+from sqlalchemy import event
 
-from src import bcrypt
-from src.api.users.crud import get_user_by_id
+from src import bcrypt, response_cache
 from src.api.users.models import User
 
+from src.api.users.crud import (  # isort:skip
+    MAX_PARAMETERS,
+    add_users,
+    get_all_users,
+    get_existing_emails,
+    get_user_by_id,
+    get_user_events,
+    get_user_row_by_id,
+    get_users_page,
+    get_users_version,
+)
+
 
 def test_add_user(test_app, test_database):
     client = test_app.test_client()
@@ -109,6 +123,378 @@ def test_all_users(test_app, test_database, add_user):
     assert "password" not in data[1]
 
 
+def test_read_queries_return_rows(test_app, test_database, add_user):
+    user_id = add_user("rows", "rows@user.com", "testpassword").id
+    test_database.session.expunge_all()
+
+    rows = [
+        get_user_row_by_id(user_id),
+        *get_all_users(),
+        *get_users_page(10),
+    ]
+
+    assert len(test_database.session.identity_map) == 0
+    for row in rows:
+        assert not isinstance(row, User)
+        assert "password" not in row._fields
+    assert rows[0].email == "rows@user.com"
+    assert rows[0].version == 1
+
+
+def test_all_users_etag(test_app, test_database, add_user):
+    add_user("etag", "etag@user.com", "testpassword")
+    client = test_app.test_client()
+    res = client.get("/users")
+    etag = res.headers["ETag"]
+
+    assert "public" in res.headers["Cache-Control"]
+    res = client.get("/users", headers={"If-None-Match": etag})
+    assert res.status_code == 304
+    assert res.data == b""
+    res = client.get("/users", headers={"If-None-Match": f"W/{etag}"})
+    assert res.status_code == 304
+
+    add_user("etag2", "etag2@user.com", "testpassword")
+    res = client.get("/users", headers={"If-None-Match": etag})
+    assert res.status_code == 200
+    assert res.headers["ETag"] != etag
+    assert "etag2@user.com" in [user["email"] for user in res.get_json()]
+
+
+def test_all_users_response_cache(test_app, test_database, add_user):
+    add_user("cached", "cached@user.com", "testpassword")
+    client = test_app.test_client()
+    hits = response_cache.stats()["hits"]
+
+    first = client.get("/users")
+    second = client.get("/users")
+
+    assert second.data == first.data
+    assert second.headers["ETag"] == first.headers["ETag"]
+    assert response_cache.stats()["hits"] == hits + 1
+
+
+def test_single_user_etag(test_app, test_database, add_user):
+    user = add_user("version", "version@user.com", "testpassword")
+    client = test_app.test_client()
+    etag = client.get(f"/users/{user.id}").headers["ETag"]
+
+    res = client.get(f"/users/{user.id}", headers={"If-None-Match": etag})
+    assert res.status_code == 304
+    res = client.get(f"/users/{user.id}", headers={"If-None-Match": f"W/{etag}"})
+    assert res.status_code == 304
+
+    client.put(
+        f"/users/{user.id}",
+        data=json.dumps({"username": "renamed", "email": "versioned@user.com"}),
+        content_type="application/json",
+    )
+    res = client.get(f"/users/{user.id}", headers={"If-None-Match": etag})
+    assert res.status_code == 200
+    assert res.headers["ETag"] != etag
+    assert "renamed" in res.get_json()["username"]
+
+
+def test_all_users_paginated(test_app, test_database, add_user):
+    test_database.session.query(User).delete()
+    add_user("leila", "leila@eskrima.com", "testpassword")
+    add_user("kristian", "kristian@arnis.com", "testpassword")
+    add_user("randy", "randy@arnis.com", "testpassword")
+    client = test_app.test_client()
+    res = client.get("/users?limit=2")
+    data = json.loads(res.data.decode())
+
+    assert res.status_code == 200
+    assert len(data) == 2
+    assert "leila" in data[0]["username"]
+    assert "kristian" in data[1]["username"]
+    assert 'rel="next"' in res.headers["Link"]
+
+    cursor = res.headers["X-Next-Cursor"]
+    res_two = client.get(f"/users?limit=2&cursor={cursor}")
+    data = json.loads(res_two.data.decode())
+
+    assert res_two.status_code == 200
+    assert len(data) == 1
+    assert "randy" in data[0]["username"]
+    assert "password" not in data[0]
+    assert "X-Next-Cursor" not in res_two.headers
+
+
+def test_all_users_invalid_cursor(test_app, test_database):
+    client = test_app.test_client()
+    res = client.get("/users?limit=2&cursor=invalid")
+    data = json.loads(res.data.decode())
+
+    assert res.status_code == 400
+    assert "Invalid cursor" in data["message"]
+
+
+@pytest.mark.parametrize("stream", ["ndjson", "json"])
+def test_all_users_stream(test_app, test_database, add_user, stream):
+    test_database.session.query(User).delete()
+    add_user("leila", "leila@eskrima.com", "testpassword")
+    add_user("kristian", "kristian@arnis.com", "testpassword")
+    client = test_app.test_client()
+    res = client.get(f"/users?stream={stream}")
+    body = res.data.decode()
+    if stream == "ndjson":
+        data = [json.loads(line) for line in body.splitlines()]
+    else:
+        data = json.loads(body)
+
+    assert res.status_code == 200
+    assert len(data) == 2
+    assert "leila@eskrima.com" in data[0]["email"]
+    assert "kristian@arnis.com" in data[1]["email"]
+    assert "password" not in data[0]
+
+
+@pytest.fixture
+def search_users(test_database, add_user):
+    test_database.session.query(User).delete()
+    add_user("Leila", "leila@eskrima.com", "testpassword")
+    add_user("kristian", "kristian@arnis.com", "testpassword")
+    add_user("randy", "randy@arnis.com", "testpassword")
+    add_user("100%", "percent@kali.com", "testpassword").active = False
+    test_database.session.commit()
+
+
+@pytest.mark.parametrize(
+    "query, usernames",
+    [
+        ("username=le", ["Leila"]),
+        ("username=LE", ["Leila"]),
+        ("email=k", ["kristian"]),
+        ("q=arnis", ["kristian", "randy"]),
+        ("q=an", ["kristian", "randy"]),
+        ("q=0%25", ["100%"]),
+        ("q=_", []),
+        ("active=false", ["100%"]),
+        ("active=true&q=a", ["Leila", "kristian", "randy"]),
+        ("sort=username", ["100%", "kristian", "Leila", "randy"]),
+        ("sort=-email", ["randy", "100%", "Leila", "kristian"]),
+    ],
+)
+def test_all_users_search(test_app, search_users, query, usernames):
+    client = test_app.test_client()
+    res = client.get(f"/users?{query}")
+
+    assert res.status_code == 200
+    assert [user["username"] for user in res.get_json()] == usernames
+
+
+def test_all_users_created_range(test_app, test_database, search_users):
+    randy = test_database.session.query(User).filter_by(username="randy").one()
+    randy.created_date = datetime(2020, 1, 1, 12)
+    test_database.session.commit()
+    client = test_app.test_client()
+
+    res = client.get("/users?created_from=2020-01-01&created_before=2020-01-02")
+    assert [user["username"] for user in res.get_json()] == ["randy"]
+
+    res = client.get("/users?created_before=2020-01-01T13:00:00%2B02:00")
+    assert [user["username"] for user in res.get_json()] == []
+
+
+def test_all_users_search_paginated(test_app, search_users):
+    client = test_app.test_client()
+    res = client.get("/users?q=a&sort=-username&limit=3")
+    data = res.get_json()
+
+    assert [user["username"] for user in data] == ["randy", "Leila", "kristian"]
+    assert "q=a" in res.headers["Link"]
+    assert "sort=-username" in res.headers["Link"]
+
+    cursor = res.headers["X-Next-Cursor"]
+    res_two = client.get(f"/users?q=a&sort=-username&limit=3&cursor={cursor}")
+
+    assert [user["username"] for user in res_two.get_json()] == ["100%"]
+    assert "X-Next-Cursor" not in res_two.headers
+
+
+@pytest.mark.parametrize(
+    "query", ["sort=password", "active=maybe", "created_from=yesterday"]
+)
+def test_all_users_search_invalid(test_app, test_database, query):
+    client = test_app.test_client()
+    res = client.get(f"/users?{query}")
+
+    assert res.status_code == 400
+
+
+def test_batch_lookup_ids(test_app, test_database, add_user):
+    leila = add_user("leila", "leila@batch.com", "testpassword")
+    randy = add_user("randy", "randy@batch.com", "testpassword")
+    client = test_app.test_client()
+    res = client.post(
+        "/users/batch",
+        data=json.dumps({"ids": [randy.id, 99999, leila.id, randy.id]}),
+        content_type="application/json",
+    )
+    data = json.loads(res.data.decode())
+
+    assert res.status_code == 200
+    assert [user["username"] for user in data["users"]] == ["randy", "leila", "randy"]
+    assert "password" not in data["users"][0]
+    assert data["missing"] == [99999]
+    assert 'desc="1 queries"' in res.headers["Server-Timing"]
+    assert "Set-Cookie" not in res.headers
+
+
+def test_batch_lookup_emails(test_app, test_database, add_user):
+    add_user("kristian", "kristian@batch.com", "testpassword")
+    client = test_app.test_client()
+    res = client.post(
+        "/users/batch",
+        data=json.dumps({"emails": ["nobody@batch.com", "Kristian@Batch.com"]}),
+        content_type="application/json",
+    )
+    data = json.loads(res.data.decode())
+
+    assert res.status_code == 200
+    assert [user["email"] for user in data["users"]] == ["kristian@batch.com"]
+    assert data["missing"] == ["nobody@batch.com"]
+
+
+@pytest.mark.parametrize(
+    "payload",
+    [
+        {},
+        {"ids": [1], "emails": ["a@b.com"]},
+        {"ids": ["one"]},
+        {"ids": list(range(6))},
+    ],
+)
+def test_batch_lookup_invalid(test_app, test_database, monkeypatch, payload):
+    monkeypatch.setitem(test_app.config, "USERS_LOOKUP_MAX_KEYS", 5)
+    client = test_app.test_client()
+    res = client.post(
+        "/users/batch", data=json.dumps(payload), content_type="application/json"
+    )
+
+    assert res.status_code == 400
+
+
+def test_bulk_import_csv(test_app, test_database, add_user):
+    test_database.session.query(User).delete()
+    add_user("taken", "taken@bulk.com", "testpassword")
+    body = "\n".join(
+        [
+            "username,email,password",
+            "one,one@bulk.com,testpassword",
+            "taken,TAKEN@bulk.com,testpassword",
+            "two,two@bulk.com,testpassword",
+            "again,one@bulk.com,testpassword",
+            "nopassword,nopassword@bulk.com,",
+        ]
+    )
+    client = test_app.test_client()
+    res = client.post("/users/bulk?batch_size=2", data=body, content_type="text/csv")
+    data = json.loads(res.data.decode())
+
+    assert res.status_code == 200
+    assert data["inserted"] == 2
+    assert [error["row"] for error in data["errors"]] == [3, 5, 6]
+    assert "Sorry. That email already exists." in data["errors"][0]["message"]
+    assert "Sorry. That email already exists." in data["errors"][1]["message"]
+    assert "Missing password." in data["errors"][2]["message"]
+
+    user = test_database.session.query(User).filter_by(email="two@bulk.com").one()
+    assert bcrypt.check_password_hash(user.password, "testpassword")
+
+
+def test_add_users_past_parameter_limit(test_app, test_database):
+    test_database.session.query(User).delete()
+    test_database.session.commit()
+    engine = test_database.engine
+    limit = MAX_PARAMETERS[engine.dialect.name]
+    defaults = {}
+
+    def lower_limit(dbapi_connection, connection_record, connection_proxy):
+        variables = sqlite3.SQLITE_LIMIT_VARIABLE_NUMBER
+        defaults.setdefault(dbapi_connection, dbapi_connection.getlimit(variables))
+        dbapi_connection.setlimit(variables, limit)
+
+    if engine.dialect.name == "sqlite" and hasattr(sqlite3.Connection, "setlimit"):
+        # every connection acts like a SQLite build before 3.32
+        limit = 999
+        event.listen(engine, "checkout", lower_limit)
+    # every row binds at least its three values, so one statement would not fit
+    rows = [
+        {"username": f"user{i}", "email": f"User{i}@limit.com", "password": "hash"}
+        for i in range(limit // 3 + 1)
+    ]
+    missing = [f"missing{i}@limit.com" for i in range(limit)]
+
+    try:
+        version = get_users_version()
+        inserted = add_users(rows)
+        existing = get_existing_emails([row["email"] for row in rows] + missing)
+        events = get_user_events(version, len(rows) + 1)
+        again = add_users(rows)
+    finally:
+        test_database.session.rollback()
+        if defaults:
+            event.remove(engine, "checkout", lower_limit)
+        for dbapi_connection, default in defaults.items():
+            dbapi_connection.setlimit(sqlite3.SQLITE_LIMIT_VARIABLE_NUMBER, default)
+
+    assert len(inserted) == len(rows)
+    assert existing == inserted
+    assert len(events) == len(rows)
+    assert again == set()
+
+
+def test_bulk_import_ndjson(test_app, test_database):
+    test_database.session.query(User).delete()
+    body = "\n".join(
+        [
+            json.dumps({"username": "a", "email": "a@bulk.com", "password": "pw"}),
+            "not json",
+            json.dumps({"username": "b", "email": "b@bulk.com", "password": "pw"}),
+        ]
+    )
+    client = test_app.test_client()
+    res = client.post("/users/bulk", data=body, content_type="application/x-ndjson")
+    data = json.loads(res.data.decode())
+
+    assert res.status_code == 200
+    assert data["inserted"] == 2
+    assert data["errors"] == [
+        {"row": 2, "email": None, "message": "Could not parse row."}
+    ]
+
+
+def test_bulk_import_bad_rows(test_app, test_database):
+    test_database.session.query(User).delete()
+    rows = [
+        {"username": "good", "email": "good@bulk.com", "password": "pw"},
+        {"username": "x" * 129, "email": "long@bulk.com", "password": "pw"},
+        {"username": "long", "email": "x" * 120 + "@bulk.com", "password": "pw"},
+        {"username": "bad", "email": "not-an-email", "password": "pw"},
+        {"username": "fine", "email": "fine@bulk.com", "password": "pw"},
+    ]
+    body = "\n".join(json.dumps(row) for row in rows)
+    client = test_app.test_client()
+    res = client.post("/users/bulk", data=body, content_type="application/x-ndjson")
+    data = json.loads(res.data.decode())
+
+    assert res.status_code == 200
+    assert data["inserted"] == 2
+    assert [error["row"] for error in data["errors"]] == [2, 3, 4]
+    assert "username is longer than 128" in data["errors"][0]["message"]
+    assert "email is longer than 128" in data["errors"][1]["message"]
+    assert data["errors"][2]["message"] == "Invalid email."
+
+
+def test_bulk_import_unsupported_type(test_app, test_database):
+    client = test_app.test_client()
+    res = client.post("/users/bulk", data="{}", content_type="application/json")
+
+    assert res.status_code == 415
+
+
 def test_remove_user(test_app, test_database, add_user):
     test_database.session.query(User).delete()
     user = add_user("remove user", "remove@user.com", "testpassword")
@@ -234,20 +620,91 @@ def test_update_user_invalid(
 
 
 def test_update_user_duplicate_email(test_app, test_database, add_user):
-    add_user("me", "me@user.com", "testpassword")
+    add_user("taken", "taken@user.com", "testpassword")
     user = add_user("other", "other@notuser.com", "testpassword")
     client = test_app.test_client()
     res = client.put(
         f"/users/{user.id}",
-        data=json.dumps({"username": "other", "email": "other@notuser.com"}),
+        data=json.dumps({"username": "other", "email": "taken@user.com"}),
         content_type="application/json",
     )
     data = json.loads(res.data.decode())
 
-    assert res.status_code == 400
+    assert res.status_code == 409
     assert "Sorry. That email already exists." in data["message"]
 
 
+def put_user(client, user_id, username, email, if_match=None):
+    headers = {"If-Match": if_match} if if_match else {}
+    return client.put(
+        f"/users/{user_id}",
+        data=json.dumps({"username": username, "email": email}),
+        content_type="application/json",
+        headers=headers,
+    )
+
+
+def test_update_user_if_match(test_app, test_database, add_user):
+    user = add_user("matched", "matched@user.com", "testpassword")
+    client = test_app.test_client()
+    etag = client.get(f"/users/{user.id}").headers["ETag"]
+
+    res = put_user(client, user.id, "matched", "matched@user.com", if_match=etag)
+
+    assert res.status_code == 200
+    assert res.headers["ETag"] != etag
+    assert res.headers["ETag"] == client.get(f"/users/{user.id}").headers["ETag"]
+
+
+def test_update_user_stale_if_match(test_app, test_database, add_user):
+    user = add_user("stale", "stale@user.com", "testpassword")
+    client = test_app.test_client()
+    etag = client.get(f"/users/{user.id}").headers["ETag"]
+    assert put_user(client, user.id, "first", "stale@user.com", etag).status_code == 200
+
+    res = put_user(client, user.id, "second", "stale@user.com", if_match=etag)
+
+    assert res.status_code == 412
+    assert client.get(f"/users/{user.id}").json["username"] == "first"
+
+
+@pytest.mark.parametrize(
+    "if_match, status_code",
+    [
+        ['"user-999999-1"', 412],
+        ['"users-1"', 412],
+        ["*", 412],
+        [None, 404],
+    ],
+)
+def test_update_missing_user_if_match(test_app, test_database, if_match, status_code):
+    client = test_app.test_client()
+    res = put_user(client, 999999, "me", "me@user.com", if_match=if_match)
+
+    assert res.status_code == status_code
+
+
+def test_update_user_in_one_statement(test_app, test_database, add_user):
+    user = add_user("single", "single@user.com", "testpassword")
+    client = test_app.test_client()
+    etag = client.get(f"/users/{user.id}").headers["ETag"]
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, many):
+        statements.append(statement)
+
+    event.listen(test_database.engine, "before_cursor_execute", capture)
+    try:
+        res = put_user(client, user.id, "single", "single@user.com", if_match=etag)
+    finally:
+        event.remove(test_database.engine, "before_cursor_execute", capture)
+
+    assert res.status_code == 200
+    # no read before the update; the rest is the version bump and outbox event
+    assert statements[0].startswith("UPDATE users")
+    assert not [statement for statement in statements if statement.startswith("SELECT")]
+
+
 def test_update_user_with_password(test_app, test_database, add_user):
     password_one = "testpassword"
     password_two = "testpassword2"
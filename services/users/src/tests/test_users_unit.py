@@ -4,18 +4,13 @@ from datetime import datetime
 import pytest
 
 import src.api.users.views
+from src.api.users.crud import DuplicateEmailError
 
 
 def test_add_user(test_app, monkeypatch):
-    def mock_get_user_by_email(email):
-        return None
-
     def mock_add_user(username, email, password):
         return True
 
-    monkeypatch.setattr(
-        src.api.users.views, "get_user_by_email", mock_get_user_by_email
-    )
     monkeypatch.setattr(src.api.users.views, "add_user", mock_add_user)
 
     client = test_app.test_client()
@@ -59,15 +54,9 @@ def test_add_user_invalid_json_keys(test_app, monkeypatch):
 
 
 def test_add_user_duplicate_email(test_app, monkeypatch):
-    def mock_get_user_by_email(email):
-        return True
-
     def mock_add_user(username, email, password):
-        return True
+        raise DuplicateEmailError()
 
-    monkeypatch.setattr(
-        src.api.users.views, "get_user_by_email", mock_get_user_by_email
-    )
     monkeypatch.setattr(src.api.users.views, "add_user", mock_add_user)
 
     client = test_app.test_client()
@@ -85,15 +74,25 @@ def test_add_user_duplicate_email(test_app, monkeypatch):
 
 
 def test_single_user(test_app, monkeypatch):
-    def mock_get_user_by_id(user_id):
-        return {
-            "id": 1,
-            "username": "randy",
-            "email": "randy@arnis.com",
-            "created_date": datetime.now(),
-        }
+    class AttrDict(dict):
+        def __init__(self, *args, **kwargs):
+            super(AttrDict, self).__init__(*args, **kwargs)
+            self.__dict__ = self
 
-    monkeypatch.setattr(src.api.users.views, "get_user_by_id", mock_get_user_by_id)
+    def mock_get_user_row_by_id(user_id):
+        return AttrDict(
+            {
+                "id": 1,
+                "username": "randy",
+                "email": "randy@arnis.com",
+                "created_date": datetime.now(),
+                "version": 1,
+            }
+        )
+
+    monkeypatch.setattr(
+        src.api.users.views, "get_user_row_by_id", mock_get_user_row_by_id
+    )
 
     client = test_app.test_client()
     res = client.get("/users/1")
@@ -106,10 +105,12 @@ def test_single_user(test_app, monkeypatch):
 
 
 def test_single_user_incorrect_id(test_app, monkeypatch):
-    def mock_get_user_by_id(user_id):
+    def mock_get_user_row_by_id(user_id):
         return None
 
-    monkeypatch.setattr(src.api.users.views, "get_user_by_id", mock_get_user_by_id)
+    monkeypatch.setattr(
+        src.api.users.views, "get_user_row_by_id", mock_get_user_row_by_id
+    )
 
     client = test_app.test_client()
     res = client.get("/users/999")
@@ -137,6 +138,7 @@ def test_all_users(test_app, monkeypatch):
         ]
 
     monkeypatch.setattr(src.api.users.views, "get_all_users", mock_get_all_users)
+    monkeypatch.setattr(src.api.users.views, "get_users_version", lambda: 0)
 
     client = test_app.test_client()
     res = client.get("/users")
@@ -158,15 +160,11 @@ def test_remove_user(test_app, monkeypatch):
             super(AttrDict, self).__init__(*args, **kwargs)
             self.__dict__ = self
 
-    def mock_get_user_by_id(user_id):
+    def mock_delete_user(user_id):
         d = AttrDict()
         d.update({"id": 1, "username": "remove user", "email": "remove@user.com"})
         return d
 
-    def mock_delete_user(user):
-        return None
-
-    monkeypatch.setattr(src.api.users.views, "get_user_by_id", mock_get_user_by_id)
     monkeypatch.setattr(src.api.users.views, "delete_user", mock_delete_user)
 
     client = test_app.test_client()
@@ -178,10 +176,10 @@ def test_remove_user(test_app, monkeypatch):
 
 
 def test_remove_user_incorrect_id(test_app, monkeypatch):
-    def mock_get_user_by_id(user_id):
+    def mock_delete_user(user_id):
         return None
 
-    monkeypatch.setattr(src.api.users.views, "get_user_by_id", mock_get_user_by_id)
+    monkeypatch.setattr(src.api.users.views, "delete_user", mock_delete_user)
 
     client = test_app.test_client()
     res = client.delete("/users/999")
@@ -197,22 +195,18 @@ def test_update_user(test_app, monkeypatch):
             super(AttrDict, self).__init__(*args, **kwargs)
             self.__dict__ = self
 
-    def mock_get_user_by_id(user_id):
+    def mock_get_user_row_by_id(user_id):
         d = AttrDict()
-        d.update({"id": 1, "username": "me", "email": "me@user.com"})
+        d.update({"id": 1, "username": "me", "email": "me@user.com", "version": 2})
         return d
 
-    def mock_update_user(user, username, email):
-        return True
+    def mock_update_user_row(user_id, username, email, versions):
+        return mock_get_user_row_by_id(user_id)
 
-    def mock_get_user_by_email(email):
-        return None
-
-    monkeypatch.setattr(src.api.users.views, "get_user_by_id", mock_get_user_by_id)
     monkeypatch.setattr(
-        src.api.users.views, "get_user_by_email", mock_get_user_by_email
+        src.api.users.views, "get_user_row_by_id", mock_get_user_row_by_id
     )
-    monkeypatch.setattr(src.api.users.views, "update_user", mock_update_user)
+    monkeypatch.setattr(src.api.users.views, "update_user_row", mock_update_user_row)
 
     client = test_app.test_client()
     res = client.put(
@@ -224,6 +218,7 @@ def test_update_user(test_app, monkeypatch):
 
     assert res.status_code == 200
     assert "1 was updated!" in data["message"]
+    assert res.headers["ETag"] == '"user-1-2"'
 
     res_two = client.get("/users/1")
     data = json.loads(res_two.data.decode())
@@ -249,10 +244,10 @@ def test_update_user(test_app, monkeypatch):
 def test_update_user_invalid(
     test_app, monkeypatch, user_id, payload, status_code, message
 ):
-    def mock_get_user_by_id(user_id):
+    def mock_update_user_row(user_id, username, email, versions):
         return None
 
-    monkeypatch.setattr(src.api.users.views, "get_user_by_id", mock_get_user_by_id)
+    monkeypatch.setattr(src.api.users.views, "update_user_row", mock_update_user_row)
 
     client = test_app.test_client()
     res = client.put(
@@ -265,27 +260,10 @@ def test_update_user_invalid(
 
 
 def test_update_user_duplicate_email(test_app, monkeypatch):
-    class AttrDict(dict):
-        def __init__(self, *args, **kwargs):
-            super(AttrDict, self).__init__(*args, **kwargs)
-            self.__dict__ = self
+    def mock_update_user_row(user_id, username, email, versions):
+        raise DuplicateEmailError()
 
-    def mock_get_user_by_id(user_id):
-        d = AttrDict()
-        d.update({"id": 1, "username": "me", "email": "me@user.com"})
-        return d
-
-    def mock_update_user(user, username, email):
-        return True
-
-    def mock_get_user_by_email(email):
-        return True
-
-    monkeypatch.setattr(src.api.users.views, "get_user_by_id", mock_get_user_by_id)
-    monkeypatch.setattr(
-        src.api.users.views, "get_user_by_email", mock_get_user_by_email
-    )
-    monkeypatch.setattr(src.api.users.views, "update_user", mock_update_user)
+    monkeypatch.setattr(src.api.users.views, "update_user_row", mock_update_user_row)
 
     client = test_app.test_client()
     res = client.put(
@@ -295,5 +273,5 @@ def test_update_user_duplicate_email(test_app, monkeypatch):
     )
     data = json.loads(res.data.decode())
 
-    assert res.status_code == 400
+    assert res.status_code == 409
     assert "Sorry. That email already exists." in data["message"]
@@ -1,5 +1,8 @@
 import os
 
+from src.config import engine_options
+from src.pool import InstrumentedQueuePool
+
 
 def test_development_config(test_app):
     test_app.config.from_object("src.config.DevelopmentConfig")
@@ -32,3 +35,28 @@ def test_production_config(test_app):
     assert test_app.config["BCRYPT_LOG_ROUNDS"] == 13
     assert test_app.config["ACCESS_TOKEN_EXPIRATION"] == 900
     assert test_app.config["REFRESH_TOKEN_EXPIRATION"] == 2592000
+    options = test_app.config["SQLALCHEMY_ENGINE_OPTIONS"]
+    assert options["poolclass"] is InstrumentedQueuePool
+    assert options["pool_pre_ping"]
+    assert options["pool_size"] == int(os.getenv("DB_POOL_SIZE", 5))
+
+
+def test_engine_options_from_env(monkeypatch):
+    monkeypatch.setenv("DB_POOL_SIZE", "20")
+    monkeypatch.setenv("DB_MAX_OVERFLOW", "0")
+    monkeypatch.setenv("DB_POOL_PRE_PING", "false")
+    monkeypatch.setenv("DB_STATEMENT_TIMEOUT_MS", "5000")
+    options = engine_options("postgresql://postgres@db/api_prod")
+
+    assert options["pool_size"] == 20
+    assert options["max_overflow"] == 0
+    assert not options["pool_pre_ping"]
+    assert options["connect_args"]["options"] == "-c statement_timeout=5000"
+
+
+def test_engine_options_pgbouncer(monkeypatch):
+    monkeypatch.setenv("DB_PGBOUNCER", "true")
+    options = engine_options("postgresql+psycopg://postgres@db/api_prod")
+
+    assert "options" not in options["connect_args"]
+    assert options["connect_args"]["prepare_threshold"] is None
@@ -0,0 +1,46 @@
+from sqlalchemy import create_engine, text
+
+from src import pool
+from src.pool import InstrumentedQueuePool, dispose_after_fork, pool_stats
+
+
+def test_pool_stats(tmp_path):
+    engine = create_engine(
+        f"sqlite:///{tmp_path}/pool.db",
+        poolclass=InstrumentedQueuePool,
+        pool_size=2,
+        max_overflow=1,
+    )
+    with engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+        stats = pool_stats(engine)
+
+        assert stats["checked_out"] == 1
+        assert stats["size"] == 2
+        assert stats["max_overflow"] == 1
+
+    stats = pool_stats(engine)
+    assert stats["checked_out"] == 0
+    assert stats["wait_count"] == 1
+    assert stats["wait_seconds_sum"] >= 0
+    assert stats["timeouts"] == 0
+
+
+def test_dispose_after_fork(tmp_path):
+    engine = create_engine(
+        f"sqlite:///{tmp_path}/pool.db", poolclass=InstrumentedQueuePool
+    )
+    dispose_after_fork(engine)
+    with engine.connect() as conn:
+        inherited = conn.connection.dbapi_connection
+    parent_pool = engine.pool
+
+    # what a forked child runs
+    pool._dispose_engines()
+
+    assert engine.pool is not parent_pool
+    assert isinstance(engine.pool, InstrumentedQueuePool)
+    # the parent's connection is left open for the parent
+    assert inherited.execute("SELECT 1").fetchone() == (1,)
+    with engine.connect() as conn:
+        assert conn.connection.dbapi_connection is not inherited
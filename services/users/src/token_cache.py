@@ -0,0 +1,78 @@
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app
+
+
+class TokenCache:
+    """In-process LRU+TTL cache of verified access tokens.
+
+    Maps a raw token to a projection of the user it identifies. An entry never
+    outlives the token's own ``exp`` nor TOKEN_CACHE_TTL, and every entry for a
+    user is dropped when that user is updated or deleted. Invalidation is local
+    to the worker process; TOKEN_CACHE_TTL bounds staleness in the others.
+    Revocations are not left to the TTL: /auth/status checks the cached
+    token's family against the shared revocation list on every hit.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._tokens_by_user = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, token):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None or entry[0] <= now:
+                if entry is not None:
+                    self._evict(token)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(token)
+            self.hits += 1
+            return entry[2]
+
+    def set(self, token, user, exp):
+        ttl = current_app.config.get("TOKEN_CACHE_TTL")
+        maxsize = current_app.config.get("TOKEN_CACHE_SIZE")
+        if ttl <= 0 or maxsize <= 0:
+            return
+
+        expires_at = min(time.time() + ttl, exp)
+        with self._lock:
+            if token in self._entries:
+                self._evict(token)
+            self._entries[token] = (expires_at, user["id"], user)
+            self._tokens_by_user.setdefault(user["id"], set()).add(token)
+            while len(self._entries) > maxsize:
+                self._evict(next(iter(self._entries)))
+
+    def invalidate_user(self, user_id):
+        with self._lock:
+            for token in self._tokens_by_user.pop(user_id, ()):
+                self._entries.pop(token, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._tokens_by_user.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+    def _evict(self, token):
+        _, user_id, _ = self._entries.pop(token)
+        tokens = self._tokens_by_user.get(user_id)
+        if tokens is not None:
+            tokens.discard(token)
+            if not tokens:
+                del self._tokens_by_user[user_id]
@@ -0,0 +1,68 @@
+import json
+import threading
+import time
+import urllib.request
+
+import jwt
+
+
+class TokenVerifier:
+    """Validates users-service access tokens locally from its JWKS.
+
+    Meant for other services: keys are fetched from ``jwks_url``, parsed once
+    and cached by ``kid`` for ``lifespan`` seconds, so a verification is one
+    signature check with no network hop. An unknown ``kid`` (a freshly rotated
+    key) triggers a refetch, at most once per ``min_refresh_interval``.
+
+    Local verification cannot see revocations; an access token stays valid
+    until it expires, which ACCESS_TOKEN_EXPIRATION bounds.
+    """
+
+    def __init__(self, jwks_url, lifespan=300, min_refresh_interval=30, timeout=5):
+        self.jwks_url = jwks_url
+        self.lifespan = lifespan
+        self.min_refresh_interval = min_refresh_interval
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._keys = {}
+        self._fetched = None
+
+    def verify(self, token):
+        """Returns the payload of a valid access token or raises
+        jwt.InvalidTokenError."""
+        kid = jwt.get_unverified_header(token).get("kid")
+        algorithm, key = self._get_key(kid)
+        payload = jwt.decode(
+            token, key, algorithms=[algorithm], options={"require": ["exp", "sub"]}
+        )
+        if payload.get("typ") != "access":
+            raise jwt.InvalidTokenError("Not an access token")
+        return payload
+
+    def fetch(self):
+        with urllib.request.urlopen(self.jwks_url, timeout=self.timeout) as res:
+            return json.load(res)
+
+    def _get_key(self, kid):
+        now = time.monotonic()
+        expired = self._fetched is None or now - self._fetched >= self.lifespan
+        if expired or (
+            kid not in self._keys and now - self._fetched >= self.min_refresh_interval
+        ):
+            self._refresh(now)
+        key = self._keys.get(kid)
+        if key is None:
+            raise jwt.InvalidTokenError("Unknown signing key")
+        return key
+
+    def _refresh(self, now):
+        with self._lock:
+            if self._fetched is not None and self._fetched > now:
+                # another thread refreshed while this one waited
+                return
+            keys = {}
+            for jwk in self.fetch().get("keys", []):
+                if jwk.get("use", "sig") == "sig" and "kid" in jwk:
+                    keys[jwk["kid"]] = (jwk["alg"], jwt.PyJWK(jwk).key)
+            self._keys = keys
+            self._fetched = time.monotonic()
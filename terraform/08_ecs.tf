@@ -13,13 +13,14 @@ data "template_file" "client-app" {
 
 data "template_file" "users-app" {
     template = file("templates/users_app.json.tpl")
-    depends_on               = [aws_db_instance.production]
+    depends_on               = [aws_db_instance.production, aws_db_instance.replica]
 
     vars = {
         docker_image_url_users = var.docker_image_url_users
         region                 = var.region
         secret_key             = var.secret_key
         database_url           = "postgres://webapp:${var.rds_password}@${aws_db_instance.production.endpoint}/api_prod"
+        database_replica_urls  = join(",", [for replica in aws_db_instance.replica : "postgres://webapp:${var.rds_password}@${replica.endpoint}/api_prod"])
     }
 }
 
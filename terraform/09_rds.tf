@@ -21,4 +21,18 @@ resource "aws_db_instance" "production" {
     publicly_accessible     = false
     backup_retention_period = 7
     skip_final_snapshot     = true
-}
\ No newline at end of file
+}
+
+resource "aws_db_instance" "replica" {
+    count                   = var.rds_read_replicas
+    identifier              = "production-replica-${count.index}"
+    replicate_source_db     = aws_db_instance.production.identifier
+    instance_class          = var.rds_instance_class
+    storage_encrypted       = false
+    vpc_security_group_ids  = [aws_security_group.rds.id]
+    multi_az                = false
+    storage_type            = "gp2"
+    publicly_accessible     = false
+    backup_retention_period = 0
+    skip_final_snapshot     = true
+}
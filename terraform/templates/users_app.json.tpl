@@ -39,6 +39,10 @@
       {
         "name": "DATABASE_URL",
         "value": "${database_url}"
+      },
+      {
+        "name": "DATABASE_REPLICA_URLS",
+        "value": "${database_replica_urls}"
       }
     ],
     "logConfiguration": {
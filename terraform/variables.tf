@@ -38,7 +38,7 @@ variable "health_check_path_client" {
 }
 variable "health_check_path_users" {
     description = "Health check path for the default target group"
-    default     = "/ping"
+    default     = "/ping/ready"
 }
 
 # ecs
@@ -92,4 +92,8 @@ variable "rds_password" {
 variable "rds_instance_class" {
     description = "RDS instance type"
     default     = "db.t2.micro"
-}
\ No newline at end of file
+}
+variable "rds_read_replicas" {
+    description = "Number of RDS read replicas serving GET requests"
+    default     = 0
+}